@@ -0,0 +1,150 @@
+"""
+Compare CPU cost of the download loop before and after the buffered writer.
+
+Serves a generated file from a separate server process so that only the client is measured, then
+downloads it with the old loop (1 KiB iter_content, write on the reading thread) and with
+ntu_learn_downloader_gui.api.download over a single connection. MB/s per core is megabytes divided
+by CPU seconds used by this process, i.e. the throughput a single fully busy core could sustain.
+
+The segmented row is not part of the comparison: it downloads the same file in DEFAULT_SEGMENTS
+byte ranges at once, which needs the Range support that the server adds to http.server.
+
+usage (from src/main/python):
+    python -m benchmarks.download_throughput [size in MiB] [runs]
+"""
+import functools
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from ntu_learn_downloader_gui.api import DEFAULT_SEGMENTS, DOWNLOAD_HEADERS, download
+from ntu_learn_downloader_gui.session import SessionManager
+
+
+def get_free_port() -> int:
+    s = socket.socket(socket.AF_INET, type=socket.SOCK_STREAM)
+    s.bind(("localhost", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """http.server ignores Range, this one serves a single byte range of a file"""
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        range_header = self.headers.get("Range")
+        if not range_header or not os.path.isfile(path):
+            return super().do_GET()
+        size = os.path.getsize(path)
+        first, _sep, last = range_header.split("=", 1)[1].partition("-")
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(size))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, size))
+        self.send_header("Content-Length", str(end + 1 - start))
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end + 1 - start
+            while remaining:
+                chunk = f.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, directory: str):
+    handler = functools.partial(RangeRequestHandler, directory=directory)
+    ThreadingHTTPServer(("127.0.0.1", port), handler).serve_forever()
+
+
+def legacy_download(session: SessionManager, url: str, destination: str):
+    """the loop used by ntu_learn_downloader.utils.download"""
+    with session.get(url, stream=True, headers=DOWNLOAD_HEADERS) as response:
+        total_length = int(response.headers["content-length"])
+        dl = 0
+        with open(destination, "wb") as f:
+            for data in response.iter_content(chunk_size=1024):
+                dl += len(data)
+                f.write(data)
+                (lambda bytes_downloaded, total: None)(dl, total_length)
+
+
+def measure(fn, size_mb: float):
+    wall, cpu = time.perf_counter(), time.process_time()
+    fn()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return size_mb / wall, size_mb / cpu
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve(int(sys.argv[2]), sys.argv[3])
+        return
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with tempfile.TemporaryDirectory() as serve_dir, tempfile.TemporaryDirectory() as out_dir:
+        with open(os.path.join(serve_dir, "lecture.mp4"), "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        port = get_free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", __spec__.name, "--serve", str(port), serve_dir],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        time.sleep(1)
+        url = "http://127.0.0.1:{}/lecture.mp4".format(port)
+        session = SessionManager("PLACEHOLDER")
+        try:
+            rows = [
+                ("before", legacy_download),
+                # a single connection, like the loop it replaces
+                ("after", functools.partial(download, segments=1)),
+                (
+                    "segmented ({} connections)".format(DEFAULT_SEGMENTS),
+                    functools.partial(download, segments=DEFAULT_SEGMENTS),
+                ),
+            ]
+            for row, (name, fn) in enumerate(rows):
+                results = []
+                for run in range(runs):
+                    destination = os.path.join(out_dir, "{}_{}.mp4".format(row, run))
+                    results.append(
+                        measure(lambda: fn(session, url, destination), size_mb)
+                    )
+                    os.remove(destination)
+                wall = max(r[0] for r in results)
+                per_core = max(r[1] for r in results)
+                print(
+                    "{:<26} {:8.1f} MB/s wall {:8.1f} MB/s per core".format(
+                        name, wall, per_core
+                    )
+                )
+        finally:
+            session.close()
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
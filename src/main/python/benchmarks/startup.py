@@ -0,0 +1,117 @@
+"""
+Measure cold start of the GUI: time to import the startup modules and time until the login window
+first paints, each in a fresh interpreter. Runs with layouts compiled by
+ntu_learn_downloader_gui.gui.resources if they are present, and with uic.loadUi, and lists the heavy
+modules that were already imported at the first paint.
+
+usage (from src/main/python):
+    python -m benchmarks.startup [runs]
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+START = time.perf_counter()
+
+# should not be needed before the login window is shown
+HEAVY_MODULES = ("requests", "bs4", "lxml", "ntu_learn_downloader", "PyQt5.uic", "PyQt5.QtTest")
+FIRST_PAINT_TIMEOUT_MS = 10000
+
+
+class BlockCompiledLayouts:
+    """meta path finder that hides the compiled layouts so that load_layout uses uic.loadUi"""
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname.startswith("ntu_learn_downloader_gui.gui.compiled"):
+            raise ImportError(fullname)
+        return None
+
+
+def child(use_compiled: bool):
+    if not use_compiled:
+        sys.meta_path.insert(0, BlockCompiledLayouts())
+
+    from fbs_runtime.application_context.PyQt5 import ApplicationContext
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+
+    from ntu_learn_downloader_gui.gui.login_dialog import LoginDialog
+
+    imported = time.perf_counter()
+    appctxt = ApplicationContext()
+    # do not hit the release server
+    appctxt.build_settings["test_mode"] = True
+    result = {}
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and "first_paint_s" not in result:
+                result["first_paint_s"] = time.perf_counter() - START
+                result["heavy_modules"] = [name for name in HEAVY_MODULES if name in sys.modules]
+                QTimer.singleShot(0, appctxt.app.quit)
+            return False
+
+    first_paint = FirstPaint()
+    appctxt.app.installEventFilter(first_paint)
+    QTimer.singleShot(FIRST_PAINT_TIMEOUT_MS, appctxt.app.quit)
+    window = LoginDialog(appctxt)
+    appctxt.app.exec_()
+    window.threadPool.waitForDone()
+
+    result["import_s"] = imported - START
+    print(json.dumps(result))
+
+
+def run_child(use_compiled: bool) -> dict:
+    args = [sys.executable, "-m", "benchmarks.startup", "--child"]
+    if not use_compiled:
+        args.append("--no-compiled")
+    start = time.perf_counter()
+    output = subprocess.run(
+        args, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    ).stdout
+    wall = time.perf_counter() - start
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result["process_s"] = wall
+    return result
+
+
+def main():
+    from ntu_learn_downloader_gui.gui.resources import COMPILED_DIR
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    variants = [("uic.loadUi", False)]
+    if os.path.isdir(COMPILED_DIR):
+        variants.insert(0, ("compiled layouts", True))
+    else:
+        print("layouts are not compiled, run python -m ntu_learn_downloader_gui.gui.resources")
+
+    for name, use_compiled in variants:
+        results = [run_child(use_compiled) for _ in range(runs)]
+        best = {
+            key: min(r[key] for r in results)
+            for key in ("import_s", "first_paint_s", "process_s")
+        }
+        print(
+            "{:>16}: imports {:.0f} ms, first paint {:.0f} ms, process start to exit {:.0f} ms "
+            "(best of {})".format(
+                name,
+                best["import_s"] * 1000,
+                best["first_paint_s"] * 1000,
+                best["process_s"] * 1000,
+                runs,
+            )
+        )
+        print(
+            "{:>16}  loaded before first paint: {}".format(
+                "", ", ".join(results[-1]["heavy_modules"]) or "none"
+            )
+        )
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child(use_compiled="--no-compiled" not in sys.argv)
+    else:
+        main()
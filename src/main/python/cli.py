@@ -0,0 +1,6 @@
+import sys
+
+from ntu_learn_downloader_gui.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,8 @@ import traceback
 
 from PyQt5.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
 
+from ntu_learn_downloader_gui.progress import ProgressAggregator
+
 
 class WorkerSignals(QObject):
     """
@@ -24,7 +26,8 @@ class WorkerSignals(QObject):
         `object` data returned from processing, anything
 
     progress
-        `tuple` containing data needed to display progress
+        `tuple` containing data needed to display progress, a `ProgressSnapshot` if the worker
+        was created with progress_interval
 
     """
 
@@ -45,10 +48,14 @@ class Worker(QRunnable):
     :type callback: function
     :param args: Arguments to pass to the callback function
     :param kwargs: Keywords to pass to the callback function
+    :param progress_interval: If given, progress_callback is a `ProgressAggregator` that publishes
+                              coalesced snapshots at most once every progress_interval seconds
+                              instead of the raw progress signal
+    :type progress_interval: float
 
     """
 
-    def __init__(self, fn, *args, **kwargs):
+    def __init__(self, fn, *args, progress_interval=None, **kwargs):
         super(Worker, self).__init__()
 
         # Store constructor arguments (re-used for processing)
@@ -58,7 +65,14 @@ class Worker(QRunnable):
         self.signals = WorkerSignals()
 
         # Add the callback to our kwargs
-        self.kwargs["progress_callback"] = self.signals.progress
+        self.aggregator = None
+        if progress_interval is None:
+            self.kwargs["progress_callback"] = self.signals.progress
+        else:
+            self.aggregator = ProgressAggregator(
+                self.signals.progress.emit, progress_interval
+            )
+            self.kwargs["progress_callback"] = self.aggregator
 
     @pyqtSlot()
     def run(self):
@@ -72,8 +86,16 @@ class Worker(QRunnable):
         except:
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
+            self.flush_progress()
             self.signals.error.emit((exctype, value, traceback.format_exc()))
         else:
+            self.flush_progress()
             self.signals.result.emit(result)  # Return the result of the processing
         finally:
             self.signals.finished.emit()  # Done
+
+    def flush_progress(self):
+        """deliver pending progress before the result so that no progress arrives after it
+        """
+        if self.aggregator is not None:
+            self.aggregator.flush()
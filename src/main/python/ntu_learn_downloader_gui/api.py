@@ -0,0 +1,635 @@
+"""
+Versions of the ntu_learn_downloader API calls that go through a shared SessionManager instead of
+opening new connections for every request
+"""
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import bs4
+from bs4 import BeautifulSoup
+import requests
+import urllib3
+
+from ntu_learn_downloader.constants import (
+    GET_CONTENT_IDS_URL,
+    GET_CONTENT_LIST_URL,
+    GET_COURSES_URL,
+    NTULEARN_URL,
+)
+from ntu_learn_downloader.parsing import parse_recorded_lecture_contents
+from ntu_learn_downloader.utils import get_content_id_from_listContent_url
+
+from ntu_learn_downloader_gui import bandwidth
+from ntu_learn_downloader_gui.bandwidth import BandwidthLimiter
+from ntu_learn_downloader_gui.metrics import metrics
+from ntu_learn_downloader_gui.session import SessionManager
+from ntu_learn_downloader_gui.writer import (
+    MAX_CHUNK_SIZE,
+    MIN_CHUNK_SIZE,
+    FileWriter,
+    preallocate,
+    read_committed_offset,
+    write_committed_offset,
+)
+
+XHR_HEADERS = {
+    "Connection": "keep-alive",
+    "Accept": "text/javascript, text/html, application/xml, text/xml, */*",
+    "X-Prototype-Version": "1.7",
+    "X-Requested-With": "XMLHttpRequest",
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/81.0.4044.113 Safari/537.36",
+    "Sec-Fetch-Site": "same-origin",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Dest": "empty",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+COURSES_PARAMS = (
+    ("cmd", "view"),
+    ("serviceLevel", "blackboard.data.course.Course$ServiceLevel:FULL"),
+)
+
+PART_FILE_SUFFIX = ".part"
+# next to preallocated part files, holds the number of bytes downloaded so far
+COMMITTED_FILE_SUFFIX = ".committed"
+# next to part files downloaded in segments, holds the byte range of every segment. The committed
+# offset of segment i is kept in {part file}.segments.{i}
+SEGMENTS_FILE_SUFFIX = ".segments"
+
+# files at least this large are fetched over several connections if the server accepts byte ranges
+SEGMENTED_MIN_SIZE = 16 * 1024 * 1024
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+DEFAULT_SEGMENTS = 4
+
+DOWNLOAD_HEADERS = {
+    "Connection": "keep-alive",
+    "Pragma": "no-cache",
+    "Cache-Control": "no-cache",
+    "Upgrade-Insecure-Requests": "1",
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/81.0.4044.138 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Dest": "document",
+    "Accept-Language": "en-SG,en-GB;q=0.9,en-US;q=0.8,en;q=0.7",
+    # byte ranges and Content-Length only line up with the file for unencoded responses
+    "Accept-Encoding": "identity",
+}
+
+
+def make_GET_request(
+    session: SessionManager,
+    path: str,
+    params=None,
+    headers: Optional[Dict[str, str]] = None,
+    endpoint: str = "other",
+) -> requests.Response:
+    """GET path with XHR_HEADERS, the latency is recorded under endpoint"""
+    with metrics.timer("request_seconds", endpoint=endpoint):
+        return session.get(path, headers=dict(XHR_HEADERS, **(headers or {})), params=params)
+
+
+def get_courses(session: SessionManager) -> List[Tuple[str, str]]:
+    """Return list of courses that user is currently reading
+
+    Args:
+        session (SessionManager): authenticated session
+
+    Returns:
+        List[Tuple[str, str]]: list of tuples (course name, course_id)
+    """
+    response = make_GET_request(session, GET_COURSES_URL, COURSES_PARAMS, endpoint="courses")
+
+    soup = BeautifulSoup(response.content, features="lxml")
+    courses: List[Tuple[str, str]] = []
+    for link in soup.find_all("a"):
+        name = link.contents[0]
+        if isinstance(name, bs4.element.Tag):
+            name = name.text
+        # expect onclick to be of form:
+        # javascript:globalNavMenu.goToUrl('/webapps/blackboard/execute/launcher?type=Course&id=_302242_1&url='); return false;
+        fullLink = link.get("onclick")
+        matches = re.search(r"type=Course&id=_(\S+)&url=", fullLink or "")
+        if matches is None:
+            print("Unable to parse link to get course id: {}".format(fullLink))
+            continue
+        courses.append((name, matches.groups()[0]))
+    return courses
+
+
+def check_authenticated(session: SessionManager) -> bool:
+    """whether NTU Learn accepts the token of session, one request without following redirects.
+    Requests with an expired token are redirected to the login page
+    """
+    with metrics.timer("request_seconds", endpoint="auth_probe"):
+        response = session.get(
+            GET_COURSES_URL, headers=XHR_HEADERS, params=COURSES_PARAMS, allow_redirects=False
+        )
+    return response.status_code == 200
+
+
+def get_content_ids(session: SessionManager, course_id: str) -> List[Tuple[str, str]]:
+    """returns list of tuples of content name and content ids associated to the course_id
+
+    Args:
+        session (SessionManager): authenticated session
+        course_id (str): course id
+
+    Returns:
+        List[Tuple[str, str]]: list of tuple (content name, content_id)
+    """
+    params = (
+        ("method", "search"),
+        ("context", "course_entry"),
+        ("course_id", course_id),
+    )
+    response = make_GET_request(session, GET_CONTENT_IDS_URL, params, endpoint="content_ids")
+
+    soup = BeautifulSoup(response.content.decode(), features="lxml")
+    ll = soup.find("ul", {"id": "courseMenuPalette_contents"})
+    result: List[Tuple[str, str]] = []
+    for c in ll:
+        a = c.find("a")
+        if a is None or a == -1:
+            continue
+        content_id = get_content_id_from_listContent_url(a.get("href"))
+        if content_id:
+            result.append((a.text, content_id))
+    return result
+
+
+def get_contents_page(
+    session: SessionManager,
+    course_id: str,
+    content_id: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> requests.Response:
+    """GET a listContent page, headers are added to XHR_HEADERS, e.g. for conditional requests"""
+    params = (("course_id", course_id), ("content_id", content_id))
+    return make_GET_request(
+        session, GET_CONTENT_LIST_URL, params, headers, endpoint="content_page"
+    )
+
+
+def make_get_contents_request(
+    session: SessionManager, course_id: str, content_id: str
+) -> BeautifulSoup:
+    response = get_contents_page(session, course_id, content_id)
+    return BeautifulSoup(response.content.decode(), features="lxml")
+
+
+def get_file_download_link(session: SessionManager, link: str) -> str:
+    """Get the actual download link (contains file name in url). The redirect chain is followed on
+    a pooled connection that the following download can reuse
+
+    Args:
+        session (SessionManager): authenticated session
+        link (str): predownload link
+
+    Returns:
+        str: file download link
+    """
+    with metrics.timer("request_seconds", endpoint="file_link"):
+        return session.head(link, allow_redirects=True).url
+
+
+def get_recorded_lecture_download_link(session: SessionManager, predownload_link: str) -> str:
+    """get actual mp4 download link from link to AcuStudio
+
+    Args:
+        session (SessionManager): authenticated session
+        predownload_link (str): link to AcuStudio
+
+    Returns:
+        str: download link to mp4
+    """
+    response = make_GET_request(session, NTULEARN_URL + predownload_link, endpoint="lecture_page")
+    return parse_recorded_lecture_contents(response.content.decode())
+
+
+def get_content_length(session: SessionManager, url: str) -> Optional[int]:
+    """size in bytes of the file at url from a HEAD request, None if the server does not tell
+
+    Args:
+        session (SessionManager): authenticated session
+        url (str): download link
+
+    Returns:
+        Optional[int]: Content-Length of the file
+    """
+    with metrics.timer("request_seconds", endpoint="size_probe"):
+        response = session.head(url, allow_redirects=True, headers=DOWNLOAD_HEADERS)
+    content_length = response.headers.get("content-length")
+    if not response.ok or content_length is None or not content_length.isdigit():
+        return None
+    return int(content_length)
+
+
+class IncompleteDownloadError(Exception):
+    """raised when a transfer ends before Content-Length bytes were received, the partial file is
+    kept so that the next attempt can resume it
+    """
+
+
+class FileChangedError(IncompleteDownloadError):
+    """raised when the server no longer serves the byte ranges of a file that is downloaded in
+    segments, e.g. because the file changed size, the partial file is discarded
+    """
+
+
+def get_part_file_path(destination: str) -> str:
+    return destination + PART_FILE_SUFFIX
+
+
+def parse_content_range(content_range: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """parse Content-Range header of the form "bytes {start}-{end}/{total}" or "bytes */{total}"
+
+    Returns:
+        Tuple[Optional[int], Optional[int]]: start offset and total size, None if not available
+    """
+    m = re.match(r"bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)", content_range or "")
+    if m is None:
+        return None, None
+    start, total = m.groups()
+    return (
+        int(start) if start is not None else None,
+        int(total) if total != "*" else None,
+    )
+
+
+def get_resume_offset(part_file_path: str) -> int:
+    """returns how many bytes at the start of part_file_path hold downloaded data. Preallocated part
+    files are larger than that, their progress is kept in the committed file next to them
+    """
+    if not os.path.isfile(part_file_path):
+        return 0
+    size = os.path.getsize(part_file_path)
+    committed = read_committed_offset(part_file_path + COMMITTED_FILE_SUFFIX)
+    return size if committed is None else min(committed, size)
+
+
+def stream_into(
+    response: requests.Response,
+    writer: FileWriter,
+    on_read: Callable[[int], None],
+    limiter: Optional[BandwidthLimiter] = None,
+    limit: Optional[int] = None,
+) -> int:
+    """read the body of response, or its first limit bytes, into buffers of writer. Reads grow from
+    MIN_CHUNK_SIZE to MAX_CHUNK_SIZE while the socket keeps filling them, on_read is called with the
+    size of every read. With a limiter every read is paid for with its tokens
+
+    Raises:
+        IncompleteDownloadError: the connection was lost
+
+    Returns:
+        int: number of bytes received
+    """
+    received = 0
+    chunk_size = MIN_CHUNK_SIZE
+    try:
+        while limit is None or received < limit:
+            buf = writer.get_buffer()
+            read_size = limiter.chunk_size(chunk_size) if limiter else chunk_size
+            if limit is not None:
+                read_size = min(read_size, limit - received)
+            try:
+                n = response.raw.readinto(memoryview(buf)[:read_size])
+            except BaseException:
+                writer.release(buf)
+                raise
+            if not n:
+                writer.release(buf)
+                break
+            writer.write(buf, n)
+            received += n
+            on_read(n)
+            if limiter:
+                limiter.consume(n)
+            if n == read_size:
+                chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+    except urllib3.exceptions.HTTPError as e:
+        raise IncompleteDownloadError(
+            "connection lost after {} bytes: {}".format(received, e)
+        ) from e
+    return received
+
+
+def write_response(
+    response: requests.Response,
+    part_file_path: str,
+    offset: int,
+    total_length: Optional[int],
+    callback: Optional[Callable[[int, Optional[int]], None]] = None,
+    limiter: Optional[BandwidthLimiter] = None,
+) -> int:
+    """stream the body of response into part_file_path starting at offset. Reads go straight into
+    recycled buffers that a FileWriter writes out on its own thread. When total_length is known the
+    file is preallocated. Whatever happens, the part file is left truncated to the bytes that were
+    actually written so that the next attempt can resume from its size. callback is called with
+    offset before anything is received
+
+    Returns:
+        int: offset + number of bytes received
+    """
+    committed_path = part_file_path + COMMITTED_FILE_SUFFIX
+    with open(part_file_path, "r+b" if offset else "wb") as f:
+        preallocated = total_length is not None and total_length > offset
+        if preallocated:
+            # the committed file has to exist before the file grows past the downloaded data
+            write_committed_offset(committed_path, offset)
+            preallocate(f, total_length)
+        f.seek(offset)
+
+        writer = FileWriter(f, committed_path if preallocated else None)
+        dl = offset
+
+        def on_read(n: int):
+            nonlocal dl
+            dl += n
+            if callback:
+                callback(dl, total_length)
+
+        if callback:
+            callback(dl, total_length)
+        try:
+            stream_into(response, writer, on_read, limiter)
+        finally:
+            try:
+                writer.close()
+            finally:
+                written = offset + writer.written
+                if written != total_length:
+                    f.truncate(written)
+                if os.path.exists(committed_path):
+                    os.remove(committed_path)
+    return dl
+
+
+def split_segments(total_length: int, segments: int) -> List[Tuple[int, int]]:
+    """split total_length bytes into at most segments ranges of at least MIN_SEGMENT_SIZE bytes
+
+    Returns:
+        List[Tuple[int, int]]: first and last byte of every range
+    """
+    count = max(1, min(segments, total_length // MIN_SEGMENT_SIZE))
+    size = -(-total_length // count)
+    return [
+        (start, min(start + size, total_length) - 1) for start in range(0, total_length, size)
+    ]
+
+
+def get_segment_committed_path(part_file_path: str, idx: int) -> str:
+    return "{}{}.{}".format(part_file_path, SEGMENTS_FILE_SUFFIX, idx)
+
+
+def read_segments(part_file_path: str) -> Optional[Tuple[int, List[Tuple[int, int]]]]:
+    """total length and byte ranges of a part file downloaded in segments, None if there is none"""
+    try:
+        with open(part_file_path + SEGMENTS_FILE_SUFFIX, "r") as f:
+            state = json.load(f)
+        return state["total_length"], [(start, end) for start, end in state["segments"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def remove_segments(part_file_path: str, count: int):
+    """remove the segment files next to part_file_path"""
+    for path in [part_file_path + SEGMENTS_FILE_SUFFIX] + [
+        get_segment_committed_path(part_file_path, idx) for idx in range(count)
+    ]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def download_segments(
+    session: SessionManager,
+    url: str,
+    part_file_path: str,
+    total_length: int,
+    segments: int,
+    callback: Optional[Callable[[int, Optional[int]], None]] = None,
+    limiter: Optional[BandwidthLimiter] = None,
+):
+    """download url into the preallocated part_file_path, each byte range over its own connection.
+    Every segment persists how far it got, so an interrupted download resumes each range where it
+    stopped. The ranges of an earlier attempt are kept, segments only limits how many run at once.
+    callback is called with the bytes kept from earlier attempts before anything is received
+
+    Raises:
+        IncompleteDownloadError: a range was not received completely or the file changed on the
+            server, in the latter case the part file is discarded
+    """
+    state = read_segments(part_file_path)
+    if state is None or state[0] != total_length or not os.path.isfile(part_file_path):
+        ranges = split_segments(total_length, segments)
+        # the ranges have to be on disk before the file grows past the downloaded data
+        with open(part_file_path + SEGMENTS_FILE_SUFFIX, "w") as f:
+            json.dump({"total_length": total_length, "segments": ranges}, f)
+        for idx in range(len(ranges)):
+            write_committed_offset(get_segment_committed_path(part_file_path, idx), ranges[idx][0])
+        with open(part_file_path, "wb") as f:
+            preallocate(f, total_length)
+    else:
+        ranges = state[1]
+
+    offsets = []
+    for idx, (start, end) in enumerate(ranges):
+        committed = read_committed_offset(get_segment_committed_path(part_file_path, idx))
+        offsets.append(start if committed is None else max(start, min(committed, end + 1)))
+
+    lock = threading.Lock()
+    dl = sum(offset - start for offset, (start, _end) in zip(offsets, ranges))
+
+    def on_read(n: int):
+        nonlocal dl
+        with lock:
+            dl += n
+            if callback:
+                callback(dl, total_length)
+
+    if callback:
+        callback(dl, total_length)
+
+    def fetch(idx: int):
+        start, end = ranges[idx]
+        offset = offsets[idx]
+        headers = dict(DOWNLOAD_HEADERS, Range="bytes={}-{}".format(offset, end))
+        with metrics.timer("request_seconds", endpoint="download_segment"):
+            response = session.get(url, allow_redirects=True, stream=True, headers=headers)
+        with response:
+            response.raise_for_status()
+            range_start, range_total = parse_content_range(response.headers.get("content-range"))
+            if response.status_code != 206 or range_start != offset:
+                raise FileChangedError(
+                    "server did not send bytes {}-{} of {}".format(offset, end, url)
+                )
+            if range_total != total_length:
+                raise FileChangedError(
+                    "{} is {} bytes instead of {}".format(url, range_total, total_length)
+                )
+            committed_path = get_segment_committed_path(part_file_path, idx)
+            with open(part_file_path, "r+b") as f:
+                f.seek(offset)
+                writer = FileWriter(f, committed_path)
+                try:
+                    stream_into(response, writer, on_read, limiter, end + 1 - offset)
+                finally:
+                    try:
+                        writer.close()
+                    finally:
+                        write_committed_offset(committed_path, offset + writer.written)
+        if offset + writer.written != end + 1:
+            raise IncompleteDownloadError(
+                "received {} of {} bytes of segment {} of {}".format(
+                    offset + writer.written - start, end + 1 - start, idx, url
+                )
+            )
+
+    pending = [idx for idx, (_start, end) in enumerate(ranges) if offsets[idx] <= end]
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(segments, len(pending)))) as executor:
+            futures = [executor.submit(fetch, idx) for idx in pending]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if any(isinstance(error, FileChangedError) for error in errors):
+            remove_segments(part_file_path, len(ranges))
+            os.remove(part_file_path)
+        if errors:
+            raise errors[0]
+
+    if os.path.getsize(part_file_path) != total_length:
+        remove_segments(part_file_path, len(ranges))
+        os.remove(part_file_path)
+        raise IncompleteDownloadError(
+            "part file of {} does not match Content-Length {}, discarded".format(url, total_length)
+        )
+    remove_segments(part_file_path, len(ranges))
+
+
+def download(
+    session: SessionManager,
+    url: str,
+    destination: str,
+    callback: Optional[Callable[[int, Optional[int]], None]] = None,
+    limiter: Optional[BandwidthLimiter] = bandwidth.limiter,
+    segments: int = DEFAULT_SEGMENTS,
+) -> bool:
+    """download file to destination, redirects will be followed. Data is written to
+    {destination}.part which is only renamed to destination once it has been received completely.
+    If a partial file is left over from an earlier attempt, the transfer is resumed with a Range
+    request instead of starting over. Files of at least SEGMENTED_MIN_SIZE bytes are fetched in
+    up to segments byte ranges at once if the server accepts ranges
+
+    Args:
+        session (SessionManager): authenticated session
+        url (str): download link
+        destination (str): target file
+        callback (Callable[[int, Optional[int]], None], optional): callback hook to report progress,
+            inputs are bytes downloaded so far and total file size, None if not available. The
+            first call reports the bytes resumed from an earlier attempt
+        limiter (Optional[BandwidthLimiter], optional): bandwidth limit. Defaults to the limiter
+            shared by the whole process.
+        segments (int, optional): maximum number of connections for a single file.
+            Defaults to DEFAULT_SEGMENTS.
+
+    Raises:
+        IncompleteDownloadError: the connection ended before the whole file was received
+
+    Returns:
+        bool: False if destination already exists
+    """
+    dir_path = os.path.dirname(destination)
+    if not os.path.isdir(dir_path):
+        os.makedirs(dir_path, exist_ok=True)
+
+    if os.path.isfile(destination):
+        return False
+
+    part_file_path = get_part_file_path(destination)
+    state = read_segments(part_file_path)
+    if state is not None:
+        # started in segments by an earlier attempt, only the segments know what is downloaded
+        metrics.inc("downloads_total", mode="segmented")
+        download_segments(session, url, part_file_path, state[0], segments, callback, limiter)
+        os.replace(part_file_path, destination)
+        return True
+
+    offset = get_resume_offset(part_file_path)
+    headers = dict(DOWNLOAD_HEADERS)
+    if offset or segments > 1:
+        # a 206 response to a fresh download tells that the server accepts ranges
+        headers["Range"] = "bytes={}-".format(offset)
+
+    segmented = False
+    # time until the response headers arrive
+    with metrics.timer("request_seconds", endpoint="download"):
+        response = session.get(url, allow_redirects=True, stream=True, headers=headers)
+    with response:
+        if response.status_code == 416:
+            # requested range starts at or past the end, the partial file may already be complete
+            _start, total_length = parse_content_range(response.headers.get("content-range"))
+            if total_length is None or total_length != offset:
+                if os.path.exists(part_file_path):
+                    os.remove(part_file_path)
+                raise IncompleteDownloadError(
+                    "partial file of {} bytes does not match {}, discarded".format(
+                        offset, url
+                    )
+                )
+            if not offset:
+                # empty file
+                open(part_file_path, "wb").close()
+            os.replace(part_file_path, destination)
+            return True
+        response.raise_for_status()
+
+        content_length_str = response.headers.get("content-length")
+        content_length = int(content_length_str) if content_length_str is not None else None
+        if response.status_code == 206:
+            start, total_length = parse_content_range(response.headers.get("content-range"))
+            if start != offset:
+                if os.path.exists(part_file_path):
+                    os.remove(part_file_path)
+                raise IncompleteDownloadError(
+                    "server resumed {} at byte {} instead of {}".format(url, start, offset)
+                )
+            if total_length is None and content_length is not None:
+                total_length = offset + content_length
+        else:
+            # server ignored the Range header and is sending the whole file
+            offset = 0
+            total_length = content_length
+
+        if response.headers.get("content-encoding", "identity") != "identity":
+            # Content-Length counts encoded bytes, the decoded size is not known up front
+            response.raw.decode_content = True
+            total_length = None
+
+        segmented = (
+            segments > 1
+            and offset == 0
+            and response.status_code == 206
+            and total_length is not None
+            and total_length >= SEGMENTED_MIN_SIZE
+        )
+        metrics.inc("downloads_total", mode="segmented" if segmented else "stream")
+        if not segmented:
+            dl = write_response(
+                response, part_file_path, offset, total_length, callback, limiter
+            )
+
+    if segmented:
+        # the probe response is dropped, every range gets a request of its own
+        download_segments(
+            session, url, part_file_path, total_length, segments, callback, limiter  # type: ignore
+        )
+    elif total_length is not None and dl != total_length:
+        raise IncompleteDownloadError(
+            "received {} of {} bytes for {}".format(dl, total_length, url)
+        )
+    os.replace(part_file_path, destination)
+    return True
@@ -0,0 +1,234 @@
+"""
+Process-wide bandwidth limit. Every transfer reads from the socket in chunks and pays for each chunk
+with tokens from one shared bucket, so that the combined rate of all transfers stays under the
+limit. Tokens are handed out first come first served and transfers read equally sized chunks while a
+limit is set, so concurrent transfers get an equal share.
+
+The limit can be changed at any time and a RateSchedule changes it by time of day, e.g. unlimited at
+night and 2 MB/s during office hours. Rates are in bytes per second, None means unlimited.
+"""
+import datetime
+import re
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+KB = 1024
+MB = 1024 * KB
+# tokens that may be saved up while idle, in seconds worth of the rate
+BURST_SECONDS = 0.25
+# while limited, a read is at most this many seconds worth of the rate
+CHUNK_SECONDS = 0.1
+MIN_LIMITED_CHUNK_SIZE = 4 * KB
+# how often the schedule is checked, in seconds
+SCHEDULE_CHECK_INTERVAL = 1.0
+
+RATE_UNITS = {"": 1, "B": 1, "K": KB, "KB": KB, "M": MB, "MB": MB, "G": 1024 * MB, "GB": 1024 * MB}
+UNLIMITED = ("0", "unlimited", "none", "off")
+
+
+def parse_rate(text: str) -> Optional[int]:
+    """parse a rate such as "2M", "500KB/s" or "unlimited" to bytes per second, None if unlimited
+
+    Raises:
+        ValueError: text is not a rate
+    """
+    text = text.strip()
+    if text.lower() in UNLIMITED:
+        return None
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?B?)(?:/s)?", text, re.IGNORECASE)
+    if m is None:
+        raise ValueError("invalid rate: {}".format(text))
+    value, unit = m.groups()
+    rate = int(float(value) * RATE_UNITS[unit.upper()])
+    return rate or None
+
+
+def format_rate(rate: Optional[int]) -> str:
+    if rate is None:
+        return "unlimited"
+    for unit, size in (("G", 1024 * MB), ("M", MB), ("K", KB)):
+        if rate >= size:
+            return "{:g}{}".format(round(rate / size, 2), unit)
+    return "{}B".format(rate)
+
+
+class RateWindow(NamedTuple):
+    # minutes after midnight, end may be before start for windows that run past midnight
+    start: int
+    end: int
+    rate: Optional[int]
+
+    def contains(self, minute: int) -> bool:
+        if self.start <= self.end:
+            return self.start <= minute < self.end
+        return minute >= self.start or minute < self.end
+
+
+def parse_time(text: str) -> int:
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})", text.strip())
+    if m is None or int(m.group(1)) > 24 or int(m.group(2)) > 59:
+        raise ValueError("invalid time: {}".format(text))
+    return (int(m.group(1)) * 60 + int(m.group(2))) % (24 * 60)
+
+
+class RateSchedule:
+    def __init__(self, windows: List[RateWindow]):
+        """Rate limits by time of day, the first window that contains the time applies"""
+        self.windows = windows
+
+    @classmethod
+    def parse(cls, text: str) -> "RateSchedule":
+        """parse windows of the form "HH:MM-HH:MM=RATE" separated by commas or semicolons, e.g.
+        "09:00-18:00=2M, 18:00-09:00=unlimited"
+
+        Raises:
+            ValueError: text is not a schedule
+        """
+        windows = []
+        for entry in re.split(r"[,;]", text):
+            if not entry.strip():
+                continue
+            m = re.fullmatch(r"\s*([\d:]+)\s*-\s*([\d:]+)\s*=\s*(.+?)\s*", entry)
+            if m is None:
+                raise ValueError("invalid schedule entry: {}".format(entry.strip()))
+            start, end, rate = m.groups()
+            windows.append(RateWindow(parse_time(start), parse_time(end), parse_rate(rate)))
+        return cls(windows)
+
+    def __str__(self) -> str:
+        return ", ".join(
+            "{:02d}:{:02d}-{:02d}:{:02d}={}".format(
+                *divmod(window.start, 60), *divmod(window.end, 60), format_rate(window.rate)
+            )
+            for window in self.windows
+        )
+
+    def window_at(self, when: datetime.datetime) -> Optional[RateWindow]:
+        minute = when.hour * 60 + when.minute
+        return next((window for window in self.windows if window.contains(minute)), None)
+
+
+class BandwidthLimiter:
+    def __init__(
+        self,
+        rate: Optional[int] = None,
+        schedule: Optional[RateSchedule] = None,
+        clock: Callable[[], float] = time.monotonic,
+        now: Callable[[], datetime.datetime] = datetime.datetime.now,
+    ):
+        """Token bucket shared by all transfers
+
+        Args:
+            rate (Optional[int], optional): bytes per second outside of scheduled windows.
+                Defaults to None, unlimited.
+            schedule (Optional[RateSchedule], optional): time of day limits. Defaults to None.
+            clock (Callable[[], float], optional): monotonic clock in seconds
+            now (Callable[[], datetime.datetime], optional): wall clock for the schedule
+        """
+        self._cond = threading.Condition()
+        self._clock = clock
+        self._now = now
+        self._rate = rate
+        self._base_rate = rate
+        self._schedule = schedule
+        self._window: Optional[RateWindow] = None
+        self._next_schedule_check = 0.0
+        # bytes handed out in total and bytes the rate has allowed so far, a transfer waits until
+        # the allowance covers everything handed out up to and including its own chunk
+        self._issued = 0.0
+        self._allowance = 0.0
+        self._last = clock()
+        with self._cond:
+            self._check_schedule()
+
+    @property
+    def rate(self) -> Optional[int]:
+        """current limit in bytes per second, None if unlimited"""
+        with self._cond:
+            self._check_schedule()
+            return self._rate
+
+    @property
+    def in_scheduled_window(self) -> bool:
+        """True while a window of the schedule applies"""
+        with self._cond:
+            self._check_schedule()
+            return self._window is not None
+
+    def set_rate(self, rate: Optional[int]):
+        """change the limit right away, including for transfers that are waiting. Inside a scheduled
+        window the change lasts until the next window starts
+        """
+        with self._cond:
+            self._apply_rate(rate)
+            if self._window is None:
+                self._base_rate = rate
+
+    def set_schedule(self, schedule: Optional[RateSchedule]):
+        with self._cond:
+            self._schedule = schedule
+            self._window = None
+            self._next_schedule_check = 0.0
+            self._apply_rate(self._base_rate)
+            self._check_schedule()
+
+    def chunk_size(self, size: int) -> int:
+        """size of the next read of a transfer that would read size bytes without a limit"""
+        rate = self._rate
+        if rate is None:
+            return size
+        return max(MIN_LIMITED_CHUNK_SIZE, min(size, int(rate * CHUNK_SECONDS)))
+
+    def consume(self, n: int):
+        """pay for n bytes that have been received, blocks while over the limit"""
+        with self._cond:
+            self._refill()
+            self._issued += n
+            target = self._issued
+            while self._rate is not None and self._allowance < target:
+                self._cond.wait(
+                    min((target - self._allowance) / self._rate, SCHEDULE_CHECK_INTERVAL)
+                )
+                self._refill()
+            if self._rate is None:
+                self._allowance = max(self._allowance, self._issued)
+
+    def _refill(self):
+        self._check_schedule()
+        self._accrue()
+
+    def _apply_rate(self, rate: Optional[int]):
+        # the time until now is accounted at the old rate
+        self._accrue()
+        if rate is None:
+            self._allowance = self._issued
+        self._rate = rate
+        self._cond.notify_all()
+
+    def _accrue(self):
+        now = self._clock()
+        if self._rate is not None:
+            self._allowance = min(
+                self._allowance + (now - self._last) * self._rate,
+                self._issued + self._rate * BURST_SECONDS,
+            )
+        self._last = now
+
+    def _check_schedule(self):
+        """switch to the rate of the scheduled window when one starts or ends"""
+        if self._schedule is None:
+            return
+        now = self._clock()
+        if now < self._next_schedule_check:
+            return
+        self._next_schedule_check = now + SCHEDULE_CHECK_INTERVAL
+        window = self._schedule.window_at(self._now())
+        if window == self._window:
+            return
+        self._window = window
+        self._apply_rate(self._base_rate if window is None else window.rate)
+
+
+# shared by every transfer of the process
+limiter = BandwidthLimiter()
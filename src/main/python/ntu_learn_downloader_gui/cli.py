@@ -0,0 +1,283 @@
+"""
+Command line client of the sync engine for unattended syncs, e.g. from cron on a headless machine.
+Crawls the selected modules, downloads everything that is neither present nor ignored and prints a
+JSON summary to stdout. Does not load Qt unless the saved GUI settings are needed.
+
+Credentials are read from NTU_LEARN_BBROUTER, or NTU_LEARN_USERNAME and NTU_LEARN_PASSWORD.
+"""
+import argparse
+import ast
+import getpass
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from ntu_learn_downloader import authenticate
+
+from ntu_learn_downloader_gui.api import get_courses
+from ntu_learn_downloader_gui.bandwidth import KB, RateSchedule, parse_rate
+from ntu_learn_downloader_gui.crawler import DEFAULT_CRAWL_CONCURRENCY
+from ntu_learn_downloader_gui.engine import SyncEngine, get_pool_size
+from ntu_learn_downloader_gui.metrics import metrics
+from ntu_learn_downloader_gui.scheduler import (
+    DEFAULT_DOWNLOAD_CONCURRENCY,
+    DEFAULT_VIDEO_CONCURRENCY,
+    DOWNLOADED,
+    FAILED,
+    RETRYING,
+    LANE_ORDERS,
+    MAX_DOWNLOAD_CONCURRENCY,
+    ORDER_LISTED,
+    SKIPPED,
+    TransferProgress,
+)
+from ntu_learn_downloader_gui.session import SessionManager
+from ntu_learn_downloader_gui.storage import DEFAULT_STORAGE_BACKEND, STORAGE_BACKENDS
+
+BBROUTER_ENV = "NTU_LEARN_BBROUTER"
+USERNAME_ENV = "NTU_LEARN_USERNAME"
+PASSWORD_ENV = "NTU_LEARN_PASSWORD"
+
+EXIT_OK = 0
+# some items failed to download
+EXIT_FAILED_ITEMS = 1
+# bad arguments, see argparse
+EXIT_USAGE = 2
+EXIT_AUTH_FAILED = 3
+
+
+def load_gui_settings() -> Dict:
+    """settings saved by the GUI, QtCore is only imported here and does not need a display"""
+    try:
+        from PyQt5.QtCore import QSettings
+    except ImportError:
+        return {}
+    settings = QSettings("NTULearnDownloader", "GUI")
+    return {key: settings.value(key) for key in settings.allKeys()}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="ntu-learn-downloader",
+        description="Download new files and recorded lectures from NTU Learn",
+        epilog="Credentials are read from {}, or {} and {}".format(
+            BBROUTER_ENV, USERNAME_ENV, PASSWORD_ENV
+        ),
+    )
+    parser.add_argument(
+        "download_dir",
+        nargs="?",
+        help="download directory, defaults to the default download directory of the GUI",
+    )
+    parser.add_argument(
+        "-m",
+        "--modules",
+        nargs="+",
+        metavar="COURSE_ID",
+        help="course ids to sync, defaults to the default modules of the GUI or else all courses",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        choices=range(1, MAX_DOWNLOAD_CONCURRENCY + 1),
+        metavar="N",
+        help="parallel document downloads (1-{}), defaults to the GUI setting or {}".format(
+            MAX_DOWNLOAD_CONCURRENCY, DEFAULT_DOWNLOAD_CONCURRENCY
+        ),
+    )
+    parser.add_argument(
+        "--video-concurrency",
+        type=int,
+        choices=range(1, MAX_DOWNLOAD_CONCURRENCY + 1),
+        metavar="N",
+        help="parallel video downloads (1-{}), on top of the documents, defaults to the GUI "
+        "setting or {}".format(MAX_DOWNLOAD_CONCURRENCY, DEFAULT_VIDEO_CONCURRENCY),
+    )
+    parser.add_argument(
+        "--order",
+        choices=LANE_ORDERS,
+        help="order of the documents and of the videos: as listed, as listed in reverse (the last "
+        "module first, starting with its newest items) or the smallest first by the sizes found in "
+        "earlier runs, defaults to the GUI setting or {}".format(ORDER_LISTED),
+    )
+    parser.add_argument(
+        "--crawl-concurrency",
+        type=int,
+        metavar="N",
+        help="concurrent requests while crawling, defaults to {}".format(
+            DEFAULT_CRAWL_CONCURRENCY
+        ),
+    )
+    parser.add_argument(
+        "--limit",
+        type=parse_rate,
+        # "unlimited" parses to None, so leave the attribute out when not given
+        default=argparse.SUPPRESS,
+        metavar="RATE",
+        help="bandwidth limit shared by all downloads, e.g. 2M or 500K per second, defaults to the "
+        "GUI setting",
+    )
+    parser.add_argument(
+        "--schedule",
+        type=RateSchedule.parse,
+        metavar="SCHEDULE",
+        help='limits by time of day, e.g. "09:00-18:00=2M, 18:00-09:00=unlimited", defaults to the '
+        "GUI setting",
+    )
+    parser.add_argument("--storage-backend", choices=STORAGE_BACKENDS)
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="also write timings and counters of the run to PATH, in the Prometheus text format "
+        "for .prom or .txt files and as JSON otherwise. A JSON copy is always kept in the metrics "
+        "directory of the storage",
+    )
+    parser.add_argument(
+        "--list-modules", action="store_true", help="print the available courses and exit"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only count the items that would be downloaded"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="do not report progress on stderr"
+    )
+    return parser.parse_args(argv)
+
+
+def get_BbRouter() -> str:
+    """authentication token from the environment, or by logging in"""
+    BbRouter = os.environ.get(BBROUTER_ENV)
+    if BbRouter:
+        return BbRouter
+    username = os.environ.get(USERNAME_ENV)
+    if not username:
+        raise ValueError("set {} or {}".format(BBROUTER_ENV, USERNAME_ENV))
+    password = os.environ.get(PASSWORD_ENV)
+    if password is None:
+        password = getpass.getpass("Password for {}: ".format(username))
+    with metrics.timer("phase_seconds", phase="authenticate"):
+        return authenticate(username, password)
+
+
+def select_modules(
+    courses: List[Tuple[str, str]], module_ids: Optional[List[str]]
+) -> List[Tuple[str, str]]:
+    """courses with the given ids, all courses if none are given. Unknown ids raise ValueError"""
+    if not module_ids:
+        return courses
+    by_id = {course_id: name for name, course_id in courses}
+    unknown = [module_id for module_id in module_ids if module_id not in by_id]
+    if unknown:
+        raise ValueError("unknown course ids: {}".format(", ".join(unknown)))
+    return [(by_id[module_id], module_id) for module_id in module_ids]
+
+
+def make_progress_printer(out):
+    """prints one line per completed, skipped or failed item and per retry"""
+
+    def report(data: TransferProgress):
+        _idx, filename, status, _bytes, _total, _trace = data
+        if status in (DOWNLOADED, SKIPPED, FAILED, RETRYING):
+            print("{}: {}".format(status, filename), file=out, flush=True)
+
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    settings: Dict = {}
+    if None in (
+        args.download_dir,
+        args.modules,
+        args.concurrency,
+        args.video_concurrency,
+        args.order,
+        args.schedule,
+    ) or not hasattr(args, "limit"):
+        settings = load_gui_settings()
+
+    download_dir = args.download_dir or settings.get("default_download_dir")
+    if not download_dir and not args.list_modules:
+        print("no download directory given and no default saved", file=sys.stderr)
+        return EXIT_USAGE
+    module_ids = args.modules
+    if module_ids is None and settings.get("default_modules"):
+        module_ids = ast.literal_eval(settings["default_modules"])
+    max_workers = args.concurrency or int(
+        settings.get("download_concurrency", DEFAULT_DOWNLOAD_CONCURRENCY)
+    )
+    video_workers = args.video_concurrency or int(
+        settings.get("video_download_concurrency", DEFAULT_VIDEO_CONCURRENCY)
+    )
+    order = args.order or settings.get("download_order", ORDER_LISTED)
+    if order not in LANE_ORDERS:
+        order = ORDER_LISTED
+    crawl_concurrency = args.crawl_concurrency or int(
+        settings.get("crawl_concurrency", DEFAULT_CRAWL_CONCURRENCY)
+    )
+    if hasattr(args, "limit"):
+        limit = args.limit
+    else:
+        limit = int(settings.get("bandwidth_limit", 0)) * KB or None
+    schedule = args.schedule
+    if schedule is None and settings.get("bandwidth_schedule"):
+        try:
+            schedule = RateSchedule.parse(settings["bandwidth_schedule"])
+        except ValueError:
+            pass
+    storage_backend = (
+        args.storage_backend or settings.get("storage_backend") or DEFAULT_STORAGE_BACKEND
+    )
+
+    try:
+        BbRouter = get_BbRouter()
+    except Exception as e:
+        print("authentication failed: {}".format(e), file=sys.stderr)
+        return EXIT_AUTH_FAILED
+
+    session = SessionManager(
+        BbRouter, get_pool_size(crawl_concurrency, max_workers, video_workers)
+    )
+    try:
+        courses = sorted(get_courses(session))
+        if args.list_modules:
+            json.dump([{"name": name, "id": course_id} for name, course_id in courses], sys.stdout)
+            print()
+            return EXIT_OK
+        try:
+            modules = select_modules(courses, module_ids)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return EXIT_USAGE
+
+        engine = SyncEngine(session, download_dir, storage_backend, crawl_concurrency)
+        engine.limiter.set_rate(limit)
+        engine.limiter.set_schedule(schedule)
+        try:
+            summary = engine.sync(
+                modules,
+                max_workers,
+                None if args.quiet else make_progress_printer(sys.stderr),
+                dry_run=args.dry_run,
+                video_workers=video_workers,
+                order=order,
+            )
+        finally:
+            engine.close()
+    finally:
+        session.close()
+
+    if args.metrics:
+        try:
+            metrics.write(args.metrics)
+        except OSError as e:
+            print("could not write metrics: {}".format(e), file=sys.stderr)
+    json.dump(summary.to_dict(), sys.stdout, indent=2)
+    print()
+    return EXIT_FAILED_ITEMS if summary.failed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Concurrent crawler for NTU Learn course contents.
+
+ntu_learn_downloader.get_download_dir fetches every content area and sub folder of a course one
+after another. The crawler below fans those requests out to a shared, bounded thread pool and
+reports each course as soon as its whole subtree has been fetched. With a PageCache, pages that did
+not change since the last crawl are not parsed again. A crawl can be cancelled with an event, requests
+that have not started yet are dropped then.
+"""
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ntu_learn_downloader.models import MODEL_TYPES, Folder, to_model
+from ntu_learn_downloader.parsing import parse_content_page
+from bs4 import BeautifulSoup
+from ntu_learn_downloader.utils import get_ids_from_listContent_url
+
+from ntu_learn_downloader_gui.api import get_content_ids, get_contents_page
+from ntu_learn_downloader_gui.metrics import metrics
+from ntu_learn_downloader_gui.page_cache import PageCache, hash_body
+from ntu_learn_downloader_gui.session import SessionManager
+
+DEFAULT_CRAWL_CONCURRENCY = 8
+
+
+class CrawlCancelled(Exception):
+    """the cancelled event of a crawl was set"""
+
+
+def get_contents(
+    session: SessionManager,
+    course_id: str,
+    content_id: str,
+    page_cache: Optional[PageCache] = None,
+) -> List[MODEL_TYPES]:
+    """fetch and parse a single listContent page. With a page_cache, the request is conditional and
+    the models parsed last time are returned if the server answers 304 Not Modified or the body is
+    unchanged
+
+    Args:
+        session (SessionManager): authenticated session
+        course_id (str): course id
+        content_id (str): content id
+        page_cache (Optional[PageCache], optional): cache of earlier responses. Defaults to None.
+
+    Returns:
+        List[MODEL_TYPES]: models of the page, sub folders may not have their children loaded
+    """
+    entry = page_cache.get(course_id, content_id) if page_cache is not None else None
+    headers = page_cache.get_headers(entry) if page_cache is not None else None
+    response = get_contents_page(session, course_id, content_id, headers)
+    if entry is not None and response.status_code == 304:
+        metrics.count_cache("page", hit=True)
+        return page_cache.get_models(entry)  # type: ignore
+
+    response.raise_for_status()
+    body_hash = hash_body(response.content)
+    if page_cache is not None:
+        metrics.count_cache("page", hit=entry is not None and entry["body_hash"] == body_hash)
+    if entry is not None and entry["body_hash"] == body_hash:
+        models = page_cache.get_models(entry)  # type: ignore
+    else:
+        soup = BeautifulSoup(response.content.decode(), features="lxml")
+        models = [to_model(c) for c in parse_content_page(soup)]
+    unchanged = entry is not None and (
+        entry["body_hash"],
+        entry.get("etag"),
+        entry.get("last_modified"),
+    ) == (body_hash, response.headers.get("etag"), response.headers.get("last-modified"))
+    if page_cache is not None and not unchanged:
+        page_cache.put(
+            course_id,
+            content_id,
+            response.headers.get("etag"),
+            response.headers.get("last-modified"),
+            body_hash,
+            models,
+        )
+    return models
+
+
+def get_download_dir(
+    session: SessionManager,
+    course_name: str,
+    course_id: str,
+    executor: ThreadPoolExecutor,
+    page_cache: Optional[PageCache] = None,
+    cancelled: Optional[threading.Event] = None,
+) -> Dict:
+    """Concurrent version of ntu_learn_downloader.get_download_dir. Every listContent page of the
+    course is fetched on executor, the calling thread only schedules requests and assembles the tree
+    so it never blocks a worker of executor.
+
+    Args:
+        session (SessionManager): authenticated session
+        course_name (str): name of course
+        course_id (str): course id
+        executor (ThreadPoolExecutor): pool that performs the requests
+        page_cache (Optional[PageCache], optional): cache of earlier responses. Defaults to None.
+        cancelled (Optional[threading.Event], optional): stops the crawl once set. Defaults to None.
+
+    Raises:
+        CrawlCancelled: cancelled was set
+
+    Returns:
+        Dict: serialized Folder, same format as ntu_learn_downloader.get_download_dir
+    """
+    pending: Dict[Future, Folder] = {}
+
+    def check_cancelled():
+        if cancelled is not None and cancelled.is_set():
+            raise CrawlCancelled()
+
+    def fetch(course_id: str, content_id: str) -> List[MODEL_TYPES]:
+        check_cancelled()
+        return get_contents(session, course_id, content_id, page_cache)
+
+    def load(folder: Folder, course_id: str, content_id: str):
+        future = executor.submit(fetch, course_id, content_id)
+        pending[future] = folder
+
+    def load_unloaded_folders(children: List[MODEL_TYPES]):
+        for child in children:
+            if not isinstance(child, Folder):
+                continue
+            if child.children is not None:
+                load_unloaded_folders(child.children)
+                continue
+            course_content_id = (
+                get_ids_from_listContent_url(child.link) if child.link else None
+            )
+            if course_content_id is None:
+                child.children = []
+            else:
+                load(child, *course_content_id)
+
+    check_cancelled()
+    children = []
+    for content_name, content_id in get_content_ids(session, course_id):
+        folder = Folder(
+            name=content_name,
+            link=None,
+            details="{} folder. Generated by NTULearn Downloader".format(content_name),
+        )
+        children.append(folder)
+        load(folder, course_id, content_id)
+
+    try:
+        while pending:
+            done, _not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder = pending.pop(future)
+                folder.children = future.result()
+                load_unloaded_folders(folder.children)
+    finally:
+        for future in pending:
+            future.cancel()
+
+    folder = Folder(
+        name=course_name,
+        link=None,
+        details="Top level folder for {}. Generated by NTULearn Downloader".format(
+            course_name
+        ),
+        children=children,
+    )
+    return folder.serialize(session.BbRouter)
+
+
+class Crawler:
+    def __init__(
+        self,
+        session: SessionManager,
+        max_workers: int = DEFAULT_CRAWL_CONCURRENCY,
+        page_cache: Optional[PageCache] = None,
+    ):
+        """Crawls several courses at the same time
+
+        Args:
+            session (SessionManager): authenticated session
+            max_workers (int, optional): maximum number of concurrent requests to NTU Learn.
+                Defaults to DEFAULT_CRAWL_CONCURRENCY.
+            page_cache (Optional[PageCache], optional): cache of earlier responses. Defaults to None.
+        """
+        self.session = session
+        self.max_workers = max(1, max_workers)
+        self.page_cache = page_cache
+
+    def crawl(
+        self,
+        modules: List[Tuple[str, str]],
+        callback: Optional[Callable[[int, Dict], None]] = None,
+        cancelled: Optional[threading.Event] = None,
+    ) -> List[Dict]:
+        """crawl modules, courses are crawled concurrently and share the request pool
+
+        Args:
+            modules (List[Tuple[str, str]]): list of course name and course id tuples
+            callback (Callable[[int, Dict], None], optional): invoked with the index of the module
+                and its download dir as soon as a course is done
+            cancelled (Optional[threading.Event], optional): stops the crawl once set, crawl raises
+                CrawlCancelled then. Defaults to None.
+
+        Returns:
+            List[Dict]: download dirs in the same order as modules
+        """
+        results: List[Optional[Dict]] = [None] * len(modules)
+        if not modules:
+            return []
+
+        # course threads only wait on request futures, so they do not count towards max_workers
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        course_executor = ThreadPoolExecutor(max_workers=len(modules))
+
+        def crawl_course(name: str, course_id: str) -> Dict:
+            with metrics.timer("crawl_course_seconds"):
+                return get_download_dir(
+                    self.session, name, course_id, executor, self.page_cache, cancelled=cancelled
+                )
+
+        futures = {
+            course_executor.submit(crawl_course, name, course_id): idx
+            for idx, (name, course_id) in enumerate(modules)
+        }
+        try:
+            for future in as_completed(futures):
+                idx = futures[future]
+                results[idx] = future.result()
+                if callback:
+                    callback(idx, results[idx])
+        finally:
+            for future in futures:
+                future.cancel()
+            course_executor.shutdown(wait=False)
+            executor.shutdown(wait=False)
+        return results  # type: ignore
@@ -0,0 +1,210 @@
+"""
+The BbRouter token of the last login, kept so that a relaunch can skip the SSO round trips while the
+token is valid. Stored in the OS keyring (Windows Credential Locker, macOS Keychain, Secret Service).
+Without a usable keyring the token is kept in a file protected with DPAPI on Windows and not kept at
+all elsewhere, the user then logs in on every launch. Nothing in here imports PyQt5.
+
+A BbRouter looks like expires:{int},id:{str},signature:{str},site:{str},timeout:{int},user:{str},...
+where expires is the end of the session in seconds since the epoch and timeout the seconds of
+inactivity after which it ends earlier.
+"""
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+from ntu_learn_downloader_gui.networking import APP_DATA_DIR
+
+KEYRING_SERVICE = "NTULearnDownloader"
+KEYRING_USERNAME = "BbRouter"
+TOKEN_FILENAME = "token.bin"
+# tokens this close to their expiry are not reused, a sync started with them would fail midway
+EXPIRY_MARGIN = 5 * 60
+
+
+class SavedToken(NamedTuple):
+    BbRouter: str
+    used_at: float  # last time NTU Learn accepted the token, in seconds since the epoch
+
+
+def parse_BbRouter(BbRouter: str) -> Dict[str, str]:
+    """fields of a BbRouter token, e.g. {"expires": "1591785034", "user": "1234", ...}"""
+    fields = {}
+    for field in BbRouter.split(","):
+        key, sep, value = field.partition(":")
+        if sep:
+            fields[key.strip()] = value.strip()
+    return fields
+
+
+def get_token_expiry(BbRouter: str, used_at: float) -> Optional[float]:
+    """end of the session of a token last used at used_at, None if the token has no user or expiry"""
+    fields = parse_BbRouter(BbRouter)
+    if not fields.get("user"):
+        return None
+    try:
+        expires = float(fields["expires"])
+    except (KeyError, ValueError):
+        return None
+    if expires > 1e11:
+        # in milliseconds
+        expires /= 1000
+    try:
+        return min(expires, used_at + float(fields["timeout"]))
+    except (KeyError, ValueError):
+        return expires
+
+
+def dpapi_protect(data: bytes) -> bytes:
+    """data encrypted with DPAPI, only the current Windows user can decrypt it"""
+    return _dpapi_call("CryptProtectData", data)
+
+
+def dpapi_unprotect(data: bytes) -> bytes:
+    """plaintext of data written by dpapi_protect
+
+    Raises:
+        OSError: data was not protected by the current user or was changed
+    """
+    return _dpapi_call("CryptUnprotectData", data)
+
+
+def _dpapi_call(name: str, data: bytes) -> bytes:
+    import ctypes
+    from ctypes import wintypes
+
+    class DATA_BLOB(ctypes.Structure):
+        _fields_ = [("cbData", wintypes.DWORD), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+    buffer = ctypes.create_string_buffer(data, len(data))
+    blob_in = DATA_BLOB(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+    blob_out = DATA_BLOB()
+    # CRYPTPROTECT_UI_FORBIDDEN, never prompt
+    if not getattr(ctypes.windll.crypt32, name)(
+        ctypes.byref(blob_in), None, None, None, None, 0x01, ctypes.byref(blob_out)
+    ):
+        raise ctypes.WinError()
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+
+class DPAPIFileBackend:
+    def __init__(self, path: str):
+        """Secret in the file at path, encrypted with DPAPI under the Windows user account"""
+        self.path = path
+
+    def get(self) -> Optional[str]:
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return dpapi_unprotect(data).decode()
+
+    def set(self, secret: str):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dpapi_protect(secret.encode()))
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class KeyringBackend:
+    def __init__(self, keyring):
+        """Secret in the OS keyring
+
+        Args:
+            keyring (module): the keyring package
+        """
+        self.keyring = keyring
+
+    def get(self) -> Optional[str]:
+        return self.keyring.get_password(KEYRING_SERVICE, KEYRING_USERNAME)
+
+    def set(self, secret: str):
+        self.keyring.set_password(KEYRING_SERVICE, KEYRING_USERNAME, secret)
+
+    def delete(self):
+        try:
+            self.keyring.delete_password(KEYRING_SERVICE, KEYRING_USERNAME)
+        except self.keyring.errors.PasswordDeleteError:
+            pass
+
+
+def get_default_backend(directory: str = APP_DATA_DIR):
+    """the OS keyring if usable, a DPAPI protected file in directory on Windows, None otherwise"""
+    try:
+        import keyring
+        from keyring.backends import fail
+
+        if not isinstance(keyring.get_keyring(), fail.Keyring):
+            return KeyringBackend(keyring)
+    except Exception:
+        # not installed, or no backend could be loaded, e.g. in a frozen app
+        pass
+    if sys.platform == "win32":
+        return DPAPIFileBackend(os.path.join(directory, TOKEN_FILENAME))
+    return None
+
+
+class TokenStore:
+    def __init__(self, backend=None, clock: Callable[[], float] = time.time):
+        """The saved token. Errors of the backend are not raised, a token that cannot be saved or
+        read only means that the user has to log in again
+
+        Args:
+            backend (optional): where the token is kept, see get_default_backend. Defaults to the
+                default backend, the token is not kept if there is none.
+            clock (Callable[[], float], optional): wall clock. Defaults to time.time.
+        """
+        self.backend = backend if backend is not None else get_default_backend()
+        self.clock = clock
+
+    def load(self) -> Optional[SavedToken]:
+        if self.backend is None:
+            return None
+        try:
+            secret = self.backend.get()
+            if secret is None:
+                return None
+            data = json.loads(secret)
+            return SavedToken(data["BbRouter"], float(data["used_at"]))
+        except Exception:
+            return None
+
+    def load_valid(self) -> Optional[str]:
+        """the saved BbRouter if it is valid for at least EXPIRY_MARGIN more seconds"""
+        token = self.load()
+        if token is None:
+            return None
+        expiry = get_token_expiry(token.BbRouter, token.used_at)
+        if expiry is None or expiry - EXPIRY_MARGIN <= self.clock():
+            return None
+        return token.BbRouter
+
+    def save(self, BbRouter: str) -> bool:
+        """save BbRouter as just used, returns False if it could not be saved"""
+        if self.backend is None:
+            return False
+        try:
+            self.backend.set(json.dumps({"BbRouter": BbRouter, "used_at": self.clock()}))
+            return True
+        except Exception:
+            return False
+
+    def clear(self):
+        if self.backend is None:
+            return
+        try:
+            self.backend.delete()
+        except Exception:
+            pass
@@ -0,0 +1,303 @@
+"""
+Qt-free sync engine. Owns the storage, caches and directory index of a download directory and runs
+the crawl -> merge -> resolve -> download pipeline. The GUI and the command line are both clients of
+it, nothing in here imports PyQt5.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from ntu_learn_downloader_gui import bandwidth
+from ntu_learn_downloader_gui.crawler import DEFAULT_CRAWL_CONCURRENCY, Crawler
+from ntu_learn_downloader_gui.fs_index import DirectoryIndex, sanitise_filename
+from ntu_learn_downloader_gui.ignore_manifest import IgnoreManifest
+from ntu_learn_downloader_gui.link_cache import LINK_CACHE_FILENAME, LinkCache
+from ntu_learn_downloader_gui.metrics import METRICS_DIRNAME, metrics
+from ntu_learn_downloader_gui.page_cache import PAGE_CACHE_DIRNAME, PageCache
+from ntu_learn_downloader_gui.scheduler import (
+    DEFAULT_DOWNLOAD_CONCURRENCY,
+    DEFAULT_RESOLVE_CONCURRENCY,
+    DEFAULT_VIDEO_CONCURRENCY,
+    FAILED,
+    ORDER_LISTED,
+    DownloadScheduler,
+    TransferProgress,
+    get_connection_count,
+)
+from ntu_learn_downloader_gui.session import SessionManager
+from ntu_learn_downloader_gui.storage import (
+    DEFAULT_STORAGE_BACKEND,
+    DOWNLOADABLE_TYPES,
+    open_storage,
+)
+
+
+class DownloadResult(NamedTuple):
+    downloaded: int
+    skipped: int
+    failed: int
+    # for each item the newly resolved (download_link, filename), None if unchanged
+    deltas: List[Optional[Tuple[str, str]]]
+
+
+class SyncSummary(NamedTuple):
+    download_dir: str
+    modules: List[Tuple[str, str]]
+    # files and recorded lectures that were not present before the sync
+    pending: int
+    downloaded: int
+    skipped: int
+    failed: int
+    # path, name and stack trace of every failed item
+    failures: List[Dict]
+    elapsed: float
+
+    def to_dict(self) -> Dict:
+        result = self._asdict()
+        result["modules"] = [{"name": name, "id": course_id} for name, course_id in self.modules]
+        return result
+
+
+def is_item_present(
+    fs_index: DirectoryIndex, ignores: Optional[IgnoreManifest], path: str, node_data: Dict
+) -> bool:
+    """returns True if a file/recorded lecture has been downloaded to path or was ignored"""
+    if ignores is not None and ignores.is_ignored(path, node_data["name"]):
+        return True
+    filename = node_data.get("filename")
+    return bool(filename) and fs_index.exists(path, sanitise_filename(filename))
+
+
+def iter_items(download_dir: str, courses: List[Dict]):
+    """yields (directory, node data) of every file and recorded lecture in courses"""
+    stack: List[Tuple[str, Dict]] = [(download_dir, course) for course in reversed(courses)]
+    while stack:
+        path, node = stack.pop()
+        if node["type"] in DOWNLOADABLE_TYPES:
+            yield path, node
+        elif node["type"] == "folder":
+            child_path = os.path.join(path, sanitise_filename(node["name"]))
+            stack.extend((child_path, child) for child in reversed(node.get("children") or []))
+
+
+def get_pool_size(
+    crawl_concurrency: int,
+    download_concurrency: int,
+    video_concurrency: int = DEFAULT_VIDEO_CONCURRENCY,
+) -> int:
+    """connections per host needed by the crawler or the downloads, whichever needs more"""
+    # link resolution runs alongside the transfers and needs connections of its own
+    return max(
+        crawl_concurrency,
+        get_connection_count(download_concurrency, video_concurrency, DEFAULT_RESOLVE_CONCURRENCY),
+    )
+
+
+class SyncEngine:
+    def __init__(
+        self,
+        session: SessionManager,
+        download_dir: str,
+        storage_backend: str = DEFAULT_STORAGE_BACKEND,
+        crawl_concurrency: int = DEFAULT_CRAWL_CONCURRENCY,
+    ):
+        """Open the storage of download_dir and load the saved download dir
+
+        Args:
+            session (SessionManager): authenticated session
+            download_dir (str): download directory
+            storage_backend (str, optional): one of storage.STORAGE_BACKENDS.
+                Defaults to DEFAULT_STORAGE_BACKEND.
+            crawl_concurrency (int, optional): maximum number of concurrent requests while
+                crawling. Defaults to DEFAULT_CRAWL_CONCURRENCY.
+        """
+        self.session = session
+        self.download_dir = download_dir
+        self.crawl_concurrency = crawl_concurrency
+        self.storage = open_storage(download_dir, storage_backend)
+        # saved download dir until a crawl replaces it
+        self.data: List[Dict] = self.storage.download_dir
+        self.link_cache = LinkCache(os.path.join(self.storage.dir, LINK_CACHE_FILENAME))
+        self.page_cache = PageCache(os.path.join(self.storage.dir, PAGE_CACHE_DIRNAME))
+        # cleared on every crawl to pick up changes made outside of the app
+        self.fs_index = DirectoryIndex()
+        # every transfer of the process draws from it, see api.download
+        self.limiter = bandwidth.limiter
+        # timings and counters of the whole process, written next to the storage on close
+        self.metrics = metrics
+
+    @property
+    def ignores(self) -> IgnoreManifest:
+        return self.storage.ignores
+
+    def crawl(
+        self,
+        modules: List[Tuple[str, str]],
+        callback: Optional[Callable[[int, Dict], None]] = None,
+        cancelled: Optional[threading.Event] = None,
+    ) -> List[Dict]:
+        """crawl modules and merge the saved links into each course. Does not replace self.data,
+        clients decide when the fresh courses take over
+
+        Args:
+            modules (List[Tuple[str, str]]): list of course name and course id tuples
+            callback (Callable[[int, Dict], None], optional): invoked from the crawler thread with
+                the index of the module and its merged download dir as soon as a course is done
+            cancelled (Optional[threading.Event], optional): stops the crawl once set, see
+                Crawler.crawl. Defaults to None.
+
+        Returns:
+            List[Dict]: download dirs in the same order as modules
+        """
+        self.fs_index.clear()
+
+        def merge(idx: int, course: Dict):
+            self.storage.merge_download_dir([course])
+            if callback:
+                callback(idx, course)
+
+        crawler = Crawler(self.session, self.crawl_concurrency, self.page_cache)
+        with self.metrics.timer("phase_seconds", phase="crawl"):
+            return crawler.crawl(modules, merge, cancelled)
+
+    def is_item_present(self, path: str, node_data: Dict) -> bool:
+        return is_item_present(self.fs_index, self.ignores, path, node_data)
+
+    def pending_items(self, courses: Optional[List[Dict]] = None) -> List[Tuple[str, Dict]]:
+        """returns (directory, node data) of the files and recorded lectures that have been
+        neither downloaded nor ignored, of courses or else self.data
+        """
+        return [
+            (path, node_data)
+            for path, node_data in iter_items(
+                self.download_dir, self.data if courses is None else courses
+            )
+            if not self.is_item_present(path, node_data)
+        ]
+
+    def download(
+        self,
+        items: List[Tuple[str, Dict]],
+        max_workers: int = DEFAULT_DOWNLOAD_CONCURRENCY,
+        callback: Optional[Callable[[TransferProgress], None]] = None,
+        video_workers: int = DEFAULT_VIDEO_CONCURRENCY,
+        order: str = ORDER_LISTED,
+        probe_sizes: bool = False,
+    ) -> DownloadResult:
+        """download items and persist the resolved links of their nodes. Blocks until done
+
+        Args:
+            items (List[Tuple[str, Dict]]): list of target directory and node data tuples, node data
+                is updated with the resolved download link and filename
+            max_workers (int, optional): parallel document transfers.
+                Defaults to DEFAULT_DOWNLOAD_CONCURRENCY.
+            callback (Callable[[TransferProgress], None], optional): progress hook, see
+                DownloadScheduler.run
+            video_workers (int, optional): parallel video transfers.
+                Defaults to DEFAULT_VIDEO_CONCURRENCY.
+            order (str, optional): order within each lane, see scheduler.LANE_ORDERS.
+                Defaults to ORDER_LISTED.
+            probe_sizes (bool, optional): report the size of every item up front as SIZED.
+                Defaults to False.
+
+        Returns:
+            DownloadResult: files downloaded, skipped, failed and the resolved links
+        """
+        scheduler = DownloadScheduler(
+            self.session,
+            max_workers,
+            link_cache=self.link_cache,
+            fs_index=self.fs_index,
+            video_workers=video_workers,
+            order=order,
+            probe_sizes=probe_sizes,
+        )
+
+        def save_link(idx: int, delta: Tuple[str, str]):
+            # right away, links resolved before a crash are not resolved again
+            node_data = items[idx][1]
+            node_data["download_link"], node_data["filename"] = delta
+            self.storage.update_nodes([node_data])
+
+        with self.metrics.timer("phase_seconds", phase="download"):
+            return DownloadResult(*scheduler.run(items, callback, save_link))
+
+    def sync(
+        self,
+        modules: List[Tuple[str, str]],
+        max_workers: int = DEFAULT_DOWNLOAD_CONCURRENCY,
+        callback: Optional[Callable[[TransferProgress], None]] = None,
+        dry_run: bool = False,
+        video_workers: int = DEFAULT_VIDEO_CONCURRENCY,
+        order: str = ORDER_LISTED,
+    ) -> SyncSummary:
+        """crawl modules and download everything that is neither present nor ignored
+
+        Args:
+            modules (List[Tuple[str, str]]): list of course name and course id tuples
+            max_workers (int, optional): parallel document transfers.
+                Defaults to DEFAULT_DOWNLOAD_CONCURRENCY.
+            callback (Callable[[TransferProgress], None], optional): progress hook
+            dry_run (bool, optional): only crawl and count pending items. Defaults to False.
+            video_workers (int, optional): parallel video transfers.
+                Defaults to DEFAULT_VIDEO_CONCURRENCY.
+            order (str, optional): order within each lane. Defaults to ORDER_LISTED.
+
+        Returns:
+            SyncSummary: summary of the sync
+        """
+        start = time.monotonic()
+        self.data = self.crawl(modules)
+        items = self.pending_items()
+        failures: List[Dict] = []
+
+        def report(data: TransferProgress):
+            idx, filename, status, _bytes, _total, trace = data
+            if status == FAILED:
+                path, node_data = items[idx]
+                failures.append(
+                    {"path": path, "name": node_data["name"], "filename": filename, "trace": trace}
+                )
+            if callback:
+                callback(data)
+
+        if dry_run or not items:
+            result = DownloadResult(0, 0, 0, [])
+        else:
+            result = self.download(items, max_workers, report, video_workers, order)
+        return SyncSummary(
+            download_dir=self.download_dir,
+            modules=modules,
+            pending=len(items),
+            downloaded=result.downloaded,
+            skipped=result.skipped,
+            failed=result.failed,
+            failures=failures,
+            elapsed=time.monotonic() - start,
+        )
+
+    def save(self):
+        self.storage.save_download_dir(self.data)
+
+    @property
+    def metrics_path(self) -> str:
+        """metrics file of this session"""
+        return os.path.join(self.storage.dir, METRICS_DIRNAME, self.metrics.session_filename)
+
+    def close(self, save: bool = True):
+        """save the download dir and the metrics of the session and release the storage
+
+        Args:
+            save (bool, optional): False to leave the saved download dir as it is, for an engine
+                whose data is not newer than what another engine may have saved. Defaults to True.
+        """
+        if save:
+            self.save()
+        self.storage.close()
+        self.link_cache.close()
+        try:
+            self.metrics.write(self.metrics_path)
+        except OSError:
+            # metrics are only diagnostics
+            pass
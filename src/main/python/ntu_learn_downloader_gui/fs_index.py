@@ -0,0 +1,73 @@
+"""
+In-memory index of the download directory. Each directory is listed once with os.scandir the first
+time it is asked about, after that "is this file present?" is answered from memory. Downloads add
+their files to the index as they happen, so the index stays current
+without scanning again. On network drives and synced folders this replaces thousands of individual
+stat calls with one listing per directory.
+"""
+import functools
+import os
+import sys
+import threading
+from typing import Dict, Optional, Set
+
+from ntu_learn_downloader import utils
+
+SANITISE_CACHE_SIZE = 65536
+
+# the default filesystems on Windows and macOS ignore case, a.PDF on disk is the same file as a.pdf
+CASE_INSENSITIVE = sys.platform in ("win32", "darwin")
+
+
+def normalise_name(name: str) -> str:
+    """fold the case of name where the filesystem does, so lookups match what the OS would find"""
+    return name.casefold() if CASE_INSENSITIVE else name
+
+
+@functools.lru_cache(maxsize=SANITISE_CACHE_SIZE)
+def sanitise_filename(value: str) -> str:
+    """memoized ntu_learn_downloader.utils.sanitise_filename, names are sanitised over and over
+    when the tree is rebuilt
+    """
+    return utils.sanitise_filename(value)
+
+
+class DirectoryIndex:
+    def __init__(self):
+        """Lazily built index of directory entries. Safe to use from several threads"""
+        self._lock = threading.Lock()
+        self._dirs: Dict[str, Set[str]] = {}
+
+    def exists(self, path: str, name: str) -> bool:
+        """returns True if path contains an entry called name"""
+        return normalise_name(name) in self._names(path)
+
+    def add(self, path: str, name: str):
+        """record that name has been created in path"""
+        self._names(path).add(normalise_name(name))
+
+    def clear(self, path: Optional[str] = None):
+        """forget the listing of path, or of every directory, it is read again on the next lookup"""
+        with self._lock:
+            if path is None:
+                self._dirs.clear()
+            else:
+                self._dirs.pop(self._key(path), None)
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return normalise_name(os.path.normcase(os.path.normpath(path)))
+
+    def _names(self, path: str) -> Set[str]:
+        key = self._key(path)
+        with self._lock:
+            names = self._dirs.get(key)
+            if names is None:
+                try:
+                    with os.scandir(key) as entries:
+                        names = {normalise_name(entry.name) for entry in entries}
+                except (FileNotFoundError, NotADirectoryError):
+                    # created by the first download into it, add keeps the set up to date
+                    names = set()
+                self._dirs[key] = names
+            return names
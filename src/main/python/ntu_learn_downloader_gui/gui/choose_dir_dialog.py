@@ -1,25 +1,28 @@
 import ast
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from PyQt5 import QtWidgets, uic
-from PyQt5.Qt import Qt
-from PyQt5.QtCore import QSettings, QThreadPool
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QSettings, Qt, QThreadPool
 from PyQt5.QtGui import QStandardItem, QStandardItemModel
 
-from ntu_learn_downloader import get_courses
-
 from ntu_learn_downloader_gui.QtThreading import Worker
+from ntu_learn_downloader_gui.crawler import DEFAULT_CRAWL_CONCURRENCY
 from ntu_learn_downloader_gui.logging import Logger
-from ntu_learn_downloader_gui.gui.download_dialog import DownloadDialog
+from ntu_learn_downloader_gui.prefetch import Prefetcher
+from ntu_learn_downloader_gui.session import SessionManager
+from ntu_learn_downloader_gui.storage import DEFAULT_STORAGE_BACKEND
+from ntu_learn_downloader_gui.gui.resources import load_layout
 
 
 class ChooseDirDialog(QtWidgets.QMainWindow):
-    def __init__(self, appctxt, BbRouter):
+    def __init__(self, appctxt, BbRouter, session: Optional[SessionManager] = None):
         super(ChooseDirDialog, self).__init__()
-        uic.loadUi(appctxt.get_resource("layouts/chooseDir.ui"), self)
+        load_layout(appctxt, "chooseDir", self)
 
         self.appctxt = appctxt
         self.BbRouter = BbRouter
+        # shared by every dialog after login so that connections are reused
+        self.session = session if session is not None else SessionManager(BbRouter)
         self.settings = QSettings("NTULearnDownloader", "GUI")
 
         self.defaultDirCheckBox = self.findChild(
@@ -44,23 +47,36 @@ class ChooseDirDialog(QtWidgets.QMainWindow):
         else:
             self.defaultDirCheckBox.setChecked(False)
 
-        # load modules list in the background
+        # fetch the modules list and crawl the default modules in the background, the download
+        # dialog takes over the crawl if the user keeps the defaults
+        self.prefetcher: Optional[Prefetcher] = Prefetcher(
+            self.session,
+            self.settings.value("default_download_dir") or None,
+            self.get_default_module_ids(),
+            self.settings.value("storage_backend", DEFAULT_STORAGE_BACKEND),
+            int(self.settings.value("crawl_concurrency", DEFAULT_CRAWL_CONCURRENCY)),
+        )
+        self.prefetcher.start()
+        courses = self.prefetcher.courses
+
         self.listModel = QStandardItemModel()
         self.listView = self.findChild(QtWidgets.QListView, "listView")
         self.threadPool = QThreadPool()
 
-        worker = Worker(lambda progress_callback: sorted(get_courses(self.BbRouter)))
+        worker = Worker(lambda progress_callback: courses.result())
         worker.signals.result.connect(self.display_modules_list)
         self.threadPool.start(worker)
 
         self.show()
 
-    def display_modules_list(self, modules: List[Tuple[str, str]]):
+    def get_default_module_ids(self) -> Optional[List[str]]:
         default_modules_str = self.settings.value("default_modules")
         if default_modules_str:
-            default_modules = ast.literal_eval(default_modules_str)
-        else:
-            default_modules = None
+            return ast.literal_eval(default_modules_str)
+        return None
+
+    def display_modules_list(self, modules: List[Tuple[str, str]]):
+        default_modules = self.get_default_module_ids()
 
         for name, module_id in modules:
             item = QStandardItem(name)
@@ -76,6 +92,7 @@ class ChooseDirDialog(QtWidgets.QMainWindow):
                 item.setCheckState(Qt.Checked)
             self.listModel.appendRow(item)
         self.listView.setModel(self.listModel)
+        self.listModel.itemChanged.connect(self.handle_selection_changed)
 
         # enable next butten if download dir is set
         if self.downloadDirLine.text():
@@ -90,25 +107,66 @@ class ChooseDirDialog(QtWidgets.QMainWindow):
             self.settings.setValue("default_download_dir", download_dir)
 
         self.downloadDirLine.setText(download_dir)
+        self.handle_selection_changed()
         # enable next button if listModel is already loaded
         if self.listModel.rowCount():
             self.nextButton.setEnabled(True)
 
-    def next_handler(self):
+    def get_selected_modules(self) -> List[Tuple[str, str]]:
         selected_modules = []
         for idx in range(self.listModel.rowCount()):
             item = self.listModel.item(idx)
             if item.checkState() == Qt.Checked:
                 data = item.data(Qt.UserRole)
                 selected_modules.append((data["name"], data["module_id"]))
+        return selected_modules
+
+    def handle_selection_changed(self, *args):
+        """cancel the prefetch as soon as the selection differs from the prefetched one"""
+        if self.prefetcher is None:
+            return
+        download_dir = self.downloadDirLine.text()
+        if download_dir != self.prefetcher.download_dir or (
+            # the modules are compared once they are listed
+            self.listModel.rowCount()
+            and not self.prefetcher.matches(download_dir, self.get_selected_modules())
+        ):
+            self.prefetcher.cancel()
+            self.prefetcher = None
+
+    def closeEvent(self, event):
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+            self.prefetcher = None
+
+    def next_handler(self):
+        selected_modules = self.get_selected_modules()
 
         if self.defaultModulesCheckBox.isChecked():
             self.settings.setValue(
                 "default_modules", str([mod_id for _name, mod_id in selected_modules])
             )
 
+        # the download dialog pulls in the crawler and the download pipeline, only needed from here
+        from ntu_learn_downloader_gui.gui.download_dialog import DownloadDialog
+
+        # handed over to the download dialog, which takes over its crawl
+        prefetcher = self.prefetcher
+        self.prefetcher = None
+        if prefetcher is not None and not prefetcher.matches(
+            self.downloadDirLine.text(), selected_modules
+        ):
+            prefetcher.cancel()
+            prefetcher = None
+
         self.main = DownloadDialog(
-            self.appctxt, self.BbRouter, self.downloadDirLine.text(), selected_modules, self.__class__
+            self.appctxt,
+            self.BbRouter,
+            self.downloadDirLine.text(),
+            selected_modules,
+            self.__class__,
+            self.session,
+            prefetcher,
         )
         self.main.show()
         self.close()
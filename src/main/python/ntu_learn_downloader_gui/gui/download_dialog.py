@@ -1,37 +1,74 @@
 import ast
-import os
+import bisect
 import sys
-from typing import Dict, List, Tuple
-import traceback
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from ntu_learn_downloader import (
-    Storage,
     authenticate,
     get_courses,
-    get_download_dir,
-    get_file_download_link,
-    get_recorded_lecture_download_link,
 )
-from ntu_learn_downloader.utils import (
-    download,
-    get_filename_from_url,
-    sanitise_filename,
-    create_dummy_file,
-    dummy_file_exists,
-    convert_size,
-)
-from PyQt5 import QtGui, QtWidgets, uic
-from PyQt5.Qt import Qt
-from PyQt5.QtCore import QSettings, QThreadPool
+from ntu_learn_downloader.utils import convert_size
+from PyQt5 import QtGui, QtWidgets
+from PyQt5.QtCore import QSettings, Qt, QThreadPool
 from PyQt5.QtGui import QStandardItem
 
 from ntu_learn_downloader_gui.QtThreading import Worker
+from ntu_learn_downloader_gui import bandwidth
+from ntu_learn_downloader_gui.bandwidth import KB, RateSchedule
+from ntu_learn_downloader_gui.crawler import DEFAULT_CRAWL_CONCURRENCY
+from ntu_learn_downloader_gui.engine import SyncEngine, get_pool_size
+from ntu_learn_downloader_gui.gui.download_tree_model import (
+    DownloadTreeModel,
+    DownloadTreeProxyModel,
+)
+from ntu_learn_downloader_gui.gui.ignored_dialog import IgnoredDialog
+from ntu_learn_downloader_gui.gui.resources import get_icon, load_layout
+from ntu_learn_downloader_gui.scheduler import (
+    DEFAULT_DOWNLOAD_CONCURRENCY,
+    DEFAULT_VIDEO_CONCURRENCY,
+    DOWNLOADED,
+    DOWNLOADING,
+    FAILED,
+    LANE_ORDERS,
+    MAX_DOWNLOAD_CONCURRENCY,
+    ORDER_LISTED,
+    ORDER_NEWEST,
+    ORDER_SMALLEST,
+    RETRYING,
+    SIZED,
+    SKIPPED,
+)
 from ntu_learn_downloader_gui.logging import Logger
+from ntu_learn_downloader_gui.prefetch import Prefetcher
+from ntu_learn_downloader_gui.progress import (
+    DEFAULT_PUBLISH_INTERVAL,
+    ByteProgress,
+    ProgressSnapshot,
+    format_duration,
+)
+from ntu_learn_downloader_gui.session import SessionManager
+from ntu_learn_downloader_gui.storage import DEFAULT_STORAGE_BACKEND
 # from ntu_learn_downloader_gui.gui import ChooseDirDialog
 
+PROGRESS_BAR_STEPS = 1000
+
+
+def get_error_summary(trace: str) -> str:
+    """last line of a stack trace, e.g. ValueError: Failed to get download link"""
+    lines = [line for line in trace.strip().splitlines() if line.strip()]
+    return lines[-1].strip() if lines else ""
 
 class DownloadDialog(QtWidgets.QDialog):
-    def __init__(self, appctxt, BbRouter, download_dir, modules: List[Tuple[str, str]], last_dialog: QtWidgets.QDialog):
+    def __init__(
+        self,
+        appctxt,
+        BbRouter,
+        download_dir,
+        modules: List[Tuple[str, str]],
+        last_dialog: QtWidgets.QDialog,
+        session: Optional[SessionManager] = None,
+        prefetcher: Optional[Prefetcher] = None,
+    ):
         """Download Dialog for selecting files to download/ignore
 
         Args:
@@ -40,9 +77,12 @@ class DownloadDialog(QtWidgets.QDialog):
             download_dir (str): download directory
             modules (List[Tuple[str, str]]): list of course name and course id tuples
             last_dialog (QtWidgets.QDialog): last dialog to return on back button press
+            session (SessionManager, optional): shared session, a new one is created if not given
+            prefetcher (Prefetcher, optional): crawl of download_dir and modules started after
+                login, shown instead of waiting for Reload
         """
         super(DownloadDialog, self).__init__()
-        uic.loadUi(appctxt.get_resource("layouts/download.ui"), self)
+        load_layout(appctxt, "download", self)
 
         self.logger = Logger(appctxt)
 
@@ -51,19 +91,32 @@ class DownloadDialog(QtWidgets.QDialog):
         self.download_dir = download_dir
         self.modules = modules
         self.last_dialog = last_dialog
+        self.settings = QSettings("NTULearnDownloader", "GUI")
+        self.crawl_concurrency = int(
+            self.settings.value("crawl_concurrency", DEFAULT_CRAWL_CONCURRENCY)
+        )
+        self.session = session if session is not None else SessionManager(BbRouter)
+        # opened in the background, opening the storage can migrate it and walks the download dir
+        self.engine: Optional[SyncEngine] = None
+        self.closed = False
+        # shared by every transfer of the process, see SyncEngine.limiter
+        self.limiter = bandwidth.limiter
         dirLabel = self.findChild(QtWidgets.QLabel, "downloadDirLabel")
         dirLabel.setText("Downloading to: {}".format(download_dir))
 
         # load icons
-        backIcon = QtGui.QIcon(appctxt.get_resource("images/back.png"))
-        self.folderIcon = QtGui.QIcon(appctxt.get_resource("images/folder.png"))
-        self.videoIcon = QtGui.QIcon(appctxt.get_resource("images/video.png"))
-        self.fileIcon = QtGui.QIcon(appctxt.get_resource("images/file.png"))
+        backIcon = get_icon(appctxt, "images/back.png")
+        self.folderIcon = get_icon(appctxt, "images/folder.png")
+        self.videoIcon = get_icon(appctxt, "images/video.png")
+        self.fileIcon = get_icon(appctxt, "images/file.png")
 
         # load buttons
         self.backButton = self.findChild(QtWidgets.QToolButton, "backButton")
         self.backButton.setIcon(backIcon)
         self.ignoreButton = self.findChild(QtWidgets.QPushButton, "ignoreButton")
+        self.manageIgnoredButton = self.findChild(
+            QtWidgets.QPushButton, "manageIgnoredButton"
+        )
         self.downloadButton = self.findChild(QtWidgets.QPushButton, "downloadButton")
         self.selectAllButton = self.findChild(QtWidgets.QPushButton, "selectAllButton")
         self.deselectAllButton = self.findChild(
@@ -81,11 +134,61 @@ class DownloadDialog(QtWidgets.QDialog):
         self.selectAllButton.clicked.connect(self.handle_select_all)
         self.deselectAllButton.clicked.connect(self.handle_unselect_all)
         self.ignoreButton.clicked.connect(self.handle_ignore)
+        self.manageIgnoredButton.clicked.connect(self.handle_manage_ignored)
         self.downloadButton.clicked.connect(self.handle_download)
         self.reloadButton.clicked.connect(self.handle_reload)
         self.selectFilesButton.clicked.connect(self.handle_select_files)
         self.selectVideosButton.clicked.connect(self.handle_select_videos)
 
+        self.concurrencySpinBox = self.findChild(
+            QtWidgets.QSpinBox, "concurrencySpinBox"
+        )
+        self.concurrencySpinBox.setRange(1, MAX_DOWNLOAD_CONCURRENCY)
+        self.concurrencySpinBox.setValue(
+            int(
+                self.settings.value(
+                    "download_concurrency", DEFAULT_DOWNLOAD_CONCURRENCY
+                )
+            )
+        )
+        self.concurrencySpinBox.valueChanged.connect(self.handle_concurrency_changed)
+        # videos download in a lane of their own so they never hold up the documents
+        self.videoConcurrencySpinBox = self.findChild(
+            QtWidgets.QSpinBox, "videoConcurrencySpinBox"
+        )
+        self.videoConcurrencySpinBox.setRange(1, MAX_DOWNLOAD_CONCURRENCY)
+        self.videoConcurrencySpinBox.setValue(
+            int(
+                self.settings.value(
+                    "video_download_concurrency", DEFAULT_VIDEO_CONCURRENCY
+                )
+            )
+        )
+        self.videoConcurrencySpinBox.valueChanged.connect(
+            self.handle_video_concurrency_changed
+        )
+        self.__update_pool_size()
+        self.orderComboBox = self.findChild(QtWidgets.QComboBox, "orderComboBox")
+        self.orderComboBox.addItem("As listed", ORDER_LISTED)
+        self.orderComboBox.addItem("Last listed first", ORDER_NEWEST)
+        self.orderComboBox.addItem("Smallest first", ORDER_SMALLEST)
+        order = self.settings.value("download_order", ORDER_LISTED)
+        self.orderComboBox.setCurrentIndex(
+            LANE_ORDERS.index(order) if order in LANE_ORDERS else 0
+        )
+        self.orderComboBox.currentIndexChanged.connect(self.handle_order_changed)
+
+        # bandwidth limit in KB/s, 0 is unlimited
+        self.limitSpinBox = self.findChild(QtWidgets.QSpinBox, "limitSpinBox")
+        self.scheduleLineEdit = self.findChild(QtWidgets.QLineEdit, "scheduleLineEdit")
+        self.limiter.set_rate(int(self.settings.value("bandwidth_limit", 0)) * KB or None)
+        schedule_text = self.settings.value("bandwidth_schedule", "")
+        self.scheduleLineEdit.setText(schedule_text)
+        self.__set_schedule(schedule_text)
+        self.__sync_limit_spin_box()
+        self.limitSpinBox.valueChanged.connect(self.handle_limit_changed)
+        self.scheduleLineEdit.editingFinished.connect(self.handle_schedule_changed)
+
         self.progressBar = self.findChild(QtWidgets.QProgressBar, "progressBar")
         self.progressBar.setValue(0)
 
@@ -94,30 +197,132 @@ class DownloadDialog(QtWidgets.QDialog):
         )
         self.downloadProgressText.setText("Click download to start downloading files")
 
+        # items that failed for good, collected instead of interrupting the batch with a message box
+        self.failureGroupBox = self.findChild(QtWidgets.QGroupBox, "failureGroupBox")
+        self.failureList = self.findChild(QtWidgets.QListWidget, "failureList")
+        self.failureList.itemDoubleClicked.connect(self.handle_show_failure)
+        self.failureGroupBox.hide()
+
         # get download dir from NTU Learn and load tree
         self.threadPool = QThreadPool()
-        self.tree = self.findChild(QtWidgets.QTreeWidget, "treeWidget")
+        self.tree = self.findChild(QtWidgets.QTreeView, "treeView")
+        self.model = DownloadTreeModel(
+            download_dir,
+            {
+                "folder": self.folderIcon,
+                "file": self.fileIcon,
+                "recorded_lecture": self.videoIcon,
+            },
+        )
+        self.proxyModel = DownloadTreeProxyModel()
+        self.proxyModel.setSourceModel(self.model)
+        self.tree.setModel(self.proxyModel)
+        self.model.set_placeholder("Loading...")
+
+        self.loading = False
+        # a reload would replace the node data the download updates, it waits until it is done
+        self.downloading = False
+        self.setDownloadIgnoreButtonsEnabled(False)
+        self.manageIgnoredButton.setEnabled(False)
+        self.reloadButton.setEnabled(False)
 
-        # NOTE do not show tree even though we have data as we want the user to
-        # act on fresh download data
-        self.storage = Storage(download_dir)
-        self.data = self.storage.download_dir
+        def open_engine(progress_callback) -> Tuple[SyncEngine, Optional[Prefetcher]]:
+            """the engine of the prefetcher if it crawled the same modules, else a new one"""
+            engine = prefetcher.take_engine() if prefetcher is not None else None
+            if engine is not None:
+                return engine, prefetcher
+            engine = SyncEngine(
+                self.session,
+                download_dir,
+                self.settings.value("storage_backend", DEFAULT_STORAGE_BACKEND),
+                self.crawl_concurrency,
+            )
+            return engine, None
 
-        # add loading text
-        node = QtWidgets.QTreeWidgetItem(self.tree)
-        node.setText(0, "Click Reload to pull data from NTU Learn")
+        worker = Worker(open_engine)
+        worker.signals.result.connect(self.handle_engine_opened)
+        worker.signals.error.connect(self.handle_engine_failed)
+        self.threadPool.start(worker)
 
         self.show()
 
+    def handle_engine_opened(self, result: Tuple[SyncEngine, Optional[Prefetcher]]):
+        """show the saved tree and update it with a fresh crawl, taken over from the prefetcher if
+        it crawled the same modules
+        """
+        engine, prefetcher = result
+        if self.closed:
+            engine.close()
+            return
+        self.engine = engine
+        # shared with the downloads, cleared on every reload
+        self.model.fs_index = engine.fs_index
+        self.model.ignores = engine.ignores
+        self.setDownloadIgnoreButtonsEnabled(True)
+        self.manageIgnoredButton.setEnabled(True)
+        self.reloadButton.setEnabled(True)
+
+        module_names = {name for name, _course_id in self.modules}
+        if prefetcher is not None:
+            self.load_courses(prefetcher.attach)
+        elif any(course["name"] in module_names for course in self.data):
+            self.handle_reload()
+        else:
+            # add loading text
+            self.model.set_placeholder("Click Reload to pull data from NTU Learn")
+
+    def handle_engine_failed(self, error: Tuple):
+        _exctype, _value, trace = error
+        self.model.set_placeholder("Could not open the saved data")
+        self.downloadProgressText.setText(
+            "Could not open the saved data: {}".format(get_error_summary(trace))
+        )
+
+    @property
+    def data(self) -> List[Dict]:
+        """download dir shown in the tree, owned by the engine, empty until the engine is open"""
+        return self.engine.data if self.engine is not None else []
+
+    @data.setter
+    def data(self, data: List[Dict]):
+        self.engine.data = data
+
     def closeEvent(self, event):
-        self.storage.save_download_dir(self.data)
+        self.closed = True
+        if self.engine is not None:
+            self.engine.close()
 
     def handle_back(self):
         # self.main = ChooseDirDialog(self.appctxt, self.BbRouter)
-        self.main = self.last_dialog(self.appctxt, self.BbRouter)
+        self.main = self.last_dialog(self.appctxt, self.BbRouter, self.session)
         self.main.show()
         self.close()
 
+    def handle_concurrency_changed(self, value: int):
+        self.settings.setValue("download_concurrency", value)
+        self.__update_pool_size()
+
+    def handle_video_concurrency_changed(self, value: int):
+        self.settings.setValue("video_download_concurrency", value)
+        self.__update_pool_size()
+
+    def handle_order_changed(self, index: int):
+        self.settings.setValue("download_order", self.orderComboBox.itemData(index))
+
+    def handle_limit_changed(self, value: int):
+        """applies to running transfers right away. Inside a scheduled window the change lasts until
+        the next window starts and is not saved
+        """
+        if not self.limiter.in_scheduled_window:
+            self.settings.setValue("bandwidth_limit", value)
+        self.limiter.set_rate(value * KB or None)
+
+    def handle_schedule_changed(self):
+        text = self.scheduleLineEdit.text()
+        if self.__set_schedule(text):
+            self.settings.setValue("bandwidth_schedule", text)
+            self.__sync_limit_spin_box()
+
     def handle_select_files(self):
         self.__handle_select_type(obj_type="file")
 
@@ -125,74 +330,114 @@ class DownloadDialog(QtWidgets.QDialog):
         self.__handle_select_type(obj_type="recorded_lecture")
 
     def handle_reload(self):
+        if self.downloading:
+            return
+        self.load_courses(lambda callback: self.engine.crawl(self.modules, callback))
+
+    def load_courses(self, crawl: Callable[[Callable[[int, Dict], None]], List[Dict]]):
         """
         1. disable reload button until done fetching data
-        2. clear tree and add Loading text node
-        3. in a separate thread make ntu_learn_downloader API call
-        4. when done update UI
+        2. show the saved or current courses of the modules marked as stale, else a Loading text
+           node
+        3. in a separate thread crawl all modules concurrently
+        4. update or insert each course as soon as it has been crawled, keeping check states and
+           expanded folders of the courses that are shown already
+
+        Args:
+            crawl (Callable): runs the crawl, calling its argument with the index of the module and
+                the course as soon as a course is done, see SyncEngine.crawl
         """
+        if self.loading:
+            return
+        self.loading = True
         self.reloadButton.setEnabled(False)
-        self.__clear_tree()
-        node = QtWidgets.QTreeWidgetItem(self.tree)
-        node.setText(0, "Loading...")
+
+        # module indices of courses that are shown, sorted
+        loaded_indices: List[int] = []
+        # module indices of courses that have been crawled
+        crawled_indices: Set[int] = set()
+        saved_courses = {course["name"]: course for course in self.data}
+        for idx, (name, _course_id) in enumerate(self.modules):
+            if name in saved_courses:
+                loaded_indices.append(idx)
+        courses = [saved_courses[self.modules[idx][0]] for idx in loaded_indices]
+
+        if courses:
+            # the model may show these courses already, resetting it would collapse the tree
+            if len(courses) != len(self.model.courses) or any(
+                course is not shown for course, shown in zip(courses, self.model.courses)
+            ):
+                self.data = courses
+                self.model.set_courses(self.data)
+            self.model.set_stale(course["name"] for course in courses)
+            progress_text = "Showing saved data, checking for changes ({}/{})"
+        else:
+            self.model.set_placeholder("Loading...")
+            progress_text = "Loading modules ({}/{})"
+        self.downloadProgressText.setText(progress_text.format(0, len(self.modules)))
 
         def get_data(progress_callback) -> List[Dict]:
             """Get download dir from NTU Learn, WARNING slow, should not be run in main thread
             Returns list of dicts
             """
-            result = [
-                get_download_dir(self.BbRouter, name, course_id)
-                for name, course_id in self.modules
-            ]
-            return result
-
-        def save_data(result):
-            self.storage.merge_download_dir(result)
-            self.data = result
-            self.data_to_tree()
+            return crawl(lambda idx, course: progress_callback.emit((idx, course)))
+
+        def display_course(data: Tuple[int, Dict]):
+            idx, course = data
+            if not loaded_indices:
+                # remove the loading node, previous data is replaced by the fresh crawl
+                self.data = []
+                self.model.set_courses(self.data)
+            crawled_indices.add(idx)
+
+            # the model updates or inserts into self.data
+            position = bisect.bisect_left(loaded_indices, idx)
+            if position < len(loaded_indices) and loaded_indices[position] == idx:
+                self.model.update_course(position, course)
+            else:
+                loaded_indices.insert(position, idx)
+                self.model.insert_course(position, course)
+            self.downloadProgressText.setText(
+                progress_text.format(len(crawled_indices), len(self.modules))
+            )
 
         def finished():
-            self.reloadButton.setEnabled(True)
+            self.loading = False
+            self.reloadButton.setEnabled(not self.downloading)
+            if self.model.stale:
+                # the crawl failed, the rest of the tree is still the saved one
+                self.downloadProgressText.setText(
+                    "Could not reload {} modules, showing saved data".format(len(self.model.stale))
+                )
+            else:
+                self.downloadProgressText.setText(
+                    "Click download to start downloading files"
+                )
 
         worker = Worker(get_data)
-        worker.signals.result.connect(save_data)
+        worker.signals.progress.connect(display_course)
         worker.signals.finished.connect(finished)
 
         self.threadPool.start(worker)
 
     def handle_select_all(self):
-        def traverse(node):
-            node.setCheckState(0, Qt.Checked)
-            for index in range(node.childCount()):
-                traverse(node.child(index))
-
-        root = self.tree.invisibleRootItem()
-        traverse(root)
+        self.model.set_all_check_states(Qt.Checked)
 
     def handle_unselect_all(self):
-        def traverse(node):
-            node.setCheckState(0, Qt.Unchecked)
-            for index in range(node.childCount()):
-                traverse(node.child(index))
-
-        root = self.tree.invisibleRootItem()
-        traverse(root)
+        self.model.set_all_check_states(Qt.Unchecked)
 
     def handle_ignore(self):
-        """Dummy files are in the format: .{name} 
-        Do not have to get the actual filename
+        """Ignored items are recorded in the ignore manifest of the storage by name, do not have to
+        get the actual filename
         """
         alert = QtWidgets.QMessageBox()
         alert.setWindowTitle("Ignore selected files")
         alert.setIcon(QtWidgets.QMessageBox.Warning)
         alert.setText(
-            "You are about to ignore some files. This will generate hidden files in your download directory"
+            "You are about to ignore some files. They will not appear in the menu in the future"
         )
         alert.setDetailedText(
-            "This will generate hidden files in the download directory so that ignored "
-            "files will not appear the menu in the future.\n"
-            "To undo, you need to enable show hidden files in your file "
-            "explorer and remove the files you want to download. E.g. if you want to download Tut_4, look for .Tut_4 and remove it"
+            "To undo, click Ignored files and unignore the files you want to download."
         )
         alert.setStandardButtons(
             QtWidgets.QMessageBox.Ok | QtWidgets.QMessageBox.Cancel
@@ -201,307 +446,238 @@ class DownloadDialog(QtWidgets.QDialog):
         retval = alert.exec_()
         if retval == QtWidgets.QMessageBox.Ok:
             path_and_nodes = self.get_paths_and_selected_nodes()
-            for path, node in path_and_nodes:
-                node_data = node.data(0, Qt.UserRole)
-                create_dummy_file(path, sanitise_filename(node_data["name"]))
+            self.engine.ignores.ignore(
+                [(path, node_data["name"]) for path, node_data in path_and_nodes]
+            )
+            self.reload_tree()
             self.downloadProgressText.setText(
                 "Ignored {} files and recorded lectures".format(len(path_and_nodes))
             )
         if retval == QtWidgets.QMessageBox.Cancel:
             pass
 
+    def handle_manage_ignored(self):
+        dialog = IgnoredDialog(self.appctxt, self.engine.ignores, self)
+        dialog.exec_()
+        if dialog.changed:
+            self.reload_tree()
+
     def handle_error(self, full_file_name: str, trace: str):
-        """Create a MessageBox with a trace dump and log error to server
+        """Add a failed item to the list of failed items and log the error to server
         """
         try:
             self.logger.log_error(trace)
         except Exception:
             pass
 
-        alert = QtWidgets.QMessageBox()
-        alert.setWindowTitle("Failed to get download link")
+        item = QtWidgets.QListWidgetItem(
+            "{}: {}".format(full_file_name, get_error_summary(trace))
+        )
+        item.setData(Qt.UserRole, (full_file_name, trace))
+        self.failureList.addItem(item)
+        self.failureGroupBox.setTitle("Failed items ({})".format(self.failureList.count()))
+        self.failureGroupBox.show()
+
+    def handle_show_failure(self, item: QtWidgets.QListWidgetItem):
+        """Show the trace dump of a failed item, without blocking the dialog
+        """
+        full_file_name, trace = item.data(Qt.UserRole)
+        alert = QtWidgets.QMessageBox(self)
+        alert.setWindowTitle("Failed to download")
         alert.setText(
-            "Failed to get download link for: {}. Please try again later. ".format(
-                full_file_name
-            )
+            "Failed to download: {}. Please try again later. ".format(full_file_name)
             + "If the problem persists, please send the trace log below to us."
         )
         nonBoldFont = QtGui.QFont()
         nonBoldFont.setBold(False)
         alert.setDetailedText(trace)
         alert.setFont(nonBoldFont)
-        alert.exec_()
+        alert.setModal(False)
+        alert.setAttribute(Qt.WA_DeleteOnClose)
+        alert.show()
 
     def handle_download(self):
         """
         1. Get list of files to download
         2. Map predownload links to download links
-        3. Download files async in background
+        3. Download files async in background, several at a time
         4. update tree with downloaded items removed
         """
         self.setDownloadIgnoreButtonsEnabled(False)
+        self.downloading = True
+        self.reloadButton.setEnabled(False)
         self.downloadProgressText.setText("Getting items to download...")
-        paths_and_nodes = self.get_paths_and_selected_nodes()
-        numFiles = len(paths_and_nodes)
-        self.progressBar.setRange(0, numFiles)
+        items = self.get_paths_and_selected_nodes()
+        numFiles = len(items)
+        # weighted by bytes, in permille as the byte counts can overflow the range of the bar
+        self.progressBar.setRange(0, PROGRESS_BAR_STEPS)
+        self.progressBar.setValue(0)
+        self.failureList.clear()
+        self.failureGroupBox.hide()
+
+        maxWorkers = self.concurrencySpinBox.value()
+        videoWorkers = self.videoConcurrencySpinBox.value()
+        order = self.orderComboBox.currentData()
+        numCompleted = 0
+        numRetries = 0
+        byteProgress = ByteProgress(range(numFiles))
 
         def download_from_nodes(progress_callback):
-            """Return tuple (files downloaded, files skipped, download_links)
+            """Return tuple (files downloaded, files skipped, files failed, download_links)
+            progress_callback is a ProgressAggregator, byte counts are coalesced and only
+            sized/completed/skipped/failed transfers are delivered as events
             """
 
-            numDownloaded, numSkipped = 0, 0
-            data_deltas = []
-
-            for idx, (path, node) in enumerate(paths_and_nodes):
-                node_data = node.data(0, Qt.UserRole)
-                node_type = node_data["type"]
-
-                save_flag = False
-                # load the download link and file name from API if needed
-                if node_data.get("download_link") is None:
-                    save_flag = True
-                    try:
-                        if node_type == "file":
-                            download_link = get_file_download_link(
-                                self.BbRouter, node_data["predownload_link"]
-                            )
-                            filename = get_filename_from_url(download_link)
-                        elif node_type == "recorded_lecture":
-                            download_link = get_recorded_lecture_download_link(
-                                self.BbRouter, node_data["predownload_link"]
-                            )
-                            filename = node_data["name"] + ".mp4"
-                    except Exception:
-                        trace = traceback.format_exc()
-                        progress_callback.emit(
-                            (idx + 1, node_data["name"], False, None, None, trace)
-                        )
-                        data_deltas.append(None)
-                        continue
+            def report(data):
+                idx, filename, status, bytes_downloaded, total_content_length, _trace = data
+                if status == DOWNLOADING:
+                    progress_callback.update(
+                        idx, filename, bytes_downloaded, total_content_length
+                    )
+                elif status == SIZED:
+                    progress_callback.event(data)
                 else:
-                    download_link = node_data.get("download_link")
-                    filename = node_data.get("filename")
+                    progress_callback.event(data, key=idx)
 
-                full_file_path = os.path.join(path, sanitise_filename(filename))
-                if os.path.exists(full_file_path):
-                    numSkipped += 1
-                    progress_callback.emit((idx + 1, filename, False, None, None, None))
-                else:
-                    try:
-                        download(
-                            self.BbRouter,
-                            download_link,
-                            full_file_path,
-                            lambda bytes_downloaded, total_content_length: progress_callback.emit(
-                                (
-                                    idx + 1,
-                                    filename,
-                                    True,
-                                    bytes_downloaded,
-                                    total_content_length,
-                                    None,
-                                )
-                            ),
-                        )
-                    except Exception:
-                        numSkipped += 1
-                        trace = traceback.format_exc()
-                        progress_callback.emit(
-                            (idx + 1, filename, False, None, None, trace)
-                        )
-
-                numDownloaded += 1
-                data_deltas.append((download_link, filename) if save_flag else None)
-
-            return (numDownloaded, numSkipped, data_deltas)
-
-        def progress_fn(data):
+            return self.engine.download(
+                items, maxWorkers, report, videoWorkers, order, probe_sizes=True
+            )
+
+        def progress_fn(snapshot: ProgressSnapshot):
             """
             Progress text format:
-            [overall_progress] [prefix] [filename] [current_file_progress]
+            [overall_progress] [prefix] [filename] [current_file_progress] [other transfers]
+            [bytes done/total] [throughput] [ETA]
             """
-            numDownloaded, filename, was_last_downloaded, bytes_downloaded, total_content_length, stack_trace = (
-                data
-            )
-
-
-            overall_progress = "({}/{})".format(numDownloaded, numFiles)
-            prefix = "Downloading" if was_last_downloaded else "Skipping"
-            current_file_progress = ""
-            if was_last_downloaded:
+            nonlocal numCompleted, numRetries
+            prefix, filename, current_file_progress = "", "", ""
+            for idx, event_filename, status, _bytes, total, stack_trace in snapshot.events:
+                if status == SIZED:
+                    byteProgress.set_size(idx, total)
+                    continue
+                filename = event_filename
+                if status == RETRYING:
+                    # transient failures are queued again, only failures for good are listed
+                    numRetries += 1
+                    prefix = "Will retry"
+                    continue
+                numCompleted += 1
+                byteProgress.finish(idx, completed=status == DOWNLOADED)
+                prefix = {SKIPPED: "Skipping", FAILED: "Failed"}.get(status, "Downloaded")
+                if stack_trace:
+                    self.handle_error(filename, stack_trace)
+            byteProgress.update(snapshot.transfers)
+
+            if snapshot.transfers:
+                transfer = snapshot.transfers[0]
+                prefix, filename = "Downloading", transfer.label
                 current_file_progress = (
                     "({}/{})".format(
-                        convert_size(bytes_downloaded),
-                        convert_size(total_content_length),
+                        convert_size(transfer.bytes_done), convert_size(transfer.total)
                     )
-                    if total_content_length
-                    else "({})".format(convert_size(bytes_downloaded))
+                    if transfer.total
+                    else "({})".format(convert_size(transfer.bytes_done))
                 )
 
+            overall_progress = "({}/{})".format(numCompleted, numFiles)
             text = "{} {} {} {}".format(
                 overall_progress, prefix, filename, current_file_progress
             )
+            if len(snapshot.transfers) > 1:
+                text += " and {} other transfers".format(len(snapshot.transfers) - 1)
+            total = byteProgress.total
+            if total:
+                text += " - {}/{}".format(
+                    convert_size(byteProgress.bytes_done), convert_size(total)
+                )
+            if snapshot.transfers and snapshot.rate >= 1:
+                text += " - {}/s".format(convert_size(int(snapshot.rate)))
+                eta = byteProgress.eta(snapshot.rate)
+                if eta is not None:
+                    text += ", {} left".format(format_duration(eta))
             self.downloadProgressText.setText(text)
-            self.progressBar.setValue(numDownloaded)
-
-            if stack_trace:
-                self.handle_error(filename, stack_trace)
+            self.progressBar.setValue(int(byteProgress.fraction * PROGRESS_BAR_STEPS))
+            # scheduled windows change the limit while downloading
+            self.__sync_limit_spin_box()
 
         def display_result_and_update_node_data(result):
             self.setDownloadIgnoreButtonsEnabled(True)
-            numDownloaded, numSkipped, data_deltas = result
-            self.downloadProgressText.setText(
-                "Completed. Downloaded {} files, skipped {} files".format(
-                    numDownloaded, numSkipped
-                )
+            numDownloaded, numSkipped, numFailed, _deltas = result
+            text = "Completed. Downloaded {} files, skipped {} files, {} failed".format(
+                numDownloaded, numSkipped, numFailed
             )
-
-            for delta, (_path, node) in zip(data_deltas, paths_and_nodes):
-                if delta is None:
-                    continue
-                download_link, filename = delta
-                node_data = node.data(0, Qt.UserRole)
-                node_data["download_link"] = download_link
-                node_data["filename"] = filename
-                node.setData(0, Qt.UserRole, node_data)
+            if numRetries:
+                text += " ({} retries)".format(numRetries)
+            self.downloadProgressText.setText(text)
+            # the engine updated the node data, which is part of self.data
 
             try:
                 self.logger.log_successful_download(numDownloaded)
             except Exception:
                 pass
 
-        worker = Worker(download_from_nodes)
+        worker = Worker(download_from_nodes, progress_interval=DEFAULT_PUBLISH_INTERVAL)
         worker.signals.result.connect(display_result_and_update_node_data)
-        worker.signals.finished.connect(self.reload_tree)
+        def finished():
+            self.downloading = False
+            self.reloadButton.setEnabled(not self.loading)
+            self.reload_tree()
+
+        worker.signals.finished.connect(finished)
         worker.signals.progress.connect(progress_fn)
 
         self.threadPool.start(worker)
 
     def reload_tree(self):
-        """update self.data based on new tree node data
-        """
-        self.tree_to_data()
-        self.__clear_tree()
-        self.data_to_tree()
-
-    def tree_to_data(self):
-        """traverse tree to convert it to data and update self.data
+        """rebuild the tree from self.data, hides items that have been downloaded since
         """
+        self.model.refresh()
 
-        def traverse(node):
-            node_data = node.data(0, Qt.UserRole)
-            node_type = node_data["type"]
-
-            if node_type == "folder":
-                node_data["children"] = [
-                    traverse(node.child(idx)) for idx in range(node.childCount())
-                ]
-            return node_data
-
-        root = self.tree.invisibleRootItem()
-        self.data = [traverse(root.child(idx)) for idx in range(root.childCount())]
-
-    def data_to_tree(self):
-        """traverse self.data and generate tree list widget. Files/videos that have already downloaded
-        will not be displayed
-        Raises:
-            Exception: thrown on unknown data type
-        """
-        if self.data is None:
-            print("Warning, there is not loaded data, was get_data() not called?")
-            return
-        self.__clear_tree()
-
-        def traverse(data, parent, path):
-            """recursively traverse NTU Learn data and render all file/video nodes, if the 
-            file/video already exists, set the node as hidden
-            """
-            node = QtWidgets.QTreeWidgetItem(parent)
-            # save relevant data fields into node.data
-            node_data = {"name": data["name"], "type": data["type"]}
-
-            data_type = data["type"]
-            if data_type == "folder":
-                node.setIcon(0, self.folderIcon)
-                node.setFlags(node.flags() | Qt.ItemIsTristate | Qt.ItemIsUserCheckable)
-                next_path = os.path.join(path, sanitise_filename(data["name"]), "")
-                for child in data["children"]:
-                    traverse(child, node, next_path)
-            elif data_type == "file" or data_type == "recorded_lecture":
-                # add file/video attributes
-                node_data["predownload_link"] = data["predownload_link"]
-                node_data["download_link"] = data.get("download_link")
-                node_data["filename"] = data.get("filename")
-
-                # ignore file if dummy file is present
-                is_dummy_file_present = dummy_file_exists(
-                    path, sanitise_filename(node_data["name"])
-                )
-                is_file_present = node_data["filename"] and os.path.exists(
-                    os.path.join(path, sanitise_filename(node_data["filename"]))
-                )
-
-                if is_dummy_file_present or is_file_present:
-                    node.setHidden(True)
-
-                node.setIcon(
-                    0, self.fileIcon if data_type == "file" else self.videoIcon
-                )
-                node.setFlags(node.flags() | Qt.ItemIsUserCheckable)
-            else:
-                raise Exception("unknown type", data_type)
-            node.setText(0, data["name"])
-            node.setCheckState(0, Qt.Unchecked)
-            node.setData(0, Qt.UserRole, node_data)
-
-        # iterate data (list)
-        for item in self.data:
-            traverse(item, self.tree, self.download_dir)
-
-    def get_paths_and_selected_nodes(
-        self, files=True, videos=False
-    ) -> List[Tuple[str, QtWidgets.QTreeWidgetItem]]:
-        """returns lists of QTreeWidgetItem (nodes) that correspond to files/videos to download/ignore
-
-        Args:
-            files (bool, optional): whether to download files. Defaults to True.
-            videos (bool, optional): whether to download videos. Defaults to False.
+    def get_paths_and_selected_nodes(self) -> List[Tuple[str, Dict]]:
+        """returns the files/videos that are checked and not hidden, to download/ignore
 
         Returns:
-           List[Tuple[str, QtWidgets.QTreeWidgetItem]]: list of path, tree nodes tuples
+           List[Tuple[str, Dict]]: list of path, node data tuples. The node data dicts are part of
+               self.data
         
         Note:
             Not possible to project down to filename, download link as loading of the downloading 
             link is very slow (3s) for lecture videos
         """
-
-        result = []
-
-        def traverse(node, path):
-            if node.checkState(0) == Qt.Unchecked or node.isHidden():
-                return
-
-            node_data = node.data(0, Qt.UserRole)
-            node_type = node_data["type"]
-            if node_type == "file" or node_type == "recorded_lecture":
-                result.append((path, node))
-            else:
-                next_path = os.path.join(path, sanitise_filename(node_data["name"]))
-                for index in range(node.childCount()):
-                    traverse(node.child(index), next_path)
-
-        root = self.tree.invisibleRootItem()
-        for idx in range(root.childCount()):
-            traverse(root.child(idx), self.download_dir)
-
-        return result
+        return self.model.checked_items()
 
     def setDownloadIgnoreButtonsEnabled(self, flag: bool):
         self.downloadButton.setEnabled(flag)
         self.ignoreButton.setEnabled(flag)
 
-    def __clear_tree(self):
-        self.tree.clear()
+    def __update_pool_size(self):
+        self.session.set_pool_size(
+            get_pool_size(
+                self.crawl_concurrency,
+                self.concurrencySpinBox.value(),
+                self.videoConcurrencySpinBox.value(),
+            )
+        )
+
+    def __set_schedule(self, text: str) -> bool:
+        """returns False and leaves the schedule as it is if text is not a valid schedule"""
+        try:
+            schedule = RateSchedule.parse(text) if text.strip() else None
+        except ValueError as e:
+            self.scheduleLineEdit.setStyleSheet("color: red")
+            self.downloadProgressText.setText("Schedule not changed, {}".format(e))
+            return False
+        self.scheduleLineEdit.setStyleSheet("")
+        self.limiter.set_schedule(schedule)
+        return True
+
+    def __sync_limit_spin_box(self):
+        rate = self.limiter.rate
+        value = 0 if rate is None else max(1, rate // KB)
+        if value != self.limitSpinBox.value():
+            self.limitSpinBox.blockSignals(True)
+            self.limitSpinBox.setValue(value)
+            self.limitSpinBox.blockSignals(False)
 
     def __handle_select_type(self, obj_type: str):
         assert obj_type in [
@@ -509,10 +685,9 @@ class DownloadDialog(QtWidgets.QDialog):
             "recorded_lecture",
         ], "unexpected obj_type: {}".format(obj_type)
 
-        def is_same_type(node, obj_type: str) -> bool:
-            node_data = node.data(0, Qt.UserRole)
-            node_type = isinstance(node_data, dict) and node_data["type"]
-            node_name = isinstance(node_data, dict) and node_data["name"]
+        def is_same_type(node_data: Dict) -> bool:
+            node_type = node_data["type"]
+            node_name = node_data["name"]
             if obj_type == "file":
                 return (
                     node_type == obj_type
@@ -524,12 +699,4 @@ class DownloadDialog(QtWidgets.QDialog):
                     isinstance(node_name, str) and node_name.endswith(".mp4")
                 )
 
-        def traverse(node):
-            if is_same_type(node, obj_type):
-                node.setCheckState(0, Qt.Checked)
-            else:
-                for index in range(node.childCount()):
-                    traverse(node.child(index))
-
-        root = self.tree.invisibleRootItem()
-        traverse(root)
+        self.model.check_items(is_same_type)
@@ -0,0 +1,456 @@
+"""
+Item model for the download tree. The model works directly on the crawled download dirs, rows for
+the children of a folder are only created once the view expands it (canFetchMore/fetchMore) and
+check states are kept and propagated inside the model. Files and recorded lectures that have already
+been downloaded or ignored are filtered out by DownloadTreeProxyModel instead of being hidden one
+widget item at a time.
+
+A course can be replaced by a fresh crawl of it in place (update_course): items are matched by type
+and name, so rows are only inserted and removed where NTU Learn changed and views keep the check
+states and expansion of everything else. Courses shown from saved data are marked as stale until
+then.
+"""
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, QSortFilterProxyModel, Qt
+from PyQt5.QtGui import QFont, QIcon
+
+from ntu_learn_downloader_gui.engine import DOWNLOADABLE_TYPES, is_item_present
+from ntu_learn_downloader_gui.fs_index import DirectoryIndex, sanitise_filename
+from ntu_learn_downloader_gui.ignore_manifest import IgnoreManifest
+
+# node data dict of a row, the same dict that is part of the download dir
+NodeDataRole = Qt.UserRole
+# True for files and recorded lectures that are already present in the download directory
+HiddenRole = Qt.UserRole + 1
+
+STALE_TOOLTIP = "Saved data, checking NTU Learn for changes"
+
+NodeKey = Tuple[Tuple[str, str], int]
+
+
+def get_node_keys(nodes: Iterable[Dict]) -> List[NodeKey]:
+    """(type, name) of every node and how many nodes before it have the same ones, identifies a
+    node among its siblings across crawls
+    """
+    counts: Dict[Tuple[str, str], int] = {}
+    keys = []
+    for node in nodes:
+        key = (node["type"], node["name"])
+        keys.append((key, counts.get(key, 0)))
+        counts[key] = keys[-1][1] + 1
+    return keys
+
+
+class TreeNode:
+    __slots__ = (
+        "data",
+        "parent",
+        "row",
+        "path",
+        "is_present",
+        "check_state",
+        "hidden",
+        "_children",
+        "fetched",
+    )
+
+    def __init__(
+        self,
+        data: Dict,
+        parent: Optional["TreeNode"],
+        row: int,
+        path: str,
+        is_present: Callable[[str, Dict], bool],
+        check_state: int = Qt.Unchecked,
+    ):
+        """a row of the model
+
+        Args:
+            data (Dict): node data, for folders including the children
+            parent (Optional[TreeNode]): parent node, None for courses
+            row (int): row under the parent
+            path (str): directory the item belongs in
+            is_present (Callable[[str, Dict], bool]): returns True if the file/recorded lecture
+                with the given directory and node data has been downloaded or ignored
+            check_state (int, optional): initial check state. Defaults to Qt.Unchecked.
+        """
+        self.data = data
+        self.parent = parent
+        self.row = row
+        self.path = path
+        self.is_present = is_present
+        self.check_state = check_state
+        self.hidden = data["type"] in DOWNLOADABLE_TYPES and is_present(path, data)
+        self._children: Optional[List["TreeNode"]] = None
+        # whether the children have been announced to views
+        self.fetched = False
+
+    @property
+    def is_folder(self) -> bool:
+        return self.data["type"] == "folder"
+
+    @property
+    def children_loaded(self) -> bool:
+        return self._children is not None
+
+    @property
+    def children(self) -> List["TreeNode"]:
+        """child nodes, created on first access. Children inherit the check state of the folder"""
+        if self._children is None:
+            child_path = os.path.join(self.path, sanitise_filename(self.data["name"]))
+            child_state = Qt.Unchecked if self.check_state == Qt.Unchecked else Qt.Checked
+            self._children = [
+                TreeNode(child, self, row, child_path, self.is_present, child_state)
+                for row, child in enumerate(self.data.get("children") or [])
+            ]
+        return self._children
+
+
+class DownloadTreeModel(QAbstractItemModel):
+    def __init__(
+        self,
+        download_dir: str,
+        icons: Dict[str, QIcon],
+        fs_index: Optional[DirectoryIndex] = None,
+        ignores: Optional[IgnoreManifest] = None,
+        parent=None,
+    ):
+        """Tree model over a list of course download dirs
+
+        Args:
+            download_dir (str): download directory, courses are placed directly under it
+            icons (Dict[str, QIcon]): icon for each node type
+            fs_index (Optional[DirectoryIndex], optional): index used to find items that are
+                already present, a new one is created if not given
+            ignores (Optional[IgnoreManifest], optional): ignored items are hidden.
+                Defaults to None.
+        """
+        super(DownloadTreeModel, self).__init__(parent)
+        self.download_dir = download_dir
+        self.icons = icons
+        self.fs_index = fs_index if fs_index is not None else DirectoryIndex()
+        self.ignores = ignores
+        self.courses: List[Dict] = []
+        # names of the courses shown from saved data, until update_course replaces them
+        self.stale: Set[str] = set()
+        self._roots: List[TreeNode] = []
+        self._placeholder: Optional[TreeNode] = None
+
+    def set_courses(self, courses: List[Dict]):
+        """show courses, the list is kept and grows with insert_course"""
+        self.beginResetModel()
+        self.courses = courses
+        self._placeholder = None
+        self._roots = [
+            TreeNode(course, None, row, self.download_dir, self._is_item_present)
+            for row, course in enumerate(courses)
+        ]
+        self.endResetModel()
+
+    def insert_course(self, position: int, course: Dict):
+        """insert a course into the course list and the tree at position"""
+        if self._placeholder is not None:
+            self.set_courses(self.courses)
+        self.beginInsertRows(QModelIndex(), position, position)
+        self.courses.insert(position, course)
+        self._roots.insert(
+            position, TreeNode(course, None, position, self.download_dir, self._is_item_present)
+        )
+        for row in range(position + 1, len(self._roots)):
+            self._roots[row].row = row
+        self.endInsertRows()
+
+    def update_course(self, position: int, course: Dict):
+        """replace the course at position with a fresh crawl of the same course. Rows are inserted
+        for new items and removed for items that are gone, every other item keeps its row and check
+        state. New items are checked if their folder is
+        """
+        node = self._roots[position]
+        self.courses[position] = course
+        self.stale.discard(node.data["name"])
+        self._update_node(node, course)
+        index = self.createIndex(position, 0, node)
+        self.dataChanged.emit(index, index)
+
+    def set_stale(self, names: Iterable[str]):
+        """mark the courses with names as shown from saved data"""
+        self.stale = set(names)
+        if self._roots:
+            self.dataChanged.emit(
+                self.createIndex(0, 0, self._roots[0]),
+                self.createIndex(len(self._roots) - 1, 0, self._roots[-1]),
+                [Qt.FontRole, Qt.ToolTipRole],
+            )
+
+    def set_placeholder(self, text: str):
+        """replace the tree with a single row showing text, e.g. while loading"""
+        self.beginResetModel()
+        self.courses = []
+        self.stale = set()
+        self._roots = []
+        self._placeholder = TreeNode(
+            {"type": "placeholder", "name": text}, None, 0, "", self._is_item_present
+        )
+        self.endResetModel()
+
+    def refresh(self):
+        """rebuild the rows from the courses, picks up newly downloaded or ignored items that have
+        been added to the index
+        """
+        self.set_courses(self.courses)
+
+    def set_all_check_states(self, state: int):
+        for node in self._roots:
+            self._set_check_state_down(node, state)
+        self._emit_subtree_changed(QModelIndex(), self._roots)
+
+    def check_items(self, predicate: Callable[[Dict], bool]):
+        """check every file/recorded lecture for which predicate returns True, folders are
+        updated to match. Leaves every other item as it is
+        """
+
+        def traverse(node: TreeNode):
+            if node.is_folder:
+                for child in node.children:
+                    traverse(child)
+                self._update_folder_state(node)
+            elif predicate(node.data):
+                node.check_state = Qt.Checked
+
+        for node in self._roots:
+            traverse(node)
+        self._emit_subtree_changed(QModelIndex(), self._roots)
+
+    def checked_items(self) -> List[Tuple[str, Dict]]:
+        """returns the directory and node data of every checked, visible file/recorded lecture"""
+        result: List[Tuple[str, Dict]] = []
+
+        def traverse(node: TreeNode):
+            if node.check_state == Qt.Unchecked or node.hidden:
+                return
+            if node.is_folder:
+                for child in node.children:
+                    traverse(child)
+            else:
+                result.append((node.path, node.data))
+
+        for node in self._roots:
+            traverse(node)
+        return result
+
+    # QAbstractItemModel
+
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        nodes = self._child_nodes(parent)
+        if column != 0 or not 0 <= row < len(nodes):
+            return QModelIndex()
+        return self.createIndex(row, column, nodes[row])
+
+    def parent(self, index: QModelIndex) -> QModelIndex:  # type: ignore
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return len(self._child_nodes(parent))
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 1
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        if not parent.isValid():
+            return bool(self._roots) or self._placeholder is not None
+        node = parent.internalPointer()
+        return node.is_folder and bool(node.data.get("children"))
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        if not parent.isValid():
+            return False
+        node = parent.internalPointer()
+        return node.is_folder and not node.fetched and bool(node.data.get("children"))
+
+    def fetchMore(self, parent: QModelIndex):
+        if not self.canFetchMore(parent):
+            return
+        node = parent.internalPointer()
+        children = node.children
+        self.beginInsertRows(parent, 0, len(children) - 1)
+        node.fetched = True
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            return node.data["name"]
+        if node is self._placeholder:
+            return None
+        if role == Qt.DecorationRole:
+            return self.icons.get(node.data["type"])
+        if role == Qt.CheckStateRole:
+            return node.check_state
+        if role == NodeDataRole:
+            return node.data
+        if role == HiddenRole:
+            return node.hidden
+        if node.parent is None and node.data["name"] in self.stale:
+            if role == Qt.FontRole:
+                font = QFont()
+                font.setItalic(True)
+                return font
+            if role == Qt.ToolTipRole:
+                return STALE_TOOLTIP
+        return None
+
+    def setData(self, index: QModelIndex, value: Any, role: int = Qt.EditRole) -> bool:
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        node = index.internalPointer()
+        if node is self._placeholder:
+            return False
+        state = Qt.CheckState(value)
+        self._set_check_state_down(node, state)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        if node.children_loaded:
+            self._emit_subtree_changed(index, node.children)
+
+        ancestor = node.parent
+        while ancestor is not None:
+            self._update_folder_state(ancestor)
+            ancestor_index = self.createIndex(ancestor.row, 0, ancestor)
+            self.dataChanged.emit(ancestor_index, ancestor_index, [Qt.CheckStateRole])
+            ancestor = ancestor.parent
+        return True
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if index.internalPointer() is self._placeholder:
+            return Qt.ItemIsEnabled
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    # helpers
+
+    def _is_item_present(self, path: str, node_data: Dict) -> bool:
+        return is_item_present(self.fs_index, self.ignores, path, node_data)
+
+    def _child_nodes(self, parent: QModelIndex) -> List[TreeNode]:
+        if not parent.isValid():
+            if self._placeholder is not None:
+                return [self._placeholder]
+            return self._roots
+        node = parent.internalPointer()
+        return node.children if node.fetched else []
+
+    def _set_check_state_down(self, node: TreeNode, state: int):
+        """set the state of node and of its loaded descendants, children that are not loaded yet
+        inherit it when they are created
+        """
+        node.check_state = state
+        if node.children_loaded:
+            for child in node.children:
+                self._set_check_state_down(child, state)
+
+    def _update_folder_state(self, node: TreeNode):
+        """derive the state of a folder from its visible children"""
+        states = {child.check_state for child in node.children if not child.hidden}
+        if not states:
+            return
+        node.check_state = states.pop() if len(states) == 1 else Qt.PartiallyChecked
+
+    def _update_node(self, node: TreeNode, data: Dict):
+        """point node at data, the fresh node data of the same item"""
+        node.data = data
+        if not node.is_folder:
+            node.hidden = node.is_present(node.path, data)
+        elif node.children_loaded:
+            # children that are not loaded yet are created from the fresh data
+            self._update_children(node, data.get("children") or [])
+            self._update_folder_state(node)
+
+    def _update_children(self, node: TreeNode, new_children: List[Dict]):
+        """match the children of node to new_children, rows are only announced to views if they
+        know about the children of node
+        """
+        children = node.children
+        announce = node.fetched
+        parent = self.createIndex(node.row, 0, node) if announce else QModelIndex()
+        old_by_key = dict(zip(get_node_keys(child.data for child in children), children))
+        matched = [old_by_key.get(key) for key in get_node_keys(new_children)]
+
+        # matched children keep their rows if they are in the same order as before, the others are
+        # removed and inserted again at their new row
+        kept: Set[int] = set()
+        last_row = -1
+        for child in matched:
+            if child is not None and child.row > last_row:
+                kept.add(id(child))
+                last_row = child.row
+
+        for row in reversed(range(len(children))):
+            if id(children[row]) in kept:
+                continue
+            if announce:
+                self.beginRemoveRows(parent, row, row)
+            del children[row]
+            for following in children[row:]:
+                following.row -= 1
+            if announce:
+                self.endRemoveRows()
+
+        child_path = os.path.join(node.path, sanitise_filename(node.data["name"]))
+        child_state = Qt.Checked if node.check_state == Qt.Checked else Qt.Unchecked
+        for row, (data, child) in enumerate(zip(new_children, matched)):
+            if child is not None and id(child) in kept:
+                self._update_node(child, data)
+                continue
+            if child is None:
+                child = TreeNode(data, node, row, child_path, node.is_present, child_state)
+            else:
+                # moved, views are told about its descendants again
+                child.row = row
+                stack = [child]
+                while stack:
+                    moved = stack.pop()
+                    moved.fetched = False
+                    if moved.children_loaded:
+                        stack.extend(moved.children)
+                self._update_node(child, data)
+            if announce:
+                self.beginInsertRows(parent, row, row)
+            children.insert(row, child)
+            for following in children[row + 1 :]:
+                following.row += 1
+            if announce:
+                self.endInsertRows()
+
+        if announce and children:
+            self.dataChanged.emit(
+                self.createIndex(0, 0, children[0]),
+                self.createIndex(len(children) - 1, 0, children[-1]),
+            )
+
+    def _emit_subtree_changed(self, parent: QModelIndex, nodes: List[TreeNode]):
+        """notify views about check state changes of nodes and their rows that views know about"""
+        if not nodes or (parent.isValid() and not parent.internalPointer().fetched):
+            return
+        first = self.createIndex(0, 0, nodes[0])
+        last = self.createIndex(len(nodes) - 1, 0, nodes[-1])
+        self.dataChanged.emit(first, last, [Qt.CheckStateRole])
+        for node in nodes:
+            if node.children_loaded:
+                self._emit_subtree_changed(self.createIndex(node.row, 0, node), node.children)
+
+
+class DownloadTreeProxyModel(QSortFilterProxyModel):
+    """hides files and recorded lectures that have already been downloaded or ignored"""
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        index = self.sourceModel().index(source_row, 0, source_parent)
+        return not index.data(HiddenRole)
@@ -0,0 +1,48 @@
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt
+
+from ntu_learn_downloader_gui.gui.resources import load_layout
+from ntu_learn_downloader_gui.ignore_manifest import IgnoreManifest
+
+
+class IgnoredDialog(QtWidgets.QDialog):
+    def __init__(self, appctxt, ignores: IgnoreManifest, parent=None):
+        """Dialog listing ignored files and recorded lectures so that they can be unignored
+
+        Args:
+            appctxt (ApplicationContext): fbs application context
+            ignores (IgnoreManifest): ignore manifest of the download directory
+            parent (QtWidgets.QWidget, optional): parent widget
+        """
+        super(IgnoredDialog, self).__init__(parent)
+        load_layout(appctxt, "ignored", self)
+
+        self.ignores = ignores
+        # whether anything was unignored, the download tree needs to be rebuilt then
+        self.changed = False
+
+        self.ignoredList = self.findChild(QtWidgets.QListWidget, "ignoredList")
+        self.selectAllButton = self.findChild(QtWidgets.QPushButton, "selectAllButton")
+        self.unignoreButton = self.findChild(QtWidgets.QPushButton, "unignoreButton")
+        self.closeButton = self.findChild(QtWidgets.QPushButton, "closeButton")
+
+        self.selectAllButton.clicked.connect(self.ignoredList.selectAll)
+        self.unignoreButton.clicked.connect(self.handle_unignore)
+        self.closeButton.clicked.connect(self.accept)
+
+        self.load_entries()
+
+    def load_entries(self):
+        self.ignoredList.clear()
+        for key, _entry in self.ignores.entries():
+            item = QtWidgets.QListWidgetItem(key)
+            item.setData(Qt.UserRole, key)
+            self.ignoredList.addItem(item)
+
+    def handle_unignore(self):
+        keys = [item.data(Qt.UserRole) for item in self.ignoredList.selectedItems()]
+        if not keys:
+            return
+        self.ignores.unignore(keys)
+        self.changed = True
+        self.load_entries()
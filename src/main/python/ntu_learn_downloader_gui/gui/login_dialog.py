@@ -1,32 +1,94 @@
-from PyQt5.Qt import Qt
-from PyQt5 import QtGui, QtWidgets, uic, QtCore
+import importlib
+from typing import Optional
+
+from PyQt5 import QtWidgets, QtCore
 from PyQt5.QtCore import QThreadPool
 from PyQt5.QtGui import QCursor
 
-from ntu_learn_downloader import authenticate
-from ntu_learn_downloader_gui.gui.choose_dir_dialog import ChooseDirDialog
+from ntu_learn_downloader_gui.gui.resources import get_icon, load_layout
+from ntu_learn_downloader_gui.metrics import metrics
 from ntu_learn_downloader_gui.QtThreading import Worker
-from ntu_learn_downloader_gui.networking import get_latest_version
 from ntu_learn_downloader_gui.structs import VersionResult
 
-from typing import Optional
+# needed once the user logs in, imported in the background after the login window is shown.
+# ntu_learn_downloader pulls in requests, bs4 and lxml
+PRELOAD_MODULES = ("ntu_learn_downloader", "ntu_learn_downloader_gui.gui.choose_dir_dialog")
+
 
 def get_app_icon(appctxt):
-    return QtGui.QIcon(appctxt.get_resource("icon.png"))
+    return get_icon(appctxt, "icon.png")
 
 
 def formatted_text(text: str) -> str:
     return f"<font color='blue'><u>{text}</u></font>"
 
+
+def fetch_latest_version(version: str, test_mode: bool) -> Optional[VersionResult]:
+    # networking imports requests, keep it off the startup path
+    from ntu_learn_downloader_gui.networking import get_latest_version
+
+    return get_latest_version(version, test_mode)
+
+
+def restore_session(progress_callback):
+    """session with the saved token if it has not expired and NTU Learn still accepts it, else None
+    """
+    from ntu_learn_downloader_gui.api import check_authenticated
+    from ntu_learn_downloader_gui.credentials import TokenStore
+    from ntu_learn_downloader_gui.session import SessionManager
+
+    store = TokenStore()
+    BbRouter = store.load_valid()
+    if BbRouter is None:
+        return None
+    session = SessionManager(BbRouter)
+    try:
+        authenticated = check_authenticated(session)
+    except Exception:
+        # offline, the user can still log in once the network is back
+        authenticated = False
+    if not authenticated:
+        session.close()
+        return None
+    store.save(BbRouter)
+    return session
+
+
+def login(username: str, password: str, remember: bool, progress_callback):
+    """log in with the SSO flow, saves or forgets the token depending on remember"""
+    from ntu_learn_downloader import authenticate
+    from ntu_learn_downloader_gui.credentials import TokenStore
+    from ntu_learn_downloader_gui.session import SessionManager
+
+    with metrics.timer("phase_seconds", phase="authenticate"):
+        BbRouter = authenticate(username, password)
+    store = TokenStore()
+    if remember:
+        store.save(BbRouter)
+    else:
+        store.clear()
+    return SessionManager(BbRouter)
+
+
+def preload_modules(progress_callback):
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+
 class LoginDialog(QtWidgets.QDialog):
     def __init__(self, appctxt):
         super(LoginDialog, self).__init__()
-        uic.loadUi(appctxt.get_resource("layouts/login.ui"), self)
+        load_layout(appctxt, "login", self)
 
         self.appctxt = appctxt
 
         self.loginButton = self.findChild(QtWidgets.QPushButton, "loginButton")
         self.loginButton.clicked.connect(self.handle_login)
+        self.rememberCheckBox = self.findChild(QtWidgets.QCheckBox, "rememberCheckBox")
+        self.loginStatusLabel = self.findChild(QtWidgets.QLabel, "loginStatusLabel")
+        # busy indicator while the SSO round trips run in the background
+        self.loginProgressBar = self.findChild(QtWidgets.QProgressBar, "loginProgressBar")
+        self.loginProgressBar.hide()
+        self.main = None
         self.setWindowIcon(get_app_icon(self.appctxt))
         self.setWindowTitle("NTU Learn Downloader")
 
@@ -38,11 +100,17 @@ class LoginDialog(QtWidgets.QDialog):
         self.threadPool = QThreadPool()
         self.version = self.appctxt.build_settings['version']
         test_mode = self.appctxt.build_settings.get('test_mode', False)
-        worker = Worker(lambda progress_callback: get_latest_version(self.version, test_mode))
+        worker = Worker(lambda progress_callback: fetch_latest_version(self.version, test_mode))
         worker.signals.result.connect(self.display_latest_version)
         self.threadPool.start(worker)
 
         self.show()
+        # skip the login if the token of the last login is still valid
+        self.set_busy(True, "Signing in with the saved session...")
+        worker = Worker(restore_session)
+        worker.signals.result.connect(self.handle_session_restored)
+        self.threadPool.start(worker)
+        self.threadPool.start(Worker(preload_modules))
 
     def display_latest_version(self, latest_version: Optional[VersionResult]):
         if latest_version is None:
@@ -57,19 +125,45 @@ class LoginDialog(QtWidgets.QDialog):
             self.updateLabel.mousePressEvent = self.handle_click_update_available
 
 
+    def set_busy(self, busy: bool, status: str = ""):
+        self.loginProgressBar.setVisible(busy)
+        self.loginStatusLabel.setText(status)
+
+    def handle_session_restored(self, session):
+        if session is not None:
+            self.open_main(session)
+        elif self.main is None and self.loginButton.isEnabled():
+            # no valid saved session, unless a login is running the user has to log in
+            self.set_busy(False)
+
     def handle_login(self):
         username = self.Username.text()
         password = self.Password.text()
 
-        try:
-            BbRouter = authenticate(username, password)
-            self.main = ChooseDirDialog(self.appctxt, BbRouter)
-            self.main.show()
-            self.close()
-        except Exception:
-            alert = QtWidgets.QMessageBox()
-            alert.setText("Authentication failed")
-            alert.exec_()
+        self.loginButton.setEnabled(False)
+        self.set_busy(True, "Logging in...")
+        worker = Worker(login, username, password, self.rememberCheckBox.isChecked())
+        worker.signals.result.connect(self.open_main)
+        worker.signals.error.connect(self.handle_login_failed)
+        self.threadPool.start(worker)
+
+    def handle_login_failed(self, error):
+        self.loginButton.setEnabled(True)
+        self.set_busy(False)
+        alert = QtWidgets.QMessageBox()
+        alert.setText("Authentication failed")
+        alert.exec_()
+
+    def open_main(self, session):
+        if self.main is not None:
+            # the saved session and a login both succeeded
+            session.close()
+            return
+        from ntu_learn_downloader_gui.gui.choose_dir_dialog import ChooseDirDialog
+
+        self.main = ChooseDirDialog(self.appctxt, session.BbRouter, session)
+        self.main.show()
+        self.close()
 
     def handle_click_update_available(self, event):
         if self.latest_version is None:
@@ -0,0 +1,91 @@
+"""
+Layouts and icons for the dialogs. Parsing the Qt Designer .ui XML with uic.loadUi is one of the
+slowest steps of a cold start, so layouts are compiled to Python modules at build time:
+
+    python -m ntu_learn_downloader_gui.gui.resources
+
+writes them to ntu_learn_downloader_gui/gui/compiled, load_layout falls back to uic.loadUi for layouts
+that have not been compiled (e.g. while developing). Icons are loaded once and shared by every
+dialog.
+"""
+import functools
+import importlib
+import os
+
+from fbs_runtime.application_context import is_frozen
+from PyQt5 import QtGui, QtWidgets
+
+COMPILED_PACKAGE = "ntu_learn_downloader_gui.gui.compiled"
+COMPILED_DIR = os.path.join(os.path.dirname(__file__), "compiled")
+LAYOUTS_DIR = os.path.join(
+    os.path.dirname(__file__), *[os.pardir] * 3, "resources", "base", "layouts"
+)
+
+
+def get_compiled_module_name(layout: str) -> str:
+    return "{}_ui".format(layout)
+
+
+def load_layout(appctxt, layout: str, widget: QtWidgets.QWidget):
+    """set up widget from the layout called layout, e.g. "login" for layouts/login.ui. Like
+    uic.loadUi, child widgets become attributes of widget and slots are connected by name
+    """
+    ui_path = appctxt.get_resource("layouts/{}.ui".format(layout))
+    try:
+        module = importlib.import_module(
+            "{}.{}".format(COMPILED_PACKAGE, get_compiled_module_name(layout))
+        )
+    except ImportError:
+        module = None
+    if module is None or (
+        # while developing, a layout may have been edited since it was compiled
+        not is_frozen()
+        and os.path.getmtime(ui_path) > os.path.getmtime(module.__file__)
+    ):
+        # uic is only needed when a layout has not been compiled
+        from PyQt5 import uic
+
+        uic.loadUi(ui_path, widget)
+        return
+
+    ui_class = next(
+        value
+        for name, value in vars(module).items()
+        if name.startswith("Ui_") and isinstance(value, type)
+    )
+    ui = ui_class()
+    ui.setupUi(widget)
+    for name, value in vars(ui).items():
+        setattr(widget, name, value)
+
+
+@functools.lru_cache(maxsize=None)
+def get_icon(appctxt, resource: str) -> QtGui.QIcon:
+    """icon of an image resource, e.g. "images/folder.png", loaded once per app"""
+    return QtGui.QIcon(appctxt.get_resource(resource))
+
+
+def compile_layouts(layouts_dir: str = LAYOUTS_DIR, output_dir: str = COMPILED_DIR) -> int:
+    """compile every .ui file in layouts_dir to a module in output_dir, returns the number of
+    layouts compiled
+    """
+    from PyQt5 import uic
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "__init__.py"), "w") as f:
+        f.write('"""generated by ntu_learn_downloader_gui.gui.resources, do not edit"""\n')
+    count = 0
+    for filename in sorted(os.listdir(layouts_dir)):
+        layout, ext = os.path.splitext(filename)
+        if ext != ".ui":
+            continue
+        with open(os.path.join(layouts_dir, filename), "r") as ui_file, open(
+            os.path.join(output_dir, get_compiled_module_name(layout) + ".py"), "w"
+        ) as py_file:
+            uic.compileUi(ui_file, py_file)
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    print("compiled {} layouts to {}".format(compile_layouts(), COMPILED_DIR))
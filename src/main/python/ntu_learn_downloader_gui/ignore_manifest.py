@@ -0,0 +1,174 @@
+"""
+Ignored files and recorded lectures. Instead of a hidden .{name} dummy file next to every ignored
+item, ignores are kept in one manifest in the storage directory and looked up in memory. Dummy files
+created by earlier versions are imported once.
+"""
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from ntu_learn_downloader.storage import STORAGE_DIR
+
+from ntu_learn_downloader_gui.fs_index import sanitise_filename
+
+IGNORE_MANIFEST_FILENAME = "ignored.json"
+# empty hidden files that are not dummy files
+NOT_DUMMY_FILES = {".DS_Store", ".localized", ".keep", ".gitkeep"}
+
+
+def find_dummy_files(download_dir: str) -> List[Tuple[str, str]]:
+    """returns (directory, name) of every dummy file below download_dir, dummy files are empty
+    hidden files
+    """
+    result: List[Tuple[str, str]] = []
+    stack = [download_dir]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name != STORAGE_DIR:
+                    stack.append(entry.path)
+            elif (
+                entry.name.startswith(".")
+                and entry.name not in NOT_DUMMY_FILES
+                and entry.is_file(follow_symlinks=False)
+                and entry.stat().st_size == 0
+            ):
+                result.append((directory, entry.name[1:]))
+    return result
+
+
+class IgnoreManifest:
+    def __init__(self, storage_dir: str, download_dir: str):
+        """Manifest of ignored items stored as IGNORE_MANIFEST_FILENAME in storage_dir. Items are
+        identified by their directory relative to download_dir and their sanitised name, the same
+        way dummy files identified them
+
+        Args:
+            storage_dir (str): storage directory
+            download_dir (str): download directory
+        """
+        self.path = os.path.join(storage_dir, IGNORE_MANIFEST_FILENAME)
+        self.download_dir = download_dir
+        self._entries: Dict[str, Dict] = {}
+        imported_dummy_files = self._load()
+        if not imported_dummy_files:
+            self._import_dummy_files()
+
+    def key(self, directory: str, name: str) -> str:
+        """key of the item called name in directory"""
+        return self._key(directory, sanitise_filename(name))
+
+    def is_ignored(self, directory: str, name: str) -> bool:
+        return self.key(directory, name) in self._entries
+
+    def entries(self) -> List[Tuple[str, Dict]]:
+        """returns (key, entry) of every ignored item sorted by key, entries hold the name and
+        ignored_at time
+        """
+        return sorted(self._entries.items())
+
+    def ignore(self, items: Iterable[Tuple[str, str]], imported: bool = False):
+        """ignore items in bulk
+
+        Args:
+            items (Iterable[Tuple[str, str]]): directory and name of each item
+            imported (bool, optional): True once dummy files have been imported.
+                Defaults to False.
+        """
+        now = time.time()
+        self._add(
+            {
+                self.key(directory, name): {"name": name, "ignored_at": now}
+                for directory, name in items
+            },
+            imported,
+        )
+
+    def unignore(self, keys: Iterable[str]):
+        """stop ignoring the items with the given keys"""
+        removed = [key for key in keys if self._entries.pop(key, None) is not None]
+        self._save({}, removed, False)
+
+    def _import_dummy_files(self):
+        """dummy files were matched by their exact name, keep it instead of sanitising it again.
+        The files themselves are left in place
+        """
+        now = time.time()
+        self._add(
+            {
+                self._key(directory, name): {"name": name, "ignored_at": now}
+                for directory, name in find_dummy_files(self.download_dir)
+            },
+            imported=True,
+        )
+
+    def _key(self, directory: str, filename: str) -> str:
+        relative_dir = os.path.relpath(directory, self.download_dir)
+        parts = [] if relative_dir == os.curdir else relative_dir.split(os.sep)
+        return "/".join(parts + [filename])
+
+    def _add(self, added: Dict[str, Dict], imported: bool):
+        self._entries.update(added)
+        self._save(added, [], imported)
+
+    def _load(self) -> bool:
+        """load the manifest, returns whether dummy files have been imported already"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        self._entries = data["ignored"]
+        return data["imported_dummy_files"]
+
+    def _save(self, added: Dict[str, Dict], removed: List[str], imported: bool):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"imported_dummy_files": True, "ignored": self._entries}, f)
+        os.replace(tmp_path, self.path)
+
+
+class SQLiteIgnoreManifest(IgnoreManifest):
+    """IgnoreManifest kept in the ignored table of a SQLiteStorage database"""
+
+    def __init__(self, storage, download_dir: str):
+        self.storage = storage
+        super(SQLiteIgnoreManifest, self).__init__(storage.dir, download_dir)
+
+    def _load(self) -> bool:
+        with self.storage.transaction() as conn:
+            self._entries = {
+                key: {"name": name, "ignored_at": ignored_at}
+                for key, name, ignored_at in conn.execute(
+                    "SELECT key, name, ignored_at FROM ignored"
+                )
+            }
+            imported = (
+                conn.execute(
+                    "SELECT value FROM meta WHERE key = 'imported_dummy_files'"
+                ).fetchone()
+                is not None
+            )
+        if not imported and os.path.exists(self.path):
+            # the JSON storage was used before, take over its manifest
+            with open(self.path, "r") as f:
+                self._entries.update(json.load(f)["ignored"])
+            self._save(self._entries, [], False)
+        return imported
+
+    def _save(self, added: Dict[str, Dict], removed: List[str], imported: bool):
+        with self.storage.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO ignored (key, name, ignored_at) VALUES (?, ?, ?)",
+                ((key, e["name"], e["ignored_at"]) for key, e in added.items()),
+            )
+            conn.executemany("DELETE FROM ignored WHERE key = ?", ((key,) for key in removed))
+            if imported:
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_dummy_files', '1')"
+                )
@@ -0,0 +1,135 @@
+"""
+Persistent cache of resolved download links, keyed by predownload link. Every resolution is appended
+to a JSON lines log and flushed right away, so links resolved before a crash or a kill are not lost.
+Entries expire after a per entry TTL, AcuStudio links go stale much sooner than file links. The size
+of a file is kept with its link, a new link may point to a different file.
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, TextIO, Tuple
+
+LINK_CACHE_FILENAME = "link_cache.jsonl"
+FILE_LINK_TTL = 30 * 24 * 60 * 60
+RECORDED_LECTURE_LINK_TTL = 24 * 60 * 60
+# rewrite the log on load once it holds this many times more lines than live entries
+COMPACT_RATIO = 2
+MIN_COMPACT_LINES = 256
+
+
+def get_link_ttl(node_type: str) -> int:
+    return RECORDED_LECTURE_LINK_TTL if node_type == "recorded_lecture" else FILE_LINK_TTL
+
+
+class LinkCache:
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        """Load the cache log at path if present. Safe to use from several threads at the same time
+
+        Args:
+            path (str): cache log, usually LINK_CACHE_FILENAME in the storage directory
+            clock (Callable[[], float], optional): time source, entries outlive the process so this
+                has to be wall clock time. Defaults to time.time.
+        """
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        num_lines = self._load()
+        if num_lines >= MIN_COMPACT_LINES and num_lines > COMPACT_RATIO * len(self._entries):
+            self._compact()
+        # opened on the first write, nothing is created for a cache that is only read
+        self._file: Optional[TextIO] = None
+
+    def get(self, predownload_link: str) -> Optional[Tuple[str, str]]:
+        """returns the cached (download_link, filename), None if not cached or expired"""
+        with self._lock:
+            entry = self._entries.get(predownload_link)
+            if entry is None or self._is_expired(entry):
+                return None
+            return entry["download_link"], entry["filename"]
+
+    def put(self, predownload_link: str, download_link: str, filename: str, ttl: int):
+        """record a resolved link, it is on disk once this returns"""
+        entry = {
+            "predownload_link": predownload_link,
+            "download_link": download_link,
+            "filename": filename,
+            "resolved_at": self.clock(),
+            "ttl": ttl,
+        }
+        with self._lock:
+            self._entries[predownload_link] = entry
+            self._append(entry)
+
+    def get_size(self, predownload_link: str) -> Optional[int]:
+        """returns the cached size in bytes of the file behind the cached link, None if not known"""
+        with self._lock:
+            entry = self._entries.get(predownload_link)
+            if entry is None or self._is_expired(entry):
+                return None
+            return entry.get("size")
+
+    def set_size(self, predownload_link: str, download_link: str, size: int):
+        """record the size of the file behind download_link if that is the cached link, the entry
+        keeps its expiry
+        """
+        with self._lock:
+            entry = self._entries.get(predownload_link)
+            if entry is None or entry["download_link"] != download_link:
+                return
+            entry = dict(entry, size=size)
+            self._entries[predownload_link] = entry
+            self._append(entry)
+
+    def invalidate(self, predownload_link: str):
+        """drop a link that turned out to be stale"""
+        with self._lock:
+            if self._entries.pop(predownload_link, None) is not None:
+                self._append({"predownload_link": predownload_link, "download_link": None})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _is_expired(self, entry: Dict) -> bool:
+        return self.clock() - entry["resolved_at"] >= entry["ttl"]
+
+    def _append(self, entry: Dict):
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def _load(self) -> int:
+        """replay the log, later lines win. Returns the number of lines read"""
+        if not os.path.isfile(self.path):
+            return 0
+        num_lines = 0
+        with open(self.path, "r") as f:
+            for line in f:
+                num_lines += 1
+                try:
+                    entry = json.loads(line)
+                    predownload_link = entry["predownload_link"]
+                except (ValueError, KeyError, TypeError):
+                    # a line cut short by a crash, everything before it is still valid
+                    continue
+                if entry.get("download_link") is None:
+                    self._entries.pop(predownload_link, None)
+                else:
+                    self._entries[predownload_link] = entry
+        return num_lines
+
+    def _compact(self):
+        """rewrite the log with only the live entries"""
+        self._entries = {
+            link: entry for link, entry in self._entries.items() if not self._is_expired(entry)
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
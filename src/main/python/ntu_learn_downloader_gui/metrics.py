@@ -0,0 +1,228 @@
+"""
+Local performance metrics. Timings, counters and histograms of every phase of a session (login,
+course list, crawl, link resolution, transfers) are recorded in one registry per process and written
+to a JSON or Prometheus text file, nothing is sent anywhere. Used by the GUI and the command line
+alike, nothing in here imports PyQt5.
+
+Metric names follow the Prometheus conventions: counters end in _total, timings are in seconds.
+"""
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# request latency and phase timings, in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# transfer throughput, in bytes per second
+THROUGHPUT_BUCKETS = tuple(2 ** exponent * 1024 for exponent in range(4, 17, 2))
+# items waiting in a queue
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+# next to the storage of a download directory, one file per session
+METRICS_DIRNAME = "metrics"
+# files with these extensions are written in the Prometheus text format, anything else as JSON
+PROMETHEUS_EXTENSIONS = (".prom", ".txt")
+PROMETHEUS_PREFIX = "ntu_learn_downloader_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def make_labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_prometheus_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(key, value.replace("\\", "\\\\").replace('"', '\\"'))
+            for key, value in pairs
+        )
+    )
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        """Counts of observations per bucket, bucket i counts the values up to buckets[i] that are
+        larger than buckets[i - 1]
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        idx = next(
+            (i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets)
+        )
+        self.counts[idx] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def cumulative_counts(self) -> List[Tuple[str, int]]:
+        """(upper bound, observations up to it) of every bucket, Prometheus style"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else "{:g}".format(bound), total))
+        return result
+
+
+class Metrics:
+    def __init__(self, clock=time.time):
+        """Registry of counters and histograms, safe to use from several threads at the same time
+
+        Args:
+            clock (optional): wall clock for the session timestamps. Defaults to time.time.
+        """
+        self.clock = clock
+        self.started_at = clock()
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """add value to the counter name with labels"""
+        key = (name, make_labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(
+        self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels
+    ):
+        """record a value in the histogram name with labels, buckets only apply to a new histogram"""
+        key = (name, make_labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """observe the seconds the block takes in the histogram name, also if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def count_cache(self, cache: str, hit: bool):
+        """record a cache lookup, see cache_hit_rates"""
+        self.inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+    def cache_hit_rates(self) -> Dict[str, float]:
+        """share of the lookups of every cache that were hits"""
+        lookups: Dict[str, List[float]] = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                if name != "cache_requests_total":
+                    continue
+                label_dict = dict(labels)
+                hits_total = lookups.setdefault(label_dict.get("cache", ""), [0, 0])
+                hits_total[1] += value
+                if label_dict.get("result") == "hit":
+                    hits_total[0] += value
+        return {cache: hits / total for cache, (hits, total) in lookups.items() if total}
+
+    def reset(self):
+        with self._lock:
+            self.started_at = self.clock()
+            self._counters.clear()
+            self._histograms.clear()
+
+    @property
+    def session_filename(self) -> str:
+        """name of the file of this session, e.g. session-20201005-093000-1234.json"""
+        started = datetime.datetime.fromtimestamp(self.started_at)
+        return "session-{:%Y%m%d-%H%M%S}-{}.json".format(started, os.getpid())
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "min": histogram.min,
+                    "max": histogram.max,
+                    "buckets": dict(histogram.cumulative_counts()),
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {
+            "started_at": datetime.datetime.fromtimestamp(self.started_at).isoformat(),
+            "written_at": datetime.datetime.fromtimestamp(self.clock()).isoformat(),
+            "counters": counters,
+            "histograms": histograms,
+            "cache_hit_rates": self.cache_hit_rates(),
+        }
+
+    def to_prometheus(self) -> str:
+        """the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            names = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                full_name = PROMETHEUS_PREFIX + name
+                if full_name not in names:
+                    names.add(full_name)
+                    lines.append("# TYPE {} counter".format(full_name))
+                lines.append(
+                    "{}{} {:g}".format(full_name, format_prometheus_labels(labels), value)
+                )
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                full_name = PROMETHEUS_PREFIX + name
+                if full_name not in names:
+                    names.add(full_name)
+                    lines.append("# TYPE {} histogram".format(full_name))
+                for bound, count in histogram.cumulative_counts():
+                    lines.append(
+                        "{}_bucket{} {}".format(
+                            full_name, format_prometheus_labels(labels, (("le", bound),)), count
+                        )
+                    )
+                lines.append(
+                    "{}_sum{} {:g}".format(
+                        full_name, format_prometheus_labels(labels), histogram.sum
+                    )
+                )
+                lines.append(
+                    "{}_count{} {}".format(
+                        full_name, format_prometheus_labels(labels), histogram.count
+                    )
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """write the metrics to path, in the Prometheus text format if the extension is one of
+        PROMETHEUS_EXTENSIONS and as JSON otherwise. The file is replaced atomically
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.splitext(path)[1].lower() in PROMETHEUS_EXTENSIONS:
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+# shared by the whole process
+metrics = Metrics()
@@ -1,18 +1,188 @@
-import requests
-from ntu_learn_downloader_gui.structs import VersionResult
-from typing import Optional
+"""
+Telemetry and version check against the app's server. Telemetry never blocks the caller: events go
+through a queue to a background thread that sends them in batches with strict timeouts, and events
+that could not be sent are kept in a bounded spool on disk until the server is reachable again. The
+latest release is cached for a day, so startup does not wait on the server.
+"""
+import atexit
 import json
+import os
+import queue
+import threading
+import time
 import traceback
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from ntu_learn_downloader_gui.metrics import metrics
+from ntu_learn_downloader_gui.structs import VersionResult
 
 SERVER_HOST_URL = "http://ntulearndownloader.xyz"
 # SERVER_HOST_URL = "http://localhost:5000"
 
+# (connect, read) timeouts in seconds, the server is only ever contacted in the background
+REQUEST_TIMEOUT = (3.05, 10)
+
+# per user, shared by all download directories
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".ntu_learn_downloader")
+SPOOL_FILENAME = "telemetry_spool.jsonl"
+VERSION_CACHE_FILENAME = "latest_version.json"
+
+# events sent together, and seconds the first event of a batch waits for more
+BATCH_SIZE = 20
+BATCH_WINDOW = 2.0
+# oldest events are dropped beyond this many unsent events
+MAX_SPOOLED_EVENTS = 500
+# seconds without sending anything after the server could not be reached
+RETRY_INTERVAL = 5 * 60
+# seconds the process waits at exit for queued events to be sent or spooled
+EXIT_FLUSH_TIMEOUT = 1.0
+
+VERSION_CACHE_TTL = 24 * 60 * 60
+
+# keep-alive connection to the telemetry server, shared by all calls below
+session = requests.Session()
+
+
+def coalesce(events: List[Dict]) -> List[Dict]:
+    """merge the successful download counts of the same version into one event, in order"""
+    result: List[Dict] = []
+    downloads: Dict[str, Dict] = {}
+    for event in events:
+        if event["endpoint"] != "/download":
+            result.append(event)
+            continue
+        version = event["data"]["version"]
+        merged = downloads.get(version)
+        if merged is None:
+            merged = downloads[version] = {"endpoint": "/download", "data": dict(event["data"])}
+            result.append(merged)
+        else:
+            merged["data"]["numFiles"] += event["data"]["numFiles"]
+    return result
+
+
+class TelemetryClient:
+    def __init__(
+        self,
+        spool_path: Optional[str],
+        host: str = SERVER_HOST_URL,
+        http: Optional[requests.Session] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Sends events to the server from a background thread, started by the first event
+
+        Args:
+            spool_path (Optional[str]): file for events that could not be sent, None to drop them
+            host (str, optional): server URL. Defaults to SERVER_HOST_URL.
+            http (Optional[requests.Session], optional): session used to send. Defaults to the
+                shared session.
+            clock (Callable[[], float], optional): time source. Defaults to time.monotonic.
+        """
+        self.spool_path = spool_path
+        self.host = host
+        self.http = http or session
+        self.clock = clock
+        self._queue: "queue.Queue[Dict]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._unsent: Optional[List[Dict]] = None  # loaded from the spool by the thread
+        self._retry_at: Optional[float] = None
+
+    def post(self, endpoint: str, data: Dict):
+        """queue an event for endpoint, returns right away"""
+        self._queue.put({"endpoint": endpoint, "data": data})
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """wait until every queued event was sent or spooled, returns False on timeout"""
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, timeout
+            )
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_WINDOW
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._send_batch(batch)
+            except Exception:
+                # telemetry must never take anything down with it
+                pass
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send_batch(self, batch: List[Dict]):
+        if self._unsent is None:
+            self._unsent = self._read_spool()
+        unsent = coalesce(self._unsent + batch)
+        if self._retry_at is not None and self.clock() < self._retry_at:
+            self._spool(unsent)
+            return
+        for idx, event in enumerate(unsent):
+            try:
+                response = self.http.post(
+                    self.host + event["endpoint"], data=event["data"], timeout=REQUEST_TIMEOUT
+                )
+                if response.status_code >= 500:
+                    raise requests.HTTPError(response.status_code)
+            except requests.RequestException:
+                self._retry_at = self.clock() + RETRY_INTERVAL
+                self._spool(unsent[idx:])
+                return
+            metrics.inc("telemetry_events_total", result="sent")
+        self._retry_at = None
+        self._spool([])
+
+    def _read_spool(self) -> List[Dict]:
+        if self.spool_path is None:
+            return []
+        try:
+            with open(self.spool_path) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return []
+
+    def _spool(self, events: List[Dict]):
+        dropped = max(0, len(events) - MAX_SPOOLED_EVENTS)
+        if dropped:
+            metrics.inc("telemetry_events_total", dropped, result="dropped")
+        # in memory as well, the spool file may not be writable
+        had_events = bool(self._unsent)
+        self._unsent = events[dropped:]
+        if self.spool_path is None or not (self._unsent or had_events):
+            return
+        try:
+            os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+            tmp_path = self.spool_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.writelines(json.dumps(event) + "\n" for event in self._unsent)
+            os.replace(tmp_path, self.spool_path)
+        except OSError:
+            pass
+
+
+telemetry = TelemetryClient(os.path.join(APP_DATA_DIR, SPOOL_FILENAME))
+atexit.register(telemetry.flush, EXIT_FLUSH_TIMEOUT)
+
 
 def post_error(error_trace: str, version: str, test_mode: bool):
     data = {"trace": error_trace, "version": version}
     if test_mode:
         print("DEBUG: POST /error, data:", data)
-    requests.post(SERVER_HOST_URL + "/error", data=data)
+    else:
+        telemetry.post("/error", data)
 
 
 def post_successful_download(numDownloaded: int, version: str, test_mode: bool):
@@ -20,29 +190,74 @@ def post_successful_download(numDownloaded: int, version: str, test_mode: bool):
     if test_mode:
         print("DEBUG: POST /download, data:", data)
     else:
-        requests.post(SERVER_HOST_URL + "/download", data=data)
+        telemetry.post("/download", data)
 
 
-def get_latest_version(version: str, test_mode: bool) -> Optional[VersionResult]:
+def parse_release(data: Dict) -> VersionResult:
+    return VersionResult(
+        version=data["version"],
+        date=data["date"],
+        link=data["link"],
+        title=data["title"],
+        content=data["content"],
+    )
+
+
+def read_version_cache(cache_path: str) -> Optional[Dict]:
+    """the cached {"fetched_at": ..., "release": ...}, None if there is none"""
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        parse_release(cached["release"])
+        float(cached["fetched_at"])
+        return cached
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def write_version_cache(cache_path: str, release: Dict, fetched_at: float):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fetched_at": fetched_at, "release": release}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def get_latest_version(
+    version: str,
+    test_mode: bool,
+    cache_path: str = os.path.join(APP_DATA_DIR, VERSION_CACHE_FILENAME),
+    clock: Callable[[], float] = time.time,
+) -> Optional[VersionResult]:
+    """the latest release, from the cache if it was fetched less than VERSION_CACHE_TTL ago. An
+    expired cache entry is still returned if the server cannot be reached
+    """
     if test_mode:
         raise ValueError("This method should be mocked")
-    response = requests.get(SERVER_HOST_URL + "/releases/latest")
+    cached = read_version_cache(cache_path)
+    now = clock()
+    if cached is not None and 0 <= now - cached["fetched_at"] < VERSION_CACHE_TTL:
+        return parse_release(cached["release"])
+    stale = parse_release(cached["release"]) if cached is not None else None
+
+    try:
+        response = session.get(SERVER_HOST_URL + "/releases/latest", timeout=REQUEST_TIMEOUT)
+    except requests.RequestException:
+        return stale
     if response.status_code != 200:
         post_error(
             f"GET /releases/latest failed with {response.status_code}: {str(response.content)}",
             version,
             test_mode,
         )
-        return None
+        return stale
+    data = None
     try:
         data = json.loads(response.content)
-        return VersionResult(
-            version=data["version"],
-            date=data["date"],
-            link=data["link"],
-            title=data["title"],
-            content=data["content"],
-        )
+        result = parse_release(data)
     except Exception:
         trace = traceback.format_exc()
         error_message = "\n".join(
@@ -53,5 +268,6 @@ def get_latest_version(version: str, test_mode: bool) -> Optional[VersionResult]
             ]
         )
         post_error(error_message, version, test_mode)
-    return None
-
+        return stale
+    write_version_cache(cache_path, data, now)
+    return result
@@ -0,0 +1,118 @@
+"""
+On-disk cache of crawled listContent pages. For every page the validators of the last response
+(ETag, Last-Modified), a hash of its body and the models parsed from it are kept, so that a page that
+has not changed since the last Reload costs a round trip but is neither downloaded in full (when the
+server answers conditional requests) nor parsed again (when only the body hash matches).
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ntu_learn_downloader.models import MODEL_TYPES, Doc, Folder, RecordedLecture
+
+PAGE_CACHE_DIRNAME = "page_cache"
+
+
+def model_to_dict(model: MODEL_TYPES) -> Dict:
+    if isinstance(model, Folder):
+        return {
+            "type": "folder",
+            "name": model.name,
+            "link": model.link,
+            "details": model.details,
+            "children": [model_to_dict(c) for c in model.children]
+            if model.children is not None
+            else None,
+        }
+    elif isinstance(model, Doc):
+        return {"type": "file", "name": model.name, "link": model.link}
+    elif isinstance(model, RecordedLecture):
+        return {
+            "type": "recorded_lecture",
+            "name": model.name,
+            "predownload_link": model.predownload_link,
+        }
+    raise ValueError("unexpected model: {}".format(model))
+
+
+def dict_to_model(data: Dict) -> MODEL_TYPES:
+    node_type = data["type"]
+    if node_type == "folder":
+        return Folder(
+            name=data["name"],
+            link=data["link"],
+            details=data["details"],
+            children=[dict_to_model(c) for c in data["children"]]
+            if data["children"] is not None
+            else None,
+        )
+    elif node_type == "file":
+        return Doc(name=data["name"], link=data["link"])
+    elif node_type == "recorded_lecture":
+        return RecordedLecture(name=data["name"], predownload_link=data["predownload_link"])
+    raise ValueError("unexpected node type: {}".format(node_type))
+
+
+def hash_body(content: bytes) -> str:
+    return hashlib.sha1(content).hexdigest()
+
+
+class PageCache:
+    def __init__(self, cache_dir: str):
+        """Pages are stored one file each, so concurrent crawl requests never write the same file
+
+        Args:
+            cache_dir (str): directory for the cache, usually PAGE_CACHE_DIRNAME in the storage
+                directory
+        """
+        self.dir = cache_dir
+
+    def get(self, course_id: str, content_id: str) -> Optional[Dict]:
+        """returns the entry of a page with the keys etag, last_modified, body_hash and models,
+        None if the page is not cached
+        """
+        try:
+            with open(self._path(course_id, content_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get_headers(self, entry: Optional[Dict]) -> Dict[str, str]:
+        """conditional request headers for a cached page"""
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(
+        self,
+        course_id: str,
+        content_id: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        body_hash: str,
+        models: List[MODEL_TYPES],
+    ):
+        entry = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "body_hash": body_hash,
+            "models": [model_to_dict(m) for m in models],
+        }
+        Path(self.dir).mkdir(parents=True, exist_ok=True)
+        path = self._path(course_id, content_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def get_models(self, entry: Dict) -> List[MODEL_TYPES]:
+        return [dict_to_model(m) for m in entry["models"]]
+
+    def _path(self, course_id: str, content_id: str) -> str:
+        return os.path.join(self.dir, "{}_{}.json".format(course_id, content_id))
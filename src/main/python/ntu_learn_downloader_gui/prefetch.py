@@ -0,0 +1,165 @@
+"""
+Speculative work right after login. The course list is fetched once, and if a default download
+directory is saved, the modules that ChooseDirDialog will check by default are crawled while the user
+is still looking at them. The DownloadDialog that opens for the same directory and modules takes over
+the engine and the crawl, whether it is still running or done. Nothing in here imports PyQt5.
+"""
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ntu_learn_downloader_gui.api import get_courses
+from ntu_learn_downloader_gui.crawler import DEFAULT_CRAWL_CONCURRENCY
+from ntu_learn_downloader_gui.engine import SyncEngine
+from ntu_learn_downloader_gui.session import SessionManager
+from ntu_learn_downloader_gui.storage import DEFAULT_STORAGE_BACKEND
+
+
+def get_default_modules(
+    courses: List[Tuple[str, str]], module_ids: Optional[List[str]]
+) -> List[Tuple[str, str]]:
+    """courses checked by default in ChooseDirDialog: the saved ones, or all if none are saved"""
+    if not module_ids:
+        return list(courses)
+    return [(name, course_id) for name, course_id in courses if course_id in module_ids]
+
+
+class Prefetcher:
+    def __init__(
+        self,
+        session: SessionManager,
+        download_dir: Optional[str] = None,
+        module_ids: Optional[List[str]] = None,
+        storage_backend: str = DEFAULT_STORAGE_BACKEND,
+        crawl_concurrency: int = DEFAULT_CRAWL_CONCURRENCY,
+    ):
+        """Fetch the courses and crawl the default modules in the background, see start
+
+        Args:
+            session (SessionManager): authenticated session
+            download_dir (Optional[str], optional): saved default download directory, nothing is
+                crawled without one. Defaults to None.
+            module_ids (Optional[List[str]], optional): saved default module ids. Defaults to None.
+            storage_backend (str, optional): one of storage.STORAGE_BACKENDS.
+                Defaults to DEFAULT_STORAGE_BACKEND.
+            crawl_concurrency (int, optional): maximum number of concurrent requests while
+                crawling. Defaults to DEFAULT_CRAWL_CONCURRENCY.
+        """
+        self.session = session
+        self.download_dir = download_dir
+        self.module_ids = module_ids
+        self.storage_backend = storage_backend
+        self.crawl_concurrency = crawl_concurrency
+        # sorted course name and course id tuples of the user
+        self.courses: "Future[List[Tuple[str, str]]]" = Future()
+        # modules being crawled, set once the courses are known and None if nothing is crawled
+        self.modules: Optional[List[Tuple[str, str]]] = None
+        self._engine: "Future[Optional[SyncEngine]]" = Future()
+        self._crawl: "Future[Optional[List[Dict]]]" = Future()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._taken = False
+        self._released = False
+        # courses crawled so far by module index, replayed to the callback of attach
+        self._crawled: Dict[int, Dict] = {}
+        self._callback: Optional[Callable[[int, Dict], None]] = None
+
+    def start(self):
+        threading.Thread(target=self._run, name="prefetch", daemon=True).start()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def matches(self, download_dir: str, modules: List[Tuple[str, str]]) -> bool:
+        """whether the crawl is the one of modules in download_dir, in the same order"""
+        return (
+            not self.cancelled
+            and self.modules is not None
+            and download_dir == self.download_dir
+            and list(modules) == self.modules
+        )
+
+    def cancel(self):
+        """stop crawling, the engine is closed unless it was taken"""
+        self._cancelled.set()
+        self._release()
+
+    def take_engine(self) -> Optional[SyncEngine]:
+        """the engine of the crawl, owned by the caller from now on. Blocks until the storage is
+        open, which can take a while on a large download dir, so do not call it on the GUI thread.
+        None if nothing is crawled, the prefetch was cancelled or the storage failed to open
+        """
+        try:
+            engine = self._engine.result()
+        except Exception:
+            return None
+        with self._lock:
+            if engine is None or self.cancelled or self._taken:
+                return None
+            self._taken = True
+        return engine
+
+    def attach(self, callback: Optional[Callable[[int, Dict], None]] = None) -> List[Dict]:
+        """call callback with every course crawled so far and with the rest as they are done, then
+        return the result of the crawl, see SyncEngine.crawl. Blocks until the crawl is done
+
+        Raises:
+            CrawlCancelled: the prefetch was cancelled
+        """
+        with self._lock:
+            self._callback = callback
+            crawled = sorted(self._crawled.items())
+        if callback is not None:
+            for idx, course in crawled:
+                callback(idx, course)
+        return self._crawl.result()
+
+    def _run(self):
+        try:
+            courses = sorted(get_courses(self.session))
+        except Exception as e:
+            for future in (self.courses, self._engine, self._crawl):
+                future.set_exception(e)
+            return
+        self.courses.set_result(courses)
+
+        if self.cancelled or not self.download_dir or not os.path.isdir(self.download_dir):
+            self._engine.set_result(None)
+            self._crawl.set_result(None)
+            return
+        modules = get_default_modules(courses, self.module_ids)
+        self.modules = modules
+        try:
+            engine = SyncEngine(
+                self.session, self.download_dir, self.storage_backend, self.crawl_concurrency
+            )
+        except Exception as e:
+            self._engine.set_exception(e)
+            self._crawl.set_exception(e)
+            return
+        self._engine.set_result(engine)
+
+        try:
+            self._crawl.set_result(engine.crawl(modules, self._handle_course, self._cancelled))
+        except Exception as e:
+            self._crawl.set_exception(e)
+        self._release()
+
+    def _handle_course(self, idx: int, course: Dict):
+        with self._lock:
+            self._crawled[idx] = course
+            callback = self._callback
+        if callback is not None:
+            callback(idx, course)
+
+    def _release(self):
+        """close the engine of a cancelled prefetch once its crawl is over"""
+        with self._lock:
+            if not self.cancelled or self._taken or self._released or not self._crawl.done():
+                return
+            self._released = True
+        if self._engine.exception() is None and self._engine.result() is not None:
+            # saving could overwrite what the DownloadDialog of this directory saved meanwhile
+            self._engine.result().close(save=False)
@@ -0,0 +1,226 @@
+"""
+Progress aggregation between worker threads and the UI. Byte counts are accumulated under a lock in
+the worker threads and published as snapshots at a fixed rate, instead of crossing over to the GUI
+thread for every chunk that is received. ByteProgress turns the snapshots of a batch into progress
+weighted by bytes and an ETA.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional
+
+DEFAULT_PUBLISH_INTERVAL = 0.1  # 10 Hz
+# weight of the newest sample in the smoothed throughput
+RATE_SMOOTHING = 0.3
+
+
+class TransferSnapshot(NamedTuple):
+    key: Hashable
+    label: str
+    bytes_done: int
+    total: Optional[int]
+    rate: float  # bytes/s
+
+
+class ProgressSnapshot(NamedTuple):
+    transfers: List[TransferSnapshot]  # transfers that are still running
+    events: List[Any]  # discrete events reported since the last snapshot, in order
+    total_bytes: int  # bytes received by all transfers so far, not counting resumed bytes
+    rate: float  # aggregate bytes/s
+
+
+class _Transfer:
+    def __init__(self, label: str, bytes_done: int):
+        self.label = label
+        self.bytes_done = bytes_done
+        self.total: Optional[int] = None
+        self.sampled_bytes = bytes_done
+        self.rate = 0.0
+
+
+def smooth(previous: float, sample: float) -> float:
+    return sample if previous == 0 else (
+        RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * previous
+    )
+
+
+class ProgressAggregator:
+    def __init__(
+        self,
+        publish: Callable[[ProgressSnapshot], None],
+        interval: float = DEFAULT_PUBLISH_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Collects progress from any number of threads and calls publish with a ProgressSnapshot at
+        most once every interval seconds. Safe to call from several threads at the same time.
+
+        Args:
+            publish (Callable[[ProgressSnapshot], None]): receives snapshots, e.g. a Qt signal's emit
+            interval (float, optional): minimum seconds between snapshots.
+                Defaults to DEFAULT_PUBLISH_INTERVAL.
+            clock (Callable[[], float], optional): time source. Defaults to time.monotonic.
+        """
+        self.publish = publish
+        self.interval = interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._transfers: Dict[Hashable, _Transfer] = {}
+        self._events: List[Any] = []
+        self._total_bytes = 0
+        self._published_total_bytes = 0
+        self._sampled_total_bytes = 0
+        self._rate = 0.0
+        self._last_publish = self._last_sample = clock()
+
+    def update(self, key: Hashable, label: str, bytes_done: int, total: Optional[int] = None):
+        """record the number of bytes a transfer has received so far. The first update of a
+        transfer sets where it starts, e.g. the offset a partial file is resumed from, those bytes
+        are not counted as received
+
+        Args:
+            key (Hashable): identifies the transfer
+            label (str): display name of the transfer
+            bytes_done (int): bytes received so far, including earlier attempts
+            total (Optional[int], optional): expected size, None if not known
+        """
+        with self._lock:
+            transfer = self._transfers.get(key)
+            if transfer is None:
+                transfer = self._transfers[key] = _Transfer(label, bytes_done)
+            self._total_bytes += bytes_done - transfer.bytes_done
+            transfer.bytes_done = bytes_done
+            transfer.total = total
+            self._publish_if_due()
+
+    def event(self, data: Any, key: Optional[Hashable] = None):
+        """record a discrete event (e.g. a transfer completed). Events are never coalesced, every
+        event is delivered exactly once with the next snapshot
+
+        Args:
+            data (Any): event payload
+            key (Optional[Hashable], optional): transfer that has finished and should no longer be
+                reported as running
+        """
+        with self._lock:
+            self._events.append(data)
+            if key is not None:
+                self._transfers.pop(key, None)
+            self._publish_if_due()
+
+    def flush(self):
+        """publish a snapshot now if anything is pending, call once the work is done"""
+        with self._lock:
+            if self._events or self._total_bytes != self._published_total_bytes:
+                self._publish()
+
+    def _publish_if_due(self):
+        if self.clock() - self._last_publish >= self.interval:
+            self._publish()
+
+    def _publish(self):
+        now = self.clock()
+        elapsed = now - self._last_sample
+        # forced publishes shortly after the last one keep the previous throughput, a sample over a
+        # very short window is mostly noise
+        sample_rates = elapsed >= self.interval
+        transfers = []
+        for key, transfer in self._transfers.items():
+            if sample_rates:
+                sample = (transfer.bytes_done - transfer.sampled_bytes) / elapsed
+                transfer.rate = smooth(transfer.rate, sample)
+                transfer.sampled_bytes = transfer.bytes_done
+            transfers.append(
+                TransferSnapshot(
+                    key, transfer.label, transfer.bytes_done, transfer.total, transfer.rate
+                )
+            )
+        if sample_rates:
+            sample = (self._total_bytes - self._sampled_total_bytes) / elapsed
+            self._rate = smooth(self._rate, sample)
+            self._sampled_total_bytes = self._total_bytes
+            self._last_sample = now
+        self._published_total_bytes = self._total_bytes
+
+        events, self._events = self._events, []
+        self._last_publish = now
+        # publish while holding the lock so that snapshots are delivered in order
+        self.publish(ProgressSnapshot(transfers, events, self._total_bytes, self._rate))
+
+
+def format_duration(seconds: float) -> str:
+    """human readable duration, e.g. 45 s, 12 min or 1 h 5 min"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return "{} s".format(seconds)
+    minutes = (seconds + 30) // 60
+    if minutes < 60:
+        return "{} min".format(minutes)
+    return "{} h {} min".format(*divmod(minutes, 60))
+
+
+class ByteProgress:
+    def __init__(self, keys: Iterable[Hashable]):
+        """Progress of a batch of transfers weighted by bytes, used from a single thread. Sizes come
+        from probes (set_size) or from the transfers themselves, transfers of unknown size count as
+        the average known size. Skipped and failed transfers drop out of the batch
+
+        Args:
+            keys (Iterable[Hashable]): the transfers of the batch
+        """
+        self._pending = set(keys)
+        self._count = len(self._pending)
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes_done: Dict[Hashable, int] = {}
+        self._finished_bytes = 0
+        self._eta: Optional[float] = None
+
+    def set_size(self, key: Hashable, size: Optional[int]):
+        if size is not None and key in self._pending:
+            self._sizes[key] = size
+
+    def update(self, transfers: Iterable[TransferSnapshot]):
+        """record the bytes received by running transfers, their totals replace probed sizes"""
+        for transfer in transfers:
+            if transfer.key not in self._pending:
+                continue
+            self._bytes_done[transfer.key] = transfer.bytes_done
+            if transfer.total:
+                self._sizes[transfer.key] = transfer.total
+
+    def finish(self, key: Hashable, completed: bool):
+        """a transfer ended, completed transfers count with the bytes they received"""
+        if key not in self._pending:
+            return
+        self._pending.discard(key)
+        size = self._sizes.pop(key, 0)
+        bytes_done = self._bytes_done.pop(key, 0)
+        if completed:
+            self._finished_bytes += max(size, bytes_done)
+
+    @property
+    def bytes_done(self) -> int:
+        return self._finished_bytes + sum(self._bytes_done.values())
+
+    @property
+    def total(self) -> Optional[int]:
+        """expected bytes of the batch, None while no size is known"""
+        if not self._sizes:
+            return None if self._pending else self._finished_bytes
+        average = sum(self._sizes.values()) / len(self._sizes)
+        unknown = len(self._pending) - len(self._sizes)
+        return self._finished_bytes + sum(self._sizes.values()) + int(unknown * average)
+
+    @property
+    def fraction(self) -> float:
+        """share of the batch that is done, by transfer count while no size is known"""
+        total = self.total
+        if total is None:
+            return 1 - len(self._pending) / self._count if self._count else 1.0
+        return min(1.0, self.bytes_done / total) if total else 1.0
+
+    def eta(self, rate: float) -> Optional[float]:
+        """smoothed seconds until the batch is done at rate bytes/s, None if not known"""
+        total = self.total
+        if total is None or rate < 1:
+            return self._eta
+        self._eta = smooth(self._eta or 0.0, max(0, total - self.bytes_done) / rate)
+        return self._eta
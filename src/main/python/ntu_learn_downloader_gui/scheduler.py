@@ -0,0 +1,610 @@
+"""
+Concurrent download scheduler. Resolves download links and downloads files with a bounded number of
+parallel transfers, so that one large file does not hold up every file queued behind it. Link
+resolution runs as its own stage ahead of the transfers.
+
+Documents and videos run in separate lanes, each with its own resolvers, queue and transfer threads,
+so that a batch of lecture videos never holds up the slides listed after them.
+
+Optionally the size of every item is probed up front with HEAD requests, so that progress can be
+weighted by bytes. Probes and lane resolvers share one link lookup per item.
+
+Transient failures (timeouts, lost connections, server errors) put an item back into its lane after
+an exponential backoff with jitter, only failures that are permanent or out of retries are reported
+as FAILED.
+"""
+import heapq
+import os
+import queue
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from ntu_learn_downloader.utils import get_filename_from_url
+
+from ntu_learn_downloader_gui.api import (
+    DEFAULT_SEGMENTS,
+    IncompleteDownloadError,
+    download,
+    get_content_length,
+    get_file_download_link,
+    get_recorded_lecture_download_link,
+)
+from ntu_learn_downloader_gui.fs_index import DirectoryIndex, sanitise_filename
+from ntu_learn_downloader_gui.link_cache import LinkCache, get_link_ttl
+from ntu_learn_downloader_gui.metrics import DEPTH_BUCKETS, THROUGHPUT_BUCKETS, metrics
+from ntu_learn_downloader_gui.session import SessionManager
+
+DEFAULT_DOWNLOAD_CONCURRENCY = 4
+MAX_DOWNLOAD_CONCURRENCY = 16
+DEFAULT_RESOLVE_CONCURRENCY = 4
+# resolved items that may wait for a transfer thread, per transfer thread
+READY_QUEUE_FACTOR = 2
+# parallel transfers of the video lane, on top of those of the document lane
+DEFAULT_VIDEO_CONCURRENCY = 2
+
+DOCUMENTS = "documents"
+VIDEOS = "videos"
+LANES = (DOCUMENTS, VIDEOS)
+# files uploaded as videos go into the video lane once their filename is known
+VIDEO_EXTENSIONS = (".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm", ".wmv")
+
+# retries of an item, and of all items of a run together
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_RETRY_BUDGET = 32
+# seconds before the first retry, doubled for every further retry up to RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# order of the items within a lane: tree order, tree order reversed, or the smallest first by the
+# sizes in the link cache. Blackboard appends new content to the end of a listing, so reversed, the
+# last module comes first, starting with its newest items
+ORDER_LISTED = "listed"
+ORDER_NEWEST = "newest"
+ORDER_SMALLEST = "smallest"
+LANE_ORDERS = (ORDER_LISTED, ORDER_NEWEST, ORDER_SMALLEST)
+
+# transfer status reported through the progress callback
+DOWNLOADING = "downloading"
+DOWNLOADED = "downloaded"
+# size of an item found by a probe, in the total content length field, None if not known
+SIZED = "sized"
+SKIPPED = "skipped"
+FAILED = "failed"
+# a transient failure, the item is queued again. Reported with the stack trace like FAILED
+RETRYING = "retrying"
+
+# responses to a stale download link, the link is resolved again and the transfer retried once
+STALE_LINK_STATUS_CODES = (403, 404)
+
+# (index of item, filename, status, bytes downloaded, total content length, stack trace)
+TransferProgress = Tuple[int, str, str, Optional[int], Optional[int], Optional[str]]
+
+
+def get_download_link(session: SessionManager, node_data: Dict) -> Tuple[str, str]:
+    """resolve the download link and filename of a file or recorded lecture
+
+    Args:
+        session (SessionManager): authenticated session
+        node_data (Dict): file or recorded_lecture node data
+
+    Returns:
+        Tuple[str, str]: download link and filename
+    """
+    node_type = node_data["type"]
+    if node_type == "file":
+        download_link = get_file_download_link(session, node_data["predownload_link"])
+        return download_link, get_filename_from_url(download_link)
+    elif node_type == "recorded_lecture":
+        download_link = get_recorded_lecture_download_link(
+            session, node_data["predownload_link"]
+        )
+        return download_link, node_data["name"] + ".mp4"
+    raise ValueError("unexpected node type: {}".format(node_type))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """whether error is transient: a timeout, a lost connection or a server error"""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and (
+            error.response.status_code in RETRYABLE_STATUS_CODES
+        )
+    return isinstance(
+        error,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            IncompleteDownloadError,
+            ConnectionError,
+            TimeoutError,
+        ),
+    )
+
+
+def get_retry_delay(attempt: int, rand: Callable[[], float] = random.random) -> float:
+    """seconds before retry number attempt (counting from 0), exponential with equal jitter so that
+    items that failed together do not all come back at the same time
+    """
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+    return delay / 2 + rand() * delay / 2
+
+
+def get_lane(node_data: Dict) -> str:
+    """lane of a file or recorded lecture, VIDEOS or DOCUMENTS"""
+    if node_data["type"] == "recorded_lecture":
+        return VIDEOS
+    filename = node_data.get("filename") or ""
+    return VIDEOS if filename.lower().endswith(VIDEO_EXTENSIONS) else DOCUMENTS
+
+
+def split_lanes(
+    items: List[Tuple[str, Dict]],
+    order: str = ORDER_LISTED,
+    get_size: Optional[Callable[[Dict], Optional[int]]] = None,
+) -> Dict[str, List[int]]:
+    """indices of items by lane, each in the order the lane works through them
+
+    Args:
+        items (List[Tuple[str, Dict]]): list of target directory and node data tuples
+        order (str, optional): one of LANE_ORDERS. Defaults to ORDER_LISTED.
+        get_size (Optional[Callable[[Dict], Optional[int]]], optional): known size of the item of
+            node data, None if not known. With ORDER_SMALLEST items of unknown size come last, in
+            tree order. Defaults to None.
+    """
+    lanes: Dict[str, List[int]] = {lane: [] for lane in LANES}
+    for idx, (_path, node_data) in enumerate(items):
+        lanes[get_lane(node_data)].append(idx)
+    if order == ORDER_NEWEST:
+        for indices in lanes.values():
+            indices.reverse()
+    elif order == ORDER_SMALLEST:
+        sizes = [get_size(node_data) if get_size else None for _path, node_data in items]
+        for indices in lanes.values():
+            indices.sort(key=lambda idx: (sizes[idx] is None, sizes[idx] or 0))
+    elif order != ORDER_LISTED:
+        raise ValueError("unexpected lane order: {}".format(order))
+    return lanes
+
+
+def get_connection_count(
+    max_workers: int = DEFAULT_DOWNLOAD_CONCURRENCY,
+    video_workers: int = DEFAULT_VIDEO_CONCURRENCY,
+    resolve_workers: int = DEFAULT_RESOLVE_CONCURRENCY,
+) -> int:
+    """connections a DownloadScheduler may use at the same time, including size probes"""
+    # any file of at least SEGMENTED_MIN_SIZE is downloaded in segments, documents included
+    transfers = (max_workers + video_workers) * DEFAULT_SEGMENTS
+    return transfers + resolve_workers + sum(
+        min(workers, resolve_workers) for workers in (max_workers, video_workers)
+    )
+
+
+class DownloadScheduler:
+    def __init__(
+        self,
+        session: SessionManager,
+        max_workers: int = DEFAULT_DOWNLOAD_CONCURRENCY,
+        resolve_workers: int = DEFAULT_RESOLVE_CONCURRENCY,
+        link_cache: Optional[LinkCache] = None,
+        fs_index: Optional[DirectoryIndex] = None,
+        video_workers: int = DEFAULT_VIDEO_CONCURRENCY,
+        order: str = ORDER_LISTED,
+        probe_sizes: bool = False,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_budget: int = DEFAULT_RETRY_BUDGET,
+    ):
+        """Downloads items in two pipelined stages. Resolver threads look up download links ahead of
+        time and feed a bounded queue that the transfer threads take items from, so that slow link
+        lookups (e.g. AcuStudio pages) overlap with transfers already running. Documents and videos
+        each have their own resolvers, queue and transfer threads
+
+        Args:
+            session (SessionManager): authenticated session, its pools should be at least
+                get_connection_count(max_workers, video_workers, resolve_workers) large
+            max_workers (int, optional): number of parallel document transfers.
+                Defaults to DEFAULT_DOWNLOAD_CONCURRENCY.
+            resolve_workers (int, optional): number of parallel link resolutions per lane, at most
+                as many as the lane has transfer threads. Defaults to DEFAULT_RESOLVE_CONCURRENCY.
+            link_cache (Optional[LinkCache], optional): resolved links are looked up in and written
+                to this cache as soon as they are resolved. Defaults to None.
+            fs_index (Optional[DirectoryIndex], optional): answers whether a target already exists
+                and is updated with every download. Defaults to None.
+            video_workers (int, optional): number of parallel video transfers.
+                Defaults to DEFAULT_VIDEO_CONCURRENCY.
+            order (str, optional): order within a lane, one of LANE_ORDERS.
+                Defaults to ORDER_LISTED.
+            probe_sizes (bool, optional): look up the size of every item with resolve_workers
+                HEAD requests alongside the lanes and report it as SIZED. Links are resolved for the
+                whole batch up front then. Defaults to False.
+            max_retries (int, optional): retries of an item after transient failures.
+                Defaults to DEFAULT_MAX_RETRIES.
+            retry_budget (int, optional): retries of all items of a run together, so that an outage
+                does not keep a run going for long. Defaults to DEFAULT_RETRY_BUDGET.
+        """
+        if order not in LANE_ORDERS:
+            raise ValueError("unexpected lane order: {}".format(order))
+        self.session = session
+        self.max_workers = max(1, max_workers)
+        self.video_workers = max(1, video_workers)
+        self.resolve_workers = max(1, resolve_workers)
+        self.order = order
+        self.probe_sizes = probe_sizes
+        self.max_retries = max(0, max_retries)
+        self.retry_budget = max(0, retry_budget)
+        self.link_cache = link_cache
+        self.fs_index = fs_index if fs_index is not None else DirectoryIndex()
+        self._lock = threading.Lock()
+        # target paths of the current run and the item writing to each
+        self._claimed_paths: Dict[str, int] = {}
+        # link lookup of every item of the current run by index, shared by probes and resolvers
+        self._lookups: Dict[int, Future] = {}
+        # retries of every item of the current run, and retries left for the whole run
+        self._attempts: Dict[int, int] = {}
+        self._retries_left = 0
+
+    def run(
+        self,
+        items: List[Tuple[str, Dict]],
+        callback: Optional[Callable[[TransferProgress], None]] = None,
+        link_callback: Optional[Callable[[int, Tuple[str, str]], None]] = None,
+    ) -> Tuple[int, int, int, List[Optional[Tuple[str, str]]]]:
+        """download items, blocks until every transfer has completed, been skipped or failed.
+        callback is invoked from the worker threads, every item reports exactly one of DOWNLOADED,
+        SKIPPED or FAILED and any number of DOWNLOADING and RETRYING updates before that. With
+        probe_sizes, every item also reports SIZED once, possibly after it has finished
+
+        Args:
+            items (List[Tuple[str, Dict]]): list of target directory and node data tuples
+            callback (Callable[[TransferProgress], None], optional): progress hook
+            link_callback (Callable[[int, Tuple[str, str]], None], optional): invoked from the
+                worker threads with the index of an item and its new (download_link, filename) as
+                soon as they differ from the node data, so that they can be saved right away
+
+        Returns:
+            Tuple[int, int, int, List[Optional[Tuple[str, str]]]]: files downloaded, skipped, failed
+                and for each item the newly resolved (download_link, filename), None if unchanged
+        """
+        self._claimed_paths = {}
+        self._lookups = {}
+        self._attempts = {}
+        self._retries_left = self.retry_budget
+        results: List[Tuple[str, Optional[Tuple[str, str]]]] = [(FAILED, None)] * len(items)
+        lanes = [
+            (lane, indices, self.video_workers if lane == VIDEOS else self.max_workers)
+            for lane, indices in split_lanes(items, self.order, self._get_cached_size).items()
+            if indices
+        ]
+        with ThreadPoolExecutor(max_workers=len(LANES) + 1) as lane_executor:
+            futures = [
+                lane_executor.submit(
+                    self._run_lane, lane, items, indices, workers, results, callback, link_callback
+                )
+                for lane, indices, workers in lanes
+            ]
+            if self.probe_sizes:
+                futures.append(
+                    lane_executor.submit(
+                        self._probe,
+                        items,
+                        [idx for _lane, indices, _workers in lanes for idx in indices],
+                        callback,
+                    )
+                )
+            for future in futures:
+                future.result()
+
+        counts = {DOWNLOADED: 0, SKIPPED: 0, FAILED: 0}
+        for status, _delta in results:
+            counts[status] += 1
+        data_deltas = [delta for _status, delta in results]
+        return counts[DOWNLOADED], counts[SKIPPED], counts[FAILED], data_deltas
+
+    def _run_lane(
+        self,
+        lane: str,
+        items: List[Tuple[str, Dict]],
+        indices: List[int],
+        workers: int,
+        results: List[Tuple[str, Optional[Tuple[str, str]]]],
+        callback: Optional[Callable[[TransferProgress], None]],
+        link_callback: Optional[Callable[[int, Tuple[str, str]], None]],
+    ):
+        """resolve and download the items at indices in that order with workers transfer threads,
+        items that failed transiently are resolved and downloaded again after a backoff. The status
+        and data delta of each item is written to results
+        """
+        # resolved items waiting for a transfer thread, bounded so resolution does not run too far
+        # ahead of the transfers
+        ready: "queue.Queue" = queue.Queue(maxsize=READY_QUEUE_FACTOR * workers)
+        # items waiting for a retry as (due time, index), and the items that have not finished yet
+        retries: List[Tuple[float, int]] = []
+        unfinished = len(indices)
+        changed = threading.Condition()
+
+        def finish(idx: int, status: str, delta: Optional[Tuple[str, str]]):
+            nonlocal unfinished
+            results[idx] = (status, delta)
+            with changed:
+                unfinished -= 1
+                changed.notify()
+
+        def fail(idx: int, filename: str, error: Exception, delta: Optional[Tuple[str, str]]):
+            """report FAILED, or RETRYING and queue the item again if error is transient"""
+            trace = traceback.format_exc()
+            delay = self._get_retry_delay(idx, error)
+            status = FAILED if delay is None else RETRYING
+            metrics.inc("transfers_total", lane=lane, status=status)
+            if callback:
+                callback((idx, filename, status, None, None, trace))
+            if delay is None:
+                finish(idx, FAILED, delta)
+                return
+            with changed:
+                heapq.heappush(retries, (time.monotonic() + delay, idx))
+                changed.notify()
+
+        def save_link(idx: int, delta: Tuple[str, str]):
+            """pass delta to link_callback. Saving early is best effort, the delta is still part of
+            the results, so a failure is counted and the item carries on
+            """
+            if not link_callback:
+                return
+            try:
+                link_callback(idx, delta)
+            except Exception:
+                metrics.inc("link_save_errors_total", lane=lane)
+
+        def resolve(idx: int, retry: bool = False):
+            path, node_data = items[idx]
+            try:
+                # a retry looks the link up again if that failed, transfer retries reuse the link
+                resolved = self._lookup(idx, node_data, renew_failed=retry)
+            except Exception as e:
+                fail(idx, node_data["name"], e, None)
+                return
+            if resolved[2] is not None:
+                save_link(idx, resolved[2])
+            ready.put((idx, path, node_data) + resolved)
+            metrics.observe("ready_queue_depth", ready.qsize(), DEPTH_BUCKETS, lane=lane)
+
+        def transfer_loop():
+            while True:
+                item = ready.get()
+                if item is None:
+                    return
+                idx, path, node_data, download_link, filename, delta, fresh = item
+                try:
+                    status, renewed = self._transfer(
+                        idx, path, node_data, download_link, filename, not fresh, callback
+                    )
+                except Exception as e:
+                    # keep consuming, a dead transfer thread would leave resolvers blocked on ready
+                    fail(idx, filename, e, delta)
+                else:
+                    if renewed is not None:
+                        save_link(idx, renewed)
+                    finish(idx, status, renewed or delta)
+
+        with ThreadPoolExecutor(max_workers=workers) as transfer_executor:
+            loops = [transfer_executor.submit(transfer_loop) for _ in range(workers)]
+            try:
+                with ThreadPoolExecutor(
+                    max_workers=min(workers, self.resolve_workers)
+                ) as resolve_executor:
+                    futures = [resolve_executor.submit(resolve, idx) for idx in indices]
+                    # queue retries once their backoff has passed, until every item has finished
+                    with changed:
+                        while unfinished:
+                            now = time.monotonic()
+                            if retries and retries[0][0] <= now:
+                                _due, idx = heapq.heappop(retries)
+                                futures.append(resolve_executor.submit(resolve, idx, True))
+                            else:
+                                changed.wait(retries[0][0] - now if retries else None)
+                    for future in futures:
+                        future.result()
+            finally:
+                for _ in loops:
+                    ready.put(None)
+            for loop in loops:
+                loop.result()
+
+    def _get_cached_size(self, node_data: Dict) -> Optional[int]:
+        """size of the item of node_data found by an earlier probe, None if not known"""
+        if self.link_cache is None:
+            return None
+        return self.link_cache.get_size(node_data["predownload_link"])
+
+    def _probe(
+        self,
+        items: List[Tuple[str, Dict]],
+        indices: List[int],
+        callback: Optional[Callable[[TransferProgress], None]],
+    ):
+        """report the size of the items at indices as SIZED, from the link cache or a HEAD request"""
+
+        def probe(idx: int):
+            node_data = items[idx][1]
+            size = None
+            try:
+                download_link, filename, _delta, _fresh = self._lookup(idx, node_data)
+                if self.link_cache is not None:
+                    size = self.link_cache.get_size(node_data["predownload_link"])
+                    metrics.count_cache("size", hit=size is not None)
+                if size is None:
+                    size = get_content_length(self.session, download_link)
+                    if size is not None and self.link_cache is not None:
+                        self.link_cache.set_size(
+                            node_data["predownload_link"], download_link, size
+                        )
+            except Exception:
+                # the transfer reports the failure and learns the size itself
+                filename = node_data["name"]
+            if callback:
+                callback((idx, filename, SIZED, None, size, None))
+
+        with ThreadPoolExecutor(max_workers=self.resolve_workers) as executor:
+            for future in [executor.submit(probe, idx) for idx in indices]:
+                future.result()
+
+    def _claim(self, idx: int, full_file_path: str) -> bool:
+        """returns False if another item of this run already writes to full_file_path"""
+        with self._lock:
+            return self._claimed_paths.setdefault(full_file_path, idx) == idx
+
+    def _get_retry_delay(self, idx: int, error: Exception) -> Optional[float]:
+        """seconds until item idx is retried after error, None if it is not retried"""
+        if not is_retryable(error):
+            return None
+        with self._lock:
+            attempt = self._attempts.get(idx, 0)
+            if attempt >= self.max_retries or self._retries_left <= 0:
+                return None
+            self._attempts[idx] = attempt + 1
+            self._retries_left -= 1
+        return get_retry_delay(attempt)
+
+    def _lookup(
+        self, idx: int, node_data: Dict, renew_failed: bool = False
+    ) -> Tuple[str, str, Optional[Tuple[str, str]], bool]:
+        """get the download link and file name of item idx from the link cache, the node data or
+        the API, in that order. Only the first call for an item of a run does the work, later calls
+        wait for and share its result, including a failure unless renew_failed is set
+
+        Raises:
+            Exception: resolution failed
+
+        Returns:
+            Tuple[str, str, Optional[Tuple[str, str]], bool]: download link, filename, data delta and
+                whether the link was resolved in this run
+        """
+        with self._lock:
+            future = self._lookups.get(idx)
+            owner = future is None or (
+                renew_failed and future.done() and future.exception() is not None
+            )
+            if owner:
+                future = self._lookups[idx] = Future()
+        if owner:
+            try:
+                future.set_result(self._lookup_link(node_data))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def _lookup_link(self, node_data: Dict) -> Tuple[str, str, Optional[Tuple[str, str]], bool]:
+        cached = (
+            self.link_cache.get(node_data["predownload_link"])
+            if self.link_cache is not None
+            else None
+        )
+        if self.link_cache is not None:
+            metrics.count_cache("link", hit=cached is not None)
+        if cached is not None:
+            download_link, filename = cached
+            if (download_link, filename) == (
+                node_data.get("download_link"),
+                node_data.get("filename"),
+            ):
+                return download_link, filename, None, False
+            return download_link, filename, cached, False
+        if node_data.get("download_link") is not None:
+            return node_data["download_link"], node_data["filename"], None, False
+        with metrics.timer("resolve_seconds", type=node_data["type"]):
+            download_link, filename = get_download_link(self.session, node_data)
+        self._cache_link(node_data, download_link, filename)
+        return download_link, filename, (download_link, filename), True
+
+    def _cache_link(self, node_data: Dict, download_link: str, filename: str):
+        if self.link_cache is not None:
+            self.link_cache.put(
+                node_data["predownload_link"],
+                download_link,
+                filename,
+                get_link_ttl(node_data["type"]),
+            )
+
+    def _transfer(
+        self,
+        idx: int,
+        path: str,
+        node_data: Dict,
+        download_link: str,
+        filename: str,
+        revalidate: bool,
+        callback: Optional[Callable[[TransferProgress], None]],
+    ) -> Tuple[str, Optional[Tuple[str, str]]]:
+        """download a resolved item. If the server rejects a link that was not resolved in this
+        run, the link is resolved again and the transfer retried once
+
+        Raises:
+            Exception: the transfer failed
+
+        Returns:
+            Tuple[str, Optional[Tuple[str, str]]]: status and the renewed (download_link, filename),
+                None if the link was not renewed
+        """
+        renewed = None
+        lane = get_lane(node_data)
+
+        def report(status, bytes_downloaded=None, total_length=None):
+            if status != DOWNLOADING:
+                metrics.inc("transfers_total", lane=lane, status=status)
+            if callback:
+                callback((idx, filename, status, bytes_downloaded, total_length, None))
+
+        target_name = sanitise_filename(filename)
+        full_file_path = os.path.join(path, target_name)
+        if not self._claim(idx, full_file_path) or self.fs_index.exists(path, target_name):
+            report(SKIPPED)
+            return SKIPPED, renewed
+
+        # bytes received in this run, resumed transfers report their total including earlier runs
+        received = 0
+        last_bytes_downloaded: Optional[int] = None
+
+        def progress(bytes_downloaded, total_length):
+            nonlocal received, last_bytes_downloaded
+            if last_bytes_downloaded is not None:
+                received += max(0, bytes_downloaded - last_bytes_downloaded)
+            last_bytes_downloaded = bytes_downloaded
+            report(DOWNLOADING, bytes_downloaded, total_length)
+
+        start = time.perf_counter()
+        try:
+            downloaded = download(self.session, download_link, full_file_path, progress)
+        except requests.HTTPError as e:
+            if not revalidate or e.response is None or (
+                e.response.status_code not in STALE_LINK_STATUS_CODES
+            ):
+                raise
+            metrics.inc("stale_links_total", lane=lane)
+            if self.link_cache is not None:
+                self.link_cache.invalidate(node_data["predownload_link"])
+            last_bytes_downloaded = None
+            download_link, _filename = get_download_link(self.session, node_data)
+            # keep the target path that was claimed, only the link is renewed
+            self._cache_link(node_data, download_link, filename)
+            renewed = download_link, filename
+            downloaded = download(self.session, download_link, full_file_path, progress)
+
+        self.fs_index.add(path, target_name)
+        if not downloaded:
+            # appeared after the directory was indexed, e.g. copied in or downloaded by another run
+            report(SKIPPED)
+            return SKIPPED, renewed
+        elapsed = time.perf_counter() - start
+        metrics.inc("transfer_bytes_total", received, lane=lane)
+        if received and elapsed > 0:
+            metrics.observe(
+                "transfer_bytes_per_second", received / elapsed, THROUGHPUT_BUCKETS, lane=lane
+            )
+        report(DOWNLOADED)
+        return DOWNLOADED, renewed
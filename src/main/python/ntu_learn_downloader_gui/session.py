@@ -0,0 +1,73 @@
+"""
+Shared HTTP session for all NTU Learn traffic. Connections are kept alive and reused across crawl,
+link resolution and download requests instead of paying TCP and TLS setup for every file.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ntu_learn_downloader.constants import NTULEARN_URL
+
+DEFAULT_POOL_SIZE = 8
+# (connect, read) timeouts in seconds. The read timeout bounds the wait for each chunk rather than the
+# whole response, so streamed downloads of large files are not cut short
+REQUEST_TIMEOUT = (3.05, 30)
+
+
+class SessionManager:
+    def __init__(self, BbRouter: str, pool_size: int = DEFAULT_POOL_SIZE):
+        """Owns a requests.Session with keep-alive pools sized to the number of concurrent requests.
+        NTU Learn and the AcuStudio media hosts get separate pools so that long running video
+        transfers never take connections away from crawling and link resolution.
+
+        Args:
+            BbRouter (str): authentication token
+            pool_size (int, optional): connections kept alive per host. Defaults to DEFAULT_POOL_SIZE.
+        """
+        self.BbRouter = BbRouter
+        self.cookies = {"BbRouter": BbRouter}
+        self.session = requests.Session()
+        self.pool_size = 0
+        self.set_pool_size(pool_size)
+
+    def set_pool_size(self, pool_size: int):
+        """resize the connection pools, existing idle connections are dropped if the size changes
+
+        Args:
+            pool_size (int): connections kept alive per host
+        """
+        pool_size = max(1, pool_size)
+        if pool_size == self.pool_size:
+            return
+        self.pool_size = pool_size
+        # the AcuStudio domain is only known once a lecture page is parsed, so media hosts share
+        # the catch-all adapter which keeps one pool per host
+        ntulearn_adapter = self.__make_adapter(pool_connections=1)
+        media_adapter = self.__make_adapter(pool_connections=4)
+        for prefix in ["https://", "http://"]:
+            self.__mount(prefix, media_adapter)
+        self.__mount(NTULEARN_URL, ntulearn_adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        return self.session.get(url, cookies=self.cookies, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        return self.session.head(url, cookies=self.cookies, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __make_adapter(self, pool_connections: int) -> HTTPAdapter:
+        return HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(connect=5, backoff_factor=0.5),
+        )
+
+    def __mount(self, prefix: str, adapter: HTTPAdapter):
+        old_adapter = self.session.adapters.get(prefix)
+        self.session.mount(prefix, adapter)
+        if old_adapter is not None and old_adapter is not adapter:
+            old_adapter.close()
@@ -0,0 +1,290 @@
+"""
+Storage engines for the download dir. JSONStorage is ntu_learn_downloader's Storage, which keeps the
+whole tree in download_dir.json and rewrites it on save. SQLiteStorage keeps one row per node in a
+sqlite3 database in WAL mode: links are upserted per node as they are resolved, merging a fresh crawl
+looks nodes up by (course, path) through the primary key, and an existing download_dir.json is
+migrated the first time the database is opened. The path of a node identifies it by the type, name
+and occurrence among equally named siblings of every node from the course down, so siblings with the
+same name do not share a row.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ntu_learn_downloader import Storage
+from ntu_learn_downloader.storage import DOWNLOAD_DIR_FILENAME, STORAGE_DIR
+
+from ntu_learn_downloader_gui.ignore_manifest import IgnoreManifest, SQLiteIgnoreManifest
+
+JSON_BACKEND = "json"
+SQLITE_BACKEND = "sqlite"
+STORAGE_BACKENDS = (JSON_BACKEND, SQLITE_BACKEND)
+DEFAULT_STORAGE_BACKEND = JSON_BACKEND
+
+DB_FILENAME = "download_dir.sqlite3"
+# joins the segments from the course down to a node, and the type, name and occurrence within a
+# segment. Neither can appear in names scraped from NTU Learn
+PATH_SEPARATOR = "\x1f"
+SEGMENT_SEPARATOR = "\x1e"
+# version of the path format, databases with older paths are rewritten when opened
+PATH_FORMAT = "2"
+DOWNLOADABLE_TYPES = ("file", "recorded_lecture")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    course TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    predownload_link TEXT,
+    download_link TEXT,
+    filename TEXT,
+    generation INTEGER NOT NULL,
+    PRIMARY KEY (course, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS nodes_predownload_link ON nodes (predownload_link);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS ignored (key TEXT PRIMARY KEY, name TEXT NOT NULL, ignored_at REAL);
+"""
+
+
+class JSONStorage(Storage):
+    def __init__(self, download_dir: str):
+        super(JSONStorage, self).__init__(download_dir)
+        self.ignores = IgnoreManifest(self.dir, download_dir)
+
+    def update_nodes(self, nodes: Iterable[Dict]):
+        """links live in the download dir tree and are written by save_download_dir"""
+
+    def close(self):
+        pass
+
+
+def get_path_segment(node: Dict, occurrence: int) -> str:
+    """segment of node in the path of its row, occurrence counts the siblings before node with the
+    same type and name
+    """
+    return SEGMENT_SEPARATOR.join((node["type"], node["name"], str(occurrence)))
+
+
+def iter_nodes(course: Dict) -> Iterable[Tuple[str, Optional[str], int, Dict]]:
+    """yields (path, parent path, position, node) for a course and all of its descendants. The
+    course itself has the empty path
+    """
+    stack: List[Tuple[str, Optional[str], int, Dict]] = [("", None, 0, course)]
+    while stack:
+        path, parent, position, node = stack.pop()
+        yield path, parent, position, node
+        if node["type"] == "folder":
+            occurrences: Dict[Tuple[str, str], int] = {}
+            for child_position, child in enumerate(node.get("children") or []):
+                key = (child["type"], child["name"])
+                segment = get_path_segment(child, occurrences.get(key, 0))
+                occurrences[key] = occurrences.get(key, 0) + 1
+                child_path = path + PATH_SEPARATOR + segment if path else segment
+                stack.append((child_path, path, child_position, child))
+
+
+class SQLiteStorage:
+    def __init__(self, download_dir: str):
+        """Open the database in the storage directory, migrating download_dir.json if the
+        database is new
+
+        Args:
+            download_dir (str): download directory
+        """
+        self.dir = os.path.join(download_dir, STORAGE_DIR, "")
+        Path(self.dir).mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            os.path.join(self.dir, DB_FILENAME), check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # in WAL mode a crash can only lose the last transactions, never corrupt the database
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        self._migrate_paths()
+        self._migrate_json()
+        self.ignores = SQLiteIgnoreManifest(self, download_dir)
+
+    @property
+    def download_dir(self) -> List[Dict]:
+        """saved download dir, in the same format as Storage.download_dir without the mappings"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT course, path, parent, type, name, predownload_link, download_link, "
+                "filename FROM nodes ORDER BY position"
+            ).fetchall()
+
+        children: Dict[Tuple[str, str], List[Dict]] = {}
+        courses: List[Dict] = []
+        for course, path, parent, node_type, name, predownload_link, download_link, filename in rows:
+            node: Dict = {"type": node_type, "name": name}
+            if node_type == "folder":
+                node["children"] = children.setdefault((course, path), [])
+            else:
+                node["predownload_link"] = predownload_link
+                node["download_link"] = download_link
+                node["filename"] = filename
+            if parent is None:
+                courses.append(node)
+            else:
+                children.setdefault((course, parent), []).append(node)
+        return courses
+
+    def merge_download_dir(self, incoming_dir: List[Dict]):
+        """mutate incoming_dir by adding the saved download_link and filename to its file and
+        recorded_lecture nodes that have been saved before. Every node is looked up by its primary key. The
+        merged courses are written back right away so that update_nodes can find their nodes
+
+        Args:
+            incoming_dir (List[Dict]): return value of api.get_download_dir
+        """
+        with self._lock, self.conn:
+            generation = self._current_generation()
+            for course in incoming_dir:
+                row = self.conn.execute(
+                    "SELECT position FROM nodes WHERE course = ? AND path = ''",
+                    (course["name"],),
+                ).fetchone()
+                course_position = row[0] if row else self._count_courses()
+                for path, _parent, _position, node in iter_nodes(course):
+                    if node["type"] not in DOWNLOADABLE_TYPES:
+                        continue
+                    row = self.conn.execute(
+                        "SELECT download_link, filename FROM nodes WHERE course = ? AND path = ?",
+                        (course["name"], path),
+                    ).fetchone()
+                    if row is not None:
+                        node["download_link"], node["filename"] = row
+                self._upsert_course(course, course_position, generation)
+
+    def save_download_dir(self, download_dir: List[Dict]):
+        """upsert every node of download_dir and remove nodes that are no longer in it, in a single
+        transaction
+
+        Args:
+            download_dir (List[Dict]): download dir, files and recorded_lectures should have their
+                filename and download link attributes present
+        """
+        with self._lock, self.conn:
+            generation = self._current_generation() + 1
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)",
+                (str(generation),),
+            )
+            for course_position, course in enumerate(download_dir):
+                self._upsert_course(course, course_position, generation)
+            self.conn.execute("DELETE FROM nodes WHERE generation < ?", (generation,))
+
+    def update_nodes(self, nodes: Iterable[Dict]):
+        """persist the download_link and filename of files/recorded lectures right away, nodes are
+        matched by predownload link
+
+        Args:
+            nodes (Iterable[Dict]): node data of files and recorded lectures
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE nodes SET download_link = ?, filename = ? WHERE predownload_link = ?",
+                (
+                    (node.get("download_link"), node.get("filename"), node["predownload_link"])
+                    for node in nodes
+                ),
+            )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """yields the connection, everything done with it is committed together"""
+        with self._lock, self.conn:
+            yield self.conn
+
+    def _current_generation(self) -> int:
+        """every save_download_dir starts a new generation, rows of older ones are removed"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _count_courses(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM nodes WHERE path = ''").fetchone()[0]
+
+    def _upsert_course(self, course: Dict, course_position: int, generation: int):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO nodes (course, path, parent, position, type, name, "
+            "predownload_link, download_link, filename, generation) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    course["name"],
+                    path,
+                    parent,
+                    # courses are ordered by their position in the download dir
+                    course_position if parent is None else position,
+                    node["type"],
+                    node["name"],
+                    node.get("predownload_link"),
+                    node.get("download_link"),
+                    node.get("filename"),
+                    generation,
+                )
+                for path, parent, position, node in iter_nodes(course)
+            ),
+        )
+
+    def _migrate_paths(self):
+        """rewrite the rows of a database written with an older path format"""
+        with self._lock:
+            path_format = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'path_format'"
+            ).fetchone()
+        if path_format is not None and path_format[0] == PATH_FORMAT:
+            return
+        # rows only refer to each other by path, the tree can be read in any format
+        download_dir = self.download_dir
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM nodes")
+        self.save_download_dir(download_dir)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('path_format', ?)",
+                (PATH_FORMAT,),
+            )
+
+    def _migrate_json(self):
+        with self._lock:
+            migrated = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'migrated_json'"
+            ).fetchone()
+        if migrated is not None:
+            return
+        json_path = os.path.join(self.dir, DOWNLOAD_DIR_FILENAME)
+        download_dir = []
+        if os.path.exists(json_path):
+            with open(json_path, "r") as f:
+                download_dir = json.load(f)
+        # the JSON file is left in place, older versions of the app can still read it
+        self.save_download_dir(download_dir)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', '1')"
+            )
+
+
+def open_storage(download_dir: str, backend: str = DEFAULT_STORAGE_BACKEND):
+    """open the storage of download_dir with the given engine, one of STORAGE_BACKENDS"""
+    if backend == SQLITE_BACKEND:
+        return SQLiteStorage(download_dir)
+    elif backend == JSON_BACKEND:
+        return JSONStorage(download_dir)
+    raise ValueError("unknown storage backend: {}".format(backend))
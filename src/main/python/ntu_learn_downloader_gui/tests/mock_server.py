@@ -1,4 +1,4 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
 import socket
 from threading import Thread
 
@@ -34,3 +34,62 @@ def start_mock_server(port):
     mock_server_thread.start()
 
     return mock_server
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    """Serves self.server.payload with support for Range requests. Requests to /truncated send the
+    full Content-Length but close the connection halfway, requests to /no-ranges ignore Range and
+    ranged requests to /unsatisfiable are always rejected with 416
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        payload = self.server.payload
+        self.server.range_headers.append(self.headers.get("Range"))
+        start, end = 0, len(payload) - 1
+        range_header = self.headers.get("Range")
+        if range_header and self.path != "/no-ranges":
+            first, last = range_header.split("=")[1].split("-")
+            start = int(first)
+            if last:
+                end = min(int(last), end)
+            if start >= len(payload) or self.path == "/unsatisfiable":
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(len(payload)))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", "bytes {}-{}/{}".format(start, end, len(payload))
+            )
+        else:
+            self.send_response(200)
+        if self.path != "/no-ranges":
+            self.send_header("Accept-Ranges", "bytes")
+        body = payload[start : end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.path == "/truncated":
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_file_server(payload: bytes):
+    """start a server on a free port that serves payload, returns server"""
+    # segmented downloads open several connections at once
+    file_server = ThreadingHTTPServer(("localhost", get_free_port()), FileRequestHandler)
+    file_server.daemon_threads = True
+    file_server.payload = payload
+    file_server.range_headers = []
+    file_server_thread = Thread(target=file_server.serve_forever)
+    file_server_thread.setDaemon(True)
+    file_server_thread.start()
+
+    return file_server
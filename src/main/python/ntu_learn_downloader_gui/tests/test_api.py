@@ -0,0 +1,174 @@
+import os
+import shutil
+import time
+import json
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from ntu_learn_downloader_gui.api import (
+    COMMITTED_FILE_SUFFIX,
+    SEGMENTS_FILE_SUFFIX,
+    IncompleteDownloadError,
+    download,
+    get_part_file_path,
+    get_segment_committed_path,
+)
+from ntu_learn_downloader_gui.bandwidth import KB, BandwidthLimiter
+from ntu_learn_downloader_gui.session import SessionManager
+from ntu_learn_downloader_gui.tests.mock_server import start_file_server
+
+DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_api")
+PAYLOAD = bytes(range(256)) * 64
+
+
+class TestDownload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_file_server(PAYLOAD)
+        cls.url = "http://localhost:{}".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        os.makedirs(DOWNLOAD_DIR)
+        self.server.range_headers.clear()
+        self.session = SessionManager("PLACEHOLDER")
+        self.destination = os.path.join(DOWNLOAD_DIR, "lecture.mp4")
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    def read_destination(self):
+        with open(self.destination, "rb") as f:
+            return f.read()
+
+    def test_download_is_rate_limited(self):
+        start = time.monotonic()
+        download(self.session, self.url, self.destination, limiter=BandwidthLimiter(64 * KB))
+        # 16 KiB at 64 KiB/s
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(self.read_destination(), PAYLOAD)
+
+    def test_interrupted_download_is_resumed(self):
+        # depending on the urllib3 version the short read is detected by urllib3 or by download
+        with self.assertRaises((requests.exceptions.RequestException, IncompleteDownloadError)):
+            download(self.session, self.url + "/truncated", self.destination)
+        self.assertFalse(os.path.exists(self.destination))
+        part_size = os.path.getsize(get_part_file_path(self.destination))
+        self.assertEqual(part_size, len(PAYLOAD) // 2)
+
+        progress = []
+        self.assertTrue(
+            download(
+                self.session,
+                self.url + "/file",
+                self.destination,
+                lambda dl, total: progress.append((dl, total)),
+            )
+        )
+        self.assertEqual(self.server.range_headers[-1], "bytes={}-".format(part_size))
+        self.assertEqual(self.read_destination(), PAYLOAD)
+        # the resumed bytes are reported before anything is received
+        self.assertEqual(progress[0], (part_size, len(PAYLOAD)))
+        self.assertEqual(progress[-1], (len(PAYLOAD), len(PAYLOAD)))
+        self.assertFalse(os.path.exists(get_part_file_path(self.destination)))
+
+    def test_preallocated_part_file_resumes_from_committed_offset(self):
+        # simulate a crash: the part file was preallocated but only 1000 bytes were committed
+        part_file_path = get_part_file_path(self.destination)
+        with open(part_file_path, "wb") as f:
+            f.write(PAYLOAD[:1000] + bytes(len(PAYLOAD) - 1000))
+        with open(part_file_path + COMMITTED_FILE_SUFFIX, "w") as f:
+            f.write("1000")
+
+        self.assertTrue(download(self.session, self.url + "/file", self.destination))
+        self.assertEqual(self.server.range_headers[-1], "bytes=1000-")
+        self.assertEqual(self.read_destination(), PAYLOAD)
+        self.assertEqual(os.listdir(DOWNLOAD_DIR), ["lecture.mp4"])
+
+    def test_complete_part_file_is_renamed(self):
+        with open(get_part_file_path(self.destination), "wb") as f:
+            f.write(PAYLOAD)
+
+        self.assertTrue(download(self.session, self.url + "/file", self.destination))
+        self.assertEqual(self.read_destination(), PAYLOAD)
+        self.assertFalse(os.path.exists(get_part_file_path(self.destination)))
+
+    def test_rejected_range_of_a_fresh_download(self):
+        with self.assertRaises(IncompleteDownloadError):
+            download(self.session, self.url + "/unsatisfiable", self.destination)
+        self.assertEqual(self.server.range_headers, ["bytes=0-"])
+        self.assertEqual(os.listdir(DOWNLOAD_DIR), [])
+
+    def test_existing_destination_is_not_downloaded(self):
+        with open(self.destination, "wb") as f:
+            f.write(b"done")
+
+        self.assertFalse(download(self.session, self.url + "/file", self.destination))
+        self.assertEqual(self.server.range_headers, [])
+
+    @patch("ntu_learn_downloader_gui.api.MIN_SEGMENT_SIZE", 4 * KB)
+    @patch("ntu_learn_downloader_gui.api.SEGMENTED_MIN_SIZE", 4 * KB)
+    def test_large_file_is_downloaded_in_segments(self):
+        progress = []
+        self.assertTrue(
+            download(
+                self.session,
+                self.url + "/file",
+                self.destination,
+                lambda dl, total: progress.append((dl, total)),
+            )
+        )
+        self.assertEqual(self.read_destination(), PAYLOAD)
+        self.assertEqual(self.server.range_headers[0], "bytes=0-")
+        self.assertEqual(
+            sorted(self.server.range_headers[1:]),
+            ["bytes=0-4095", "bytes=12288-16383", "bytes=4096-8191", "bytes=8192-12287"],
+        )
+        self.assertEqual(progress[-1], (len(PAYLOAD), len(PAYLOAD)))
+        self.assertEqual(os.listdir(DOWNLOAD_DIR), ["lecture.mp4"])
+
+    @patch("ntu_learn_downloader_gui.api.MIN_SEGMENT_SIZE", 4 * KB)
+    def test_segments_resume_from_their_committed_offsets(self):
+        # simulate a crash: the first half of every segment was committed
+        part_file_path = get_part_file_path(self.destination)
+        ranges = [(start, start + 8 * KB - 1) for start in (0, 8 * KB)]
+        with open(part_file_path + SEGMENTS_FILE_SUFFIX, "w") as f:
+            json.dump({"total_length": len(PAYLOAD), "segments": ranges}, f)
+        with open(part_file_path, "wb") as f:
+            f.write(bytes(len(PAYLOAD)))
+        for idx, (start, _end) in enumerate(ranges):
+            with open(part_file_path, "r+b") as f:
+                f.seek(start)
+                f.write(PAYLOAD[start : start + 4 * KB])
+            with open(get_segment_committed_path(part_file_path, idx), "w") as f:
+                f.write(str(start + 4 * KB))
+
+        progress = []
+        self.assertTrue(
+            download(
+                self.session,
+                self.url + "/file",
+                self.destination,
+                lambda dl, total: progress.append((dl, total)),
+            )
+        )
+        self.assertEqual(
+            sorted(self.server.range_headers), ["bytes=12288-16383", "bytes=4096-8191"]
+        )
+        self.assertEqual(progress[0], (8 * KB, len(PAYLOAD)))
+        self.assertEqual(progress[-1], (len(PAYLOAD), len(PAYLOAD)))
+        self.assertEqual(self.read_destination(), PAYLOAD)
+        self.assertEqual(os.listdir(DOWNLOAD_DIR), ["lecture.mp4"])
+
+    @patch("ntu_learn_downloader_gui.api.SEGMENTED_MIN_SIZE", 4 * KB)
+    def test_server_without_ranges_is_downloaded_in_one_stream(self):
+        self.assertTrue(download(self.session, self.url + "/no-ranges", self.destination))
+        self.assertEqual(self.server.range_headers, ["bytes=0-"])
+        self.assertEqual(self.read_destination(), PAYLOAD)
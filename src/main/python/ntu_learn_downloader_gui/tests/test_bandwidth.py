@@ -0,0 +1,105 @@
+import datetime
+import threading
+import time
+import unittest
+
+from ntu_learn_downloader_gui.bandwidth import (
+    KB,
+    MB,
+    BandwidthLimiter,
+    RateSchedule,
+    RateWindow,
+    format_rate,
+    parse_rate,
+)
+
+CHUNK_SIZE = 16 * KB
+
+
+def at(hour: int, minute: int = 0) -> datetime.datetime:
+    return datetime.datetime(2020, 3, 2, hour, minute)
+
+
+class TestRateSchedule(unittest.TestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("2M"), 2 * MB)
+        self.assertEqual(parse_rate("500 KB/s"), 500 * KB)
+        self.assertEqual(parse_rate("1.5m"), int(1.5 * MB))
+        self.assertIsNone(parse_rate("unlimited"))
+        self.assertIsNone(parse_rate("0"))
+        self.assertEqual(format_rate(2 * MB), "2M")
+        with self.assertRaises(ValueError):
+            parse_rate("fast")
+
+    def test_windows(self):
+        schedule = RateSchedule.parse("09:00-18:00=2M; 22:00-06:00=unlimited")
+        self.assertEqual(schedule.window_at(at(9)), RateWindow(9 * 60, 18 * 60, 2 * MB))
+        self.assertIsNone(schedule.window_at(at(18)))
+        # windows may run past midnight
+        self.assertIsNone(schedule.window_at(at(23, 30)).rate)
+        self.assertIsNotNone(schedule.window_at(at(5, 59)))
+        self.assertEqual(str(schedule), "09:00-18:00=2M, 22:00-06:00=unlimited")
+        with self.assertRaises(ValueError):
+            RateSchedule.parse("9-18=2M")
+
+
+class TestBandwidthLimiter(unittest.TestCase):
+    def drain(self, limiter: BandwidthLimiter, counts, idx: int, stop: threading.Event):
+        while not stop.is_set():
+            limiter.consume(limiter.chunk_size(CHUNK_SIZE))
+            counts[idx] += 1
+
+    def test_concurrent_transfers_share_the_limit_fairly(self):
+        rate = 1 * MB
+        limiter = BandwidthLimiter(rate)
+        counts = [0, 0, 0]
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self.drain, args=(limiter, counts, idx, stop))
+            for idx in range(len(counts))
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        consumed = sum(counts) * CHUNK_SIZE
+        self.assertLessEqual(consumed, rate * elapsed + CHUNK_SIZE * len(counts))
+        self.assertGreater(consumed, rate * 0.3)
+        self.assertLessEqual(max(counts) - min(counts), 1)
+
+    def test_rate_changes_apply_to_waiting_transfers(self):
+        limiter = BandwidthLimiter(1 * KB)
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.consume(MB), done.set()))
+        thread.start()
+        self.assertFalse(done.wait(0.1))
+        limiter.set_rate(None)
+        self.assertTrue(done.wait(1))
+        thread.join()
+
+    def test_schedule_sets_the_rate(self):
+        now, clock = at(8, 59), 0.0
+        limiter = BandwidthLimiter(
+            None, RateSchedule.parse("09:00-18:00=2M"), clock=lambda: clock, now=lambda: now
+        )
+        self.assertIsNone(limiter.rate)
+        self.assertFalse(limiter.in_scheduled_window)
+
+        now, clock = at(9), clock + 60
+        self.assertEqual(limiter.rate, 2 * MB)
+        # a change inside a window is kept until the window ends
+        limiter.set_rate(1 * MB)
+        now, clock = at(17, 59), clock + 60
+        self.assertEqual(limiter.rate, 1 * MB)
+
+        now, clock = at(18), clock + 60
+        self.assertIsNone(limiter.rate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import shutil
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from ntu_learn_downloader.models import Doc, Folder
+
+from ntu_learn_downloader_gui.crawler import (
+    CrawlCancelled,
+    Crawler,
+    get_contents,
+    get_download_dir,
+)
+from ntu_learn_downloader_gui.page_cache import PageCache
+from ntu_learn_downloader_gui.session import SessionManager
+
+session = SessionManager("PLACEHOLDER")
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "temp_page_cache")
+LIST_CONTENT_URL = "/webapps/blackboard/content/listContent.jsp?course_id=_1_1&content_id={}"
+
+
+def doc(name, rid):
+    return Doc(name=name, link="/bbcswebdav/pid-1-dt-content-rid-{}_1/xid-{}_1".format(rid, rid))
+
+
+# content id -> models returned by the listContent page
+PAGES = {
+    "_10_1": [
+        doc("Lecture 1.pdf", 1),
+        Folder(name="Tutorials", link=LIST_CONTENT_URL.format("_11_1"), details=""),
+        Folder(name="Empty", link=None, details=""),
+    ],
+    "_11_1": [doc("Tut 1.pdf", 2)],
+    "_20_1": [doc("Lab 1.pdf", 3)],
+}
+
+
+def mock_get_contents(session, course_id, content_id, page_cache=None):
+    return PAGES[content_id]
+
+
+class TestCrawler(unittest.TestCase):
+    @patch(
+        "ntu_learn_downloader_gui.crawler.get_content_ids",
+        return_value=[("Content", "_10_1"), ("Labs", "_20_1")],
+    )
+    @patch("ntu_learn_downloader_gui.crawler.get_contents", side_effect=mock_get_contents)
+    def test_get_download_dir_loads_sub_folders(self, m_get_contents, _m_get_content_ids):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            result = get_download_dir(session, "CE3007", "_1_1", executor)
+
+        self.assertEqual(m_get_contents.call_count, 3)
+        self.assertEqual(result["name"], "CE3007")
+        content, labs = result["children"]
+        self.assertEqual(
+            [c["name"] for c in content["children"]],
+            ["Lecture 1.pdf", "Tutorials", "Empty"],
+        )
+        self.assertEqual(content["children"][1]["children"][0]["name"], "Tut 1.pdf")
+        self.assertEqual(content["children"][2]["children"], [])
+        self.assertEqual(labs["children"][0]["name"], "Lab 1.pdf")
+
+    @patch(
+        "ntu_learn_downloader_gui.crawler.get_content_ids",
+        return_value=[("Content", "_10_1"), ("Labs", "_20_1")],
+    )
+    @patch("ntu_learn_downloader_gui.crawler.get_contents")
+    def test_cancelled_crawl_stops_fetching(self, m_get_contents, _m_get_content_ids):
+        cancelled = threading.Event()
+
+        def get_contents_then_cancel(*args):
+            cancelled.set()
+            return mock_get_contents(*args)
+
+        m_get_contents.side_effect = get_contents_then_cancel
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with self.assertRaises(CrawlCancelled):
+                get_download_dir(session, "CE3007", "_1_1", executor, cancelled=cancelled)
+            # pages are not even requested once cancelled
+            with self.assertRaises(CrawlCancelled):
+                get_download_dir(session, "CE3007", "_1_1", executor, cancelled=cancelled)
+        self.assertEqual(m_get_contents.call_count, 1)
+
+    @patch(
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
+        side_effect=lambda session, name, course_id, executor, page_cache, **kwargs: {
+            "name": name
+        },
+    )
+    def test_crawl_reports_every_course_and_keeps_order(self, _m_get_download_dir):
+        modules = [("A", "_1_1"), ("B", "_2_1"), ("C", "_3_1")]
+        reported = []
+        result = Crawler(session, max_workers=2).crawl(
+            modules, lambda idx, course: reported.append((idx, course["name"]))
+        )
+
+        self.assertEqual([r["name"] for r in result], ["A", "B", "C"])
+        self.assertEqual(sorted(reported), [(0, "A"), (1, "B"), (2, "C")])
+
+
+PAGE = b"<ul id='content_listContainer'></ul>"
+
+
+def page_response(status_code=200, content=PAGE, headers=None):
+    return MagicMock(status_code=status_code, content=content, headers=headers or {})
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        self.page_cache = PageCache(CACHE_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+    @patch("ntu_learn_downloader_gui.crawler.parse_content_page", return_value=[])
+    @patch("ntu_learn_downloader_gui.crawler.get_contents_page")
+    def test_unchanged_pages_are_not_parsed_again(self, m_get_contents_page, m_parse):
+        models = [doc("Lecture 1.pdf", 1), Folder(name="Tutorials", link="/x", details="")]
+        m_parse.return_value = ["SDoc", "SFolder"]
+        m_get_contents_page.return_value = page_response(headers={"etag": '"v1"'})
+        with patch("ntu_learn_downloader_gui.crawler.to_model", side_effect=models):
+            self.assertEqual(get_contents(session, "_1_1", "_10_1", self.page_cache), models)
+
+        # server supports conditional requests
+        m_get_contents_page.return_value = page_response(status_code=304, content=b"")
+        self.assertEqual(get_contents(session, "_1_1", "_10_1", self.page_cache), models)
+        self.assertEqual(m_get_contents_page.call_args[0][3], {"If-None-Match": '"v1"'})
+
+        # server ignores them but the body is the same
+        m_get_contents_page.return_value = page_response(headers={"etag": '"v2"'})
+        self.assertEqual(get_contents(session, "_1_1", "_10_1", self.page_cache), models)
+        self.assertEqual(m_parse.call_count, 1)
+        self.assertEqual(self.page_cache.get("_1_1", "_10_1")["etag"], '"v2"')
+
+        # changed body is parsed
+        m_parse.return_value = []
+        m_get_contents_page.return_value = page_response(content=PAGE + b" ")
+        self.assertEqual(get_contents(session, "_1_1", "_10_1", self.page_cache), [])
+        self.assertEqual(m_parse.call_count, 2)
@@ -0,0 +1,157 @@
+import os
+import shutil
+import sys
+import types
+import unittest
+from unittest.mock import patch
+
+from ntu_learn_downloader_gui.credentials import (
+    EXPIRY_MARGIN,
+    DPAPIFileBackend,
+    KeyringBackend,
+    TokenStore,
+    dpapi_protect,
+    dpapi_unprotect,
+    get_default_backend,
+    get_token_expiry,
+    parse_BbRouter,
+)
+
+TEMP_DIR = os.path.join(os.path.dirname(__file__), "temp_credentials")
+TOKEN_PATH = os.path.join(TEMP_DIR, "token.bin")
+
+NOW = 1600000000.0
+BbRouter = "expires:{},id:ABC,signature:sig,site:site-id,timeout:10800,user:1234,v:2,xsrf:x".format(
+    int(NOW) + 6 * 60 * 60
+)
+
+
+class FakeKeyring:
+    class errors:
+        class PasswordDeleteError(Exception):
+            pass
+
+    def __init__(self):
+        self.passwords = {}
+
+    def get_password(self, service, username):
+        return self.passwords.get((service, username))
+
+    def set_password(self, service, username, password):
+        self.passwords[(service, username)] = password
+
+    def delete_password(self, service, username):
+        if (service, username) not in self.passwords:
+            raise self.errors.PasswordDeleteError()
+        del self.passwords[(service, username)]
+
+
+class TestTokenExpiry(unittest.TestCase):
+    def test_parse(self):
+        fields = parse_BbRouter(BbRouter)
+        self.assertEqual((fields["user"], fields["timeout"]), ("1234", "10800"))
+
+    def test_expiry(self):
+        # the inactivity timeout ends the session before expires
+        self.assertEqual(get_token_expiry(BbRouter, NOW), NOW + 10800)
+        self.assertEqual(get_token_expiry(BbRouter, NOW - 4 * 60 * 60), NOW - 4 * 60 * 60 + 10800)
+        self.assertEqual(
+            get_token_expiry("expires:{},user:1".format(int(NOW) * 1000), NOW), NOW
+        )
+        # not authenticated
+        self.assertIsNone(get_token_expiry("expires:1,id:ABC,timeout:10800", NOW))
+
+
+def fake_protect(data):
+    return bytes(byte ^ 0xFF for byte in data)
+
+
+def make_keyring_modules(keyring):
+    """modules for patch.dict(sys.modules) that make keyring importable"""
+    fail = types.ModuleType("keyring.backends.fail")
+    fail.Keyring = type("Keyring", (), {})
+    backends = types.ModuleType("keyring.backends")
+    backends.fail = fail
+    module = types.ModuleType("keyring")
+    module.backends = backends
+    module.get_keyring = lambda: keyring if keyring is not None else fail.Keyring()
+    return {"keyring": module, "keyring.backends": backends, "keyring.backends.fail": fail}
+
+
+class TestDefaultBackend(unittest.TestCase):
+    def test_keyring_is_used_when_usable(self):
+        with patch.dict(sys.modules, make_keyring_modules(FakeKeyring())):
+            self.assertIsInstance(get_default_backend(TEMP_DIR), KeyringBackend)
+
+    def test_fallback_without_keyring(self):
+        for modules in [{"keyring": None}, make_keyring_modules(None)]:
+            with patch.dict(sys.modules, modules):
+                with patch.object(sys, "platform", "win32"):
+                    backend = get_default_backend(TEMP_DIR)
+                    self.assertIsInstance(backend, DPAPIFileBackend)
+                    self.assertEqual(backend.path, TOKEN_PATH)
+                with patch.object(sys, "platform", "linux"):
+                    self.assertIsNone(get_default_backend(TEMP_DIR))
+
+    @unittest.skipUnless(sys.platform == "win32", "DPAPI is only available on Windows")
+    def test_dpapi_roundtrip(self):
+        data = dpapi_protect(BbRouter.encode())
+        self.assertNotIn(b"signature", data)
+        self.assertEqual(dpapi_unprotect(data), BbRouter.encode())
+
+
+class TestTokenStore(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+        self.now = NOW
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def make_store(self, backend=None):
+        return TokenStore(backend or DPAPIFileBackend(TOKEN_PATH), clock=lambda: self.now)
+
+    @patch("ntu_learn_downloader_gui.credentials.dpapi_unprotect", side_effect=fake_protect)
+    @patch("ntu_learn_downloader_gui.credentials.dpapi_protect", side_effect=fake_protect)
+    def test_dpapi_file(self, _m_protect, m_unprotect):
+        store = self.make_store()
+        self.assertIsNone(store.load())
+        self.assertTrue(store.save(BbRouter))
+        with open(TOKEN_PATH, "rb") as f:
+            self.assertNotIn(b"signature", f.read())
+
+        # a new store, like after a relaunch
+        self.assertEqual(self.make_store().load_valid(), BbRouter)
+        # another user cannot read it
+        m_unprotect.side_effect = OSError()
+        self.assertIsNone(self.make_store().load())
+        store.clear()
+        self.assertFalse(os.path.exists(TOKEN_PATH))
+
+    def test_nothing_is_kept_without_a_backend(self):
+        with patch("ntu_learn_downloader_gui.credentials.get_default_backend", return_value=None):
+            store = TokenStore(clock=lambda: self.now)
+        self.assertFalse(store.save(BbRouter))
+        self.assertIsNone(store.load_valid())
+        store.clear()
+
+    def test_expired_token_is_not_reused(self):
+        store = self.make_store(KeyringBackend(FakeKeyring()))
+        store.save(BbRouter)
+        self.now += 10800 - EXPIRY_MARGIN - 1
+        self.assertEqual(store.load_valid(), BbRouter)
+        self.now += 1
+        self.assertIsNone(store.load_valid())
+        # using the token again restarts the inactivity timeout
+        store.save(BbRouter)
+        self.assertEqual(store.load_valid(), BbRouter)
+
+    def test_clear(self):
+        keyring = FakeKeyring()
+        store = self.make_store(KeyringBackend(keyring))
+        store.clear()
+        store.save(BbRouter)
+        self.assertEqual(len(keyring.passwords), 1)
+        store.clear()
+        self.assertEqual(keyring.passwords, {})
+        self.assertIsNone(store.load())
@@ -1,6 +1,7 @@
 import json
 import os
 import sys
+import threading
 import unittest
 from unittest.mock import patch
 import shutil
@@ -14,8 +15,10 @@ from PyQt5 import QtWidgets, QtCore
 from PyQt5.QtTest import QTest
 from PyQt5.Qt import Qt
 
+from ntu_learn_downloader_gui.engine import SyncEngine
 from ntu_learn_downloader_gui.gui.download_dialog import DownloadDialog
 from ntu_learn_downloader_gui.gui.choose_dir_dialog import ChooseDirDialog
+from ntu_learn_downloader_gui.session import SessionManager
 
 FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
 DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp")
@@ -51,6 +54,7 @@ def mock_download(BbRouter, dl_link, full_file_path, callback=None):
     if not os.path.isdir(dir_path):
         os.makedirs(dir_path, exist_ok=True)
     Path(full_file_path).touch()
+    return True
 
 
 # app = QtWidgets.QApplication(sys.argv)
@@ -59,6 +63,21 @@ appctxt.build_settings["test_mode"] = True
 BbRouter = "PLACEHOLDER"
 
 
+class BlockingPrefetcher:
+    """hands over its engine once released, like a prefetcher that is still opening the storage"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.released = threading.Event()
+
+    def take_engine(self):
+        self.released.wait(5)
+        return self.engine
+
+    def attach(self, callback=None):
+        return self.engine.crawl(courses_fixture, callback)
+
+
 def remove_test_dir():
     if os.path.exists(DOWNLOAD_DIR) and os.path.isdir(DOWNLOAD_DIR):
         shutil.rmtree(DOWNLOAD_DIR)
@@ -68,7 +87,15 @@ def remove_test_dir():
 class TestDownloadDialogBase(unittest.TestCase):
     def setUp(self):
         remove_test_dir()
+        # size probes must not reach NTU Learn
+        content_length = patch(
+            "ntu_learn_downloader_gui.scheduler.get_content_length", return_value=1024
+        )
+        content_length.start()
+        self.addCleanup(content_length.stop)
         self.form = DownloadDialog(appctxt, BbRouter, DOWNLOAD_DIR, courses_fixture, ChooseDirDialog)
+        # the storage is opened in the background
+        self.wait_for_workers()
 
     @classmethod
     def tearDownClass(cls):
@@ -76,16 +103,27 @@ class TestDownloadDialogBase(unittest.TestCase):
             # print("removing test generated files")
             shutil.rmtree(DOWNLOAD_DIR)
 
+    def wait_for_workers(self):
+        """block until background workers are done and deliver their queued signals, including
+        workers started by those signals, e.g. the crawl once the storage is open
+        """
+        while True:
+            self.form.threadPool.waitForDone()
+            appctxt.app.processEvents()
+            # a crawl can finish before its signals are delivered
+            if not self.form.threadPool.activeThreadCount() and not self.form.loading:
+                break
+
     def assertDirectoryEqual(self, obj1, obj2):
         """ assert that os.walk return values are the same
         """
 
         def toSet(obj):
-            """convert tuple items that are lists to tuples and then converts to a set
+            """convert tuple items that are lists to sorted tuples and then converts to a set
             """
             return set(
                 [
-                    tuple(tuple(x) if isinstance(x, list) else x for x in tup)
+                    tuple(tuple(sorted(x)) if isinstance(x, (list, tuple)) else x for x in tup)
                     for tup in obj
                 ]
             )
@@ -126,43 +164,48 @@ class TestDownloadDialogBase(unittest.TestCase):
         """return numner of visible downloadable items
         """
 
-        def traverse(node):
-            node_type = node.data(0, Qt.UserRole)["type"]
+        model = self.form.tree.model()
+
+        def traverse(index):
+            # expand folders like the view would, children are loaded lazily
+            if model.canFetchMore(index):
+                model.fetchMore(index)
+            node_type = index.data(Qt.UserRole)["type"]
             if node_type in ["file", "recorded_lecture"]:
-                return 0 if node.isHidden() else 1
-            else:
-                return sum(
-                    traverse(node.child(idx)) for idx in range(node.childCount())
-                )
+                return 1
+            return sum(
+                traverse(model.index(row, 0, index)) for row in range(model.rowCount(index))
+            )
 
-        root = self.form.tree.invisibleRootItem()
-        return sum(traverse(root.child(idx)) for idx in range(root.childCount()))
+        return sum(
+            traverse(model.index(row, 0)) for row in range(model.rowCount())
+        )
 
 
 @unittest.mock.patch.dict('ntu_learn_downloader_gui.logging.__dict__', MOCK_CONSTANTS)
 class TestNewDownloadDialog(TestDownloadDialogBase):
     @patch(
-        "ntu_learn_downloader_gui.gui.download_dialog.get_download_dir",
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
         return_value=get_download_dir_fixture,
     )
     @patch(  # TODO add get_recorded_lecture_download_link
-        "ntu_learn_downloader_gui.gui.download_dialog.get_file_download_link",
+        "ntu_learn_downloader_gui.scheduler.get_file_download_link",
         side_effect=mock_get_file_download_link,
     )
-    @patch("ntu_learn_downloader_gui.gui.download_dialog.download", side_effect=mock_download)
+    @patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download)
     def test_fresh_init_and_download_all_files(self, m_download, mock2, mock3):
         self.assertEqual(self.form.data, [])
 
         self.form.handle_reload()
         # QTest.mouseClick(self.form.reloadButton, Qt.LeftButton) # NOTE doesn't work for some reason
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
         # needs to be in a list since self.data is List[Dict]
         self.assertEqual([get_download_dir_fixture], self.form.data)
         self.assertEqual(self.number_of_visible_items(), 1)
 
         # if press download without selecting any files, then nothing should be downloaded
         QTest.mouseClick(self.form.downloadButton, Qt.LeftButton)
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
         self.assertEqual(m_download.call_count, 0)
 
         # select all files
@@ -171,12 +214,12 @@ class TestNewDownloadDialog(TestDownloadDialogBase):
 
         # click download files
         QTest.mouseClick(self.form.downloadButton, Qt.LeftButton)
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
         self.assertEqual(m_download.call_count, 1)
 
         # assert that files have been downloaded
         expected_dir = [
-            (DOWNLOAD_DIR + "/.ntu_learn_downloader", (), ()),
+            (DOWNLOAD_DIR + "/.ntu_learn_downloader", (), ("ignored.json", "link_cache.jsonl")),
             (
                 DOWNLOAD_DIR,
                 ["19S2-CE3007-DIGITAL SIGNAL PROCESSING", ".ntu_learn_downloader"],
@@ -210,10 +253,51 @@ class TestNewDownloadDialog(TestDownloadDialogBase):
         self.assertObjEquals(self.form.data[0], expected_data)
         self.assertEqual(self.number_of_visible_items(), 0)  # not more visible items
 
+    @patch(
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
+        return_value=get_download_dir_fixture,
+    )
+    @patch(
+        "ntu_learn_downloader_gui.scheduler.get_file_download_link",
+        side_effect=mock_get_file_download_link,
+    )
+    def test_reload_waits_for_the_download(self, _m_get_file_dl_link, m_get_download_dir):
+        self.form.handle_reload()
+        self.wait_for_workers()
+        self.assertTrue(self.form.reloadButton.isEnabled())
+
+        started, released = threading.Event(), threading.Event()
+
+        def blocking_download(*args, **kwargs):
+            started.set()
+            released.wait(5)
+            return mock_download(*args, **kwargs)
+
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=blocking_download):
+            QTest.mouseClick(self.form.selectAllButton, Qt.LeftButton)
+            QTest.mouseClick(self.form.downloadButton, Qt.LeftButton)
+            self.assertTrue(started.wait(5))
+            self.assertFalse(self.form.reloadButton.isEnabled())
+            # a reload would replace the node data the download is updating
+            self.form.handle_reload()
+            self.assertFalse(self.form.loading)
+            released.set()
+            self.wait_for_workers()
+
+        self.assertEqual(m_get_download_dir.call_count, 1)
+        self.assertTrue(self.form.reloadButton.isEnabled())
+        self.assertEqual(self.number_of_visible_items(), 0)
+
 
 class TestExistingDownloadDialog(TestDownloadDialogBase):
     def setUp(self):
         remove_test_dir()
+        # size probes must not reach NTU Learn
+        content_length = patch(
+            "ntu_learn_downloader_gui.scheduler.get_content_length", return_value=1024
+        )
+        content_length.start()
+        self.addCleanup(content_length.stop)
         # create existing download dir
         Path(STORAGE_DIR).mkdir(parents=True, exist_ok=True)
         shutil.copyfile(
@@ -225,25 +309,47 @@ class TestExistingDownloadDialog(TestDownloadDialogBase):
     def tearDownClass(cls):
         remove_test_dir()
 
+    def open_form(self, m_get_download_dir):
+        """create the dialog and wait until its storage is open. The crawl it starts is held until
+        wait_for_workers so that the saved tree can be checked
+        """
+        crawl_allowed = threading.Event()
+        fixture = m_get_download_dir.return_value
+
+        def get_download_dir(*args, **kwargs):
+            crawl_allowed.wait(5)
+            return fixture
+
+        m_get_download_dir.side_effect = get_download_dir
+        self.addCleanup(crawl_allowed.set)
+        self.crawl_allowed = crawl_allowed
+        self.form = DownloadDialog(appctxt, BbRouter, DOWNLOAD_DIR, courses_fixture, ChooseDirDialog)
+        while self.form.engine is None:
+            QTest.qWait(10)
+
+    def wait_for_workers(self):
+        self.crawl_allowed.set()
+        super().wait_for_workers()
+
     @patch(
-        "ntu_learn_downloader_gui.gui.download_dialog.get_download_dir",
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
         return_value=get_download_dir_fixture_2,
     )
     @patch(  # TODO add get_recorded_lecture_download_link
-        "ntu_learn_downloader_gui.gui.download_dialog.get_file_download_link",
+        "ntu_learn_downloader_gui.scheduler.get_file_download_link",
         side_effect=mock_get_file_download_link,
     )
-    @patch("ntu_learn_downloader_gui.gui.download_dialog.download", side_effect=mock_download)
-    def test_existing_init(self, m_download, m_get_file_dl_link, mock3):
+    @patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download)
+    def test_existing_init(self, m_download, m_get_file_dl_link, m_get_download_dir):
         """simulate last refresh was subset and the new refresh returns subset_2
         """
         # start up
-        self.form = DownloadDialog(appctxt, BbRouter, DOWNLOAD_DIR, courses_fixture, ChooseDirDialog)
+        self.open_form(m_get_download_dir)
         self.assertEqual(self.form.data, saved_download_dir)
 
         # clicking the reload button
         self.form.handle_reload()
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
         # needs to be in a list since self.data is List[Dict]
         self.assertEqual([get_download_dir_fixture_2], self.form.data)
         self.assertEqual(self.number_of_visible_items(), 9)
@@ -254,14 +360,14 @@ class TestExistingDownloadDialog(TestDownloadDialogBase):
 
         # click download files
         QTest.mouseClick(self.form.downloadButton, Qt.LeftButton)
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
         self.assertEqual(m_download.call_count, 9)
         self.assertEqual(m_get_file_dl_link.call_count, 8)
         self.assertEqual(self.number_of_visible_items(), 0)
 
         # assert that pressing refresh does not lead to duplicate nodes
         self.form.handle_reload()
-        numTopLevelItems = self.form.tree.invisibleRootItem().childCount()
+        numTopLevelItems = self.form.tree.model().rowCount()
         self.assertEqual(numTopLevelItems, 1)
 
         self.form.close()
@@ -274,10 +380,53 @@ class TestExistingDownloadDialog(TestDownloadDialogBase):
         self.assertListEqual(saved_data, expected_data)
 
     @patch(
-        "ntu_learn_downloader_gui.gui.download_dialog.get_download_dir",
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
         return_value=get_download_dir_fixture_2,
     )
-    def test_existing_and_ignored_files_dont_appear_on_tree(self, mock1):
+    def test_saved_tree_is_shown_and_updated_in_place(self, m_get_download_dir):
+        self.open_form(m_get_download_dir)
+        model = self.form.model
+        # shown before anything has been crawled, marked as stale
+        self.assertEqual(model.courses, saved_download_dir)
+        self.assertEqual(model.stale, {courses_fixture[0][0]})
+
+        # selection made while the fresh crawl runs is kept
+        model.setData(model.index(0, 0), Qt.Checked, Qt.CheckStateRole)
+        self.wait_for_workers()
+        self.assertEqual([get_download_dir_fixture_2], self.form.data)
+        self.assertEqual(model.stale, set())
+        self.assertEqual(model.index(0, 0).data(Qt.CheckStateRole), Qt.Checked)
+        self.assertEqual(len(model.checked_items()), 9)
+        self.form.close()
+
+    @patch(
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
+        return_value=get_download_dir_fixture_2,
+    )
+    def test_prefetched_engine_is_taken_over_in_the_background(self, _m_get_download_dir):
+        engine = SyncEngine(SessionManager(BbRouter), DOWNLOAD_DIR)
+        prefetcher = BlockingPrefetcher(engine)
+        self.crawl_allowed = threading.Event()
+        self.form = DownloadDialog(
+            appctxt, BbRouter, DOWNLOAD_DIR, courses_fixture, ChooseDirDialog, prefetcher=prefetcher
+        )
+        # the dialog is up while the prefetcher is still opening the storage
+        self.assertIsNone(self.form.engine)
+        self.assertFalse(self.form.reloadButton.isEnabled())
+        self.assertFalse(self.form.downloadButton.isEnabled())
+
+        prefetcher.released.set()
+        self.wait_for_workers()
+        self.assertIs(self.form.engine, engine)
+        self.assertEqual([get_download_dir_fixture_2], self.form.data)
+        self.assertTrue(self.form.reloadButton.isEnabled())
+        self.form.close()
+
+    @patch(
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
+        return_value=get_download_dir_fixture_2,
+    )
+    def test_existing_and_ignored_files_dont_appear_on_tree(self, m_get_download_dir):
         # load previously downloaded files
         prev_downloaded_files = [
             (
@@ -310,12 +459,12 @@ class TestExistingDownloadDialog(TestDownloadDialogBase):
             Path(os.path.join(target_dir, "." + name)).touch()
 
         # start up
-        self.form = DownloadDialog(appctxt, BbRouter, DOWNLOAD_DIR, courses_fixture, ChooseDirDialog)
+        self.open_form(m_get_download_dir)
         self.assertEqual(self.form.data, saved_download_dir)
 
         # clicking the reload button
         self.form.handle_reload()
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
         # needs to be in a list since self.data is List[Dict]
         self.assertEqual([get_download_dir_fixture_2], self.form.data)
         # 9 - 1 (already downloaded) - 1 (ignored) = 8
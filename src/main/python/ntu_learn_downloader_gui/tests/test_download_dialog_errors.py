@@ -11,6 +11,7 @@ import shutil
 from pathlib import Path
 
 import ntu_learn_downloader
+import requests
 from ntu_learn_downloader_gui.tests.mock_server import MOCK_CONSTANTS
 
 from fbs_runtime.application_context.PyQt5 import ApplicationContext
@@ -41,6 +42,9 @@ predownload_to_download_mapping = json.load(
 )
 
 
+FAILING_LINK = "https://ntulearn.ntu.edu.sg/bbcswebdav/pid-2015986-dt-content-rid-10582032_1/xid-10582032_1"
+
+
 def mock_get_file_download_link_with_errors(error_links_w_fails={}):
     error_counter = error_links_w_fails.copy()
     def get_file_download_link(BbRouter, predownload_link):
@@ -61,6 +65,7 @@ def mock_download(BbRouter, dl_link, full_file_path, callback=None):
     if not os.path.isdir(dir_path):
         os.makedirs(dir_path, exist_ok=True)
     Path(full_file_path).touch()
+    return True
 
 
 # app = QtWidgets.QApplication(sys.argv)
@@ -78,7 +83,15 @@ def remove_test_dir():
 class TestDownloadDialogBase(unittest.TestCase):
     def setUp(self):
         remove_test_dir()
+        # size probes must not reach NTU Learn
+        content_length = patch(
+            "ntu_learn_downloader_gui.scheduler.get_content_length", return_value=1024
+        )
+        content_length.start()
+        self.addCleanup(content_length.stop)
         self.form = DownloadDialog(appctxt, BbRouter, DOWNLOAD_DIR, courses_fixture, ChooseDirDialog)
+        # the storage is opened in the background
+        self.wait_for_workers()
 
     @classmethod
     def tearDownClass(cls):
@@ -86,24 +99,44 @@ class TestDownloadDialogBase(unittest.TestCase):
             # print("removing test generated files")
             shutil.rmtree(DOWNLOAD_DIR)
 
+    def wait_for_workers(self):
+        """block until background workers are done and deliver their queued signals, including
+        workers started by those signals, e.g. the crawl once the storage is open
+        """
+        while True:
+            self.form.threadPool.waitForDone()
+            appctxt.app.processEvents()
+            # a crawl can finish before its signals are delivered
+            if not self.form.threadPool.activeThreadCount() and not self.form.loading:
+                break
+
+    def get_lookups(self, m_get_file_dl_link, predownload_link):
+        """number of times the download link of predownload_link was resolved"""
+        return sum(
+            1 for call in m_get_file_dl_link.call_args_list if call[0][1] == predownload_link
+        )
+
     def get_visible_items(self):
         """return numner of visible downloadable items
         """
 
         items = []
-        def traverse(node):
-            node_type = node.data(0, Qt.UserRole)["type"]
-            node_name = node.data(0, Qt.UserRole)["name"]
-            if node_type in ["file", "recorded_lecture"] and not node.isHidden():
-                items.append(node_name)
+        model = self.form.tree.model()
+
+        def traverse(index):
+            # expand folders like the view would, children are loaded lazily
+            if model.canFetchMore(index):
+                model.fetchMore(index)
+            node_data = index.data(Qt.UserRole)
+            if node_data["type"] in ["file", "recorded_lecture"]:
+                items.append(node_data["name"])
             else:
-                for idx in range(node.childCount()):
-                    traverse(node.child(idx)) 
+                for row in range(model.rowCount(index)):
+                    traverse(model.index(row, 0, index))
+
+        for row in range(model.rowCount()):
+            traverse(model.index(row, 0))
 
-        root = self.form.tree.invisibleRootItem()
-        for idx in range(root.childCount()):
-            traverse(root.child(idx))
- 
         return items
 
 
@@ -111,20 +144,20 @@ class TestDownloadDialogBase(unittest.TestCase):
 class TestNewDownloadDialog(TestDownloadDialogBase):
     @patch("ntu_learn_downloader_gui.gui.download_dialog.DownloadDialog.handle_error")
     @patch(
-        "ntu_learn_downloader_gui.gui.download_dialog.get_download_dir",
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
         return_value=get_download_dir_fixture_2,
     )
     @patch(  
-        "ntu_learn_downloader_gui.gui.download_dialog.get_file_download_link",
-        side_effect=mock_get_file_download_link_with_errors(error_links_w_fails={'https://ntulearn.ntu.edu.sg/bbcswebdav/pid-2015986-dt-content-rid-10582032_1/xid-10582032_1': 1}),
+        "ntu_learn_downloader_gui.scheduler.get_file_download_link",
+        side_effect=mock_get_file_download_link_with_errors(error_links_w_fails={FAILING_LINK: 1}),
     )
-    @patch("ntu_learn_downloader_gui.gui.download_dialog.download", side_effect=mock_download)
+    @patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download)
     def test_get_download_link_failure_doesnt_hang_download(self, m_download, m_get_file_dl_link, mock3, mock_handle_error):
         self.assertEqual(self.form.data, [])
 
         self.form.handle_reload()
         # QTest.mouseClick(self.form.reloadButton, Qt.LeftButton) # NOTE doesn't work for some reason
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
         # needs to be in a list since self.data is List[Dict]
         self.assertEqual([get_download_dir_fixture_2], self.form.data)
         self.assertEqual(len(self.get_visible_items()), 9)
@@ -135,10 +168,13 @@ class TestNewDownloadDialog(TestDownloadDialogBase):
 
         # click download files
         QTest.mouseClick(self.form.downloadButton, Qt.LeftButton)
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
 
         # 9 - 1 = 8 since 1 download failed
         self.assertEqual(m_download.call_count, 8)
+        # the size probe and the resolver share every lookup, also the one that failed, whichever
+        # of them gets to an item first
+        self.assertEqual(self.get_lookups(m_get_file_dl_link, FAILING_LINK), 1)
         self.assertEqual(m_get_file_dl_link.call_count, 9)
         # 1 solo file that failed to download
         self.assertListEqual(['P2-Lecture Week9_UpDownSampling.pptx'], self.get_visible_items())
@@ -152,10 +188,49 @@ class TestNewDownloadDialog(TestDownloadDialogBase):
 
         # click download files
         QTest.mouseClick(self.form.downloadButton, Qt.LeftButton)
-        appctxt.app.processEvents(QtCore.QEventLoop.AllEvents, 500)
+        self.wait_for_workers()
 
         mock_handle_error.assert_called_once()
+        self.assertEqual(self.get_lookups(m_get_file_dl_link, FAILING_LINK), 2)
         self.assertEqual(m_get_file_dl_link.call_count, 10)
         self.assertEqual(len(self.get_visible_items()), 0)
         self.assertEqual(m_download.call_count, 9) 
 
+
+    @patch("ntu_learn_downloader_gui.scheduler.RETRY_BASE_DELAY", 0.001)
+    @patch(
+        "ntu_learn_downloader_gui.crawler.get_download_dir",
+        # a copy, other tests write the resolved links into the fixture
+        return_value=json.loads(json.dumps(get_download_dir_fixture_2)),
+    )
+    @patch("ntu_learn_downloader_gui.scheduler.get_file_download_link")
+    @patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download)
+    def test_only_permanent_failures_are_listed(self, m_download, m_get_file_dl_link, mock3):
+        transient_link = "https://ntulearn.ntu.edu.sg/bbcswebdav/pid-1993635-dt-content-rid-10259834_1/xid-10259834_1"
+        permanent_link = "https://ntulearn.ntu.edu.sg/bbcswebdav/pid-2015986-dt-content-rid-10582032_1/xid-10582032_1"
+        failures = {transient_link: 2}
+
+        def get_file_download_link(BbRouter, predownload_link):
+            if predownload_link == permanent_link:
+                raise ValueError("Failed to get download link")
+            if failures.get(predownload_link):
+                failures[predownload_link] -= 1
+                raise requests.ConnectionError("connection reset")
+            return predownload_to_download_mapping[predownload_link]
+
+        m_get_file_dl_link.side_effect = get_file_download_link
+        # list items left for the interpreter shutdown are destroyed outside of the GUI thread
+        self.addCleanup(self.form.failureList.clear)
+        self.form.handle_reload()
+        self.wait_for_workers()
+        QTest.mouseClick(self.form.selectAllButton, Qt.LeftButton)
+        appctxt.app.processEvents()
+        QTest.mouseClick(self.form.downloadButton, Qt.LeftButton)
+        self.wait_for_workers()
+
+        self.assertEqual(m_download.call_count, 8)
+        self.assertEqual(self.form.failureList.count(), 1)
+        self.assertTrue(self.form.failureList.item(0).text().startswith("P2-Lecture Week9"))
+        self.assertIn("ValueError: Failed to get download link", self.form.failureList.item(0).text())
+        self.assertFalse(self.form.failureGroupBox.isHidden())
+        self.assertIn("1 failed (2 retries)", self.form.downloadProgressText.text())
@@ -0,0 +1,153 @@
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from PyQt5.Qt import Qt
+from PyQt5.QtCore import QPersistentModelIndex
+from PyQt5.QtTest import QAbstractItemModelTester
+
+from ntu_learn_downloader_gui.gui.download_tree_model import (
+    STALE_TOOLTIP,
+    DownloadTreeModel,
+    DownloadTreeProxyModel,
+)
+
+DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_tree_model")
+
+
+def file_node(name, filename=None):
+    return {
+        "type": "file",
+        "name": name,
+        "predownload_link": "predownload/" + name,
+        "download_link": None,
+        "filename": filename,
+    }
+
+
+def course():
+    return {
+        "type": "folder",
+        "name": "CE3007",
+        "children": [
+            {"type": "folder", "name": "Labs", "children": [file_node("Lab 1.pdf")]},
+            file_node("Lecture 1.pdf", "lecture1.pdf"),
+            file_node("Lecture 2.pdf"),
+        ],
+    }
+
+
+class TestDownloadTreeModel(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        os.makedirs(os.path.join(DOWNLOAD_DIR, "CE3007"))
+        # Lecture 1.pdf has been downloaded already
+        Path(os.path.join(DOWNLOAD_DIR, "CE3007", "lecture1.pdf")).touch()
+        self.model = DownloadTreeModel(DOWNLOAD_DIR, {})
+        self.model.set_courses([course()])
+        self.root = self.model.index(0, 0)
+
+    def tearDown(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    def test_children_are_fetched_lazily(self):
+        self.assertTrue(self.model.hasChildren(self.root))
+        self.assertEqual(self.model.rowCount(self.root), 0)
+        self.assertTrue(self.model.canFetchMore(self.root))
+        self.model.fetchMore(self.root)
+        self.assertEqual(self.model.rowCount(self.root), 3)
+        self.assertFalse(self.model.canFetchMore(self.root))
+
+    def test_checked_folder_selects_unfetched_descendants(self):
+        self.model.setData(self.root, Qt.Checked, Qt.CheckStateRole)
+        self.assertEqual(
+            [(path, data["name"]) for path, data in self.model.checked_items()],
+            [
+                (os.path.join(DOWNLOAD_DIR, "CE3007", "Labs"), "Lab 1.pdf"),
+                (os.path.join(DOWNLOAD_DIR, "CE3007"), "Lecture 2.pdf"),
+            ],
+        )
+
+    def test_check_state_propagates_up(self):
+        self.model.set_all_check_states(Qt.Checked)
+        self.model.fetchMore(self.root)
+        labs = self.model.index(0, 0, self.root)
+        self.model.setData(labs, Qt.Unchecked, Qt.CheckStateRole)
+        self.assertEqual(self.root.data(Qt.CheckStateRole), Qt.PartiallyChecked)
+        # hidden items do not count towards the folder state
+        lecture_2 = self.model.index(2, 0, self.root)
+        self.model.setData(lecture_2, Qt.Unchecked, Qt.CheckStateRole)
+        self.assertEqual(self.root.data(Qt.CheckStateRole), Qt.Unchecked)
+
+    def test_proxy_hides_present_items(self):
+        proxy = DownloadTreeProxyModel()
+        proxy.setSourceModel(self.model)
+        root = proxy.index(0, 0)
+        proxy.fetchMore(root)
+        names = [proxy.index(row, 0, root).data() for row in range(proxy.rowCount(root))]
+        self.assertEqual(names, ["Labs", "Lecture 2.pdf"])
+
+
+class TestUpdateCourse(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        os.makedirs(DOWNLOAD_DIR)
+        self.model = DownloadTreeModel(DOWNLOAD_DIR, {})
+        self.model.set_courses([course()])
+        # checks every signal the model emits against its rows
+        self.tester = QAbstractItemModelTester(
+            self.model, QAbstractItemModelTester.FailureReportingMode.Fatal
+        )
+        self.root = self.model.index(0, 0)
+        self.model.fetchMore(self.root)
+        self.labs = QPersistentModelIndex(self.model.index(0, 0, self.root))
+        self.model.fetchMore(self.model.index(0, 0, self.root))
+        self.model.setData(self.model.index(0, 0, self.root), Qt.Checked, Qt.CheckStateRole)
+
+    def tearDown(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    def names(self, parent):
+        return [
+            self.model.index(row, 0, parent).data() for row in range(self.model.rowCount(parent))
+        ]
+
+    def test_rows_are_diffed_in_place(self):
+        fresh = course()
+        labs, lecture_1, _lecture_2 = fresh["children"]
+        labs["children"].append(file_node("Lab 2.pdf"))
+        tutorials = {"type": "folder", "name": "Tutorials", "children": []}
+        fresh["children"] = [labs, lecture_1, tutorials]
+        self.model.update_course(0, fresh)
+
+        self.assertIs(self.model.courses[0], fresh)
+        self.assertEqual(self.names(self.root), ["Labs", "Lecture 1.pdf", "Tutorials"])
+        # the view keeps the expanded, checked folder and new files in it are checked
+        self.assertTrue(self.labs.isValid())
+        self.assertEqual(
+            self.names(self.model.index(self.labs.row(), 0, self.root)), ["Lab 1.pdf", "Lab 2.pdf"]
+        )
+        self.assertEqual(self.labs.data(Qt.CheckStateRole), Qt.Checked)
+        self.assertEqual(
+            [data["name"] for _path, data in self.model.checked_items()], ["Lab 1.pdf", "Lab 2.pdf"]
+        )
+
+    def test_moved_rows_keep_their_check_state(self):
+        fresh = course()
+        labs, lecture_1, lecture_2 = fresh["children"]
+        fresh["children"] = [lecture_1, lecture_2, labs]
+        self.model.update_course(0, fresh)
+
+        self.assertEqual(self.names(self.root), ["Lecture 1.pdf", "Lecture 2.pdf", "Labs"])
+        labs_index = self.model.index(2, 0, self.root)
+        self.assertEqual(labs_index.data(Qt.CheckStateRole), Qt.Checked)
+        self.assertEqual(
+            [data["name"] for _path, data in self.model.checked_items()], ["Lab 1.pdf"]
+        )
+
+    def test_stale_courses_are_marked_until_updated(self):
+        self.model.set_stale(["CE3007"])
+        self.assertEqual(self.root.data(Qt.ToolTipRole), STALE_TOOLTIP)
+        self.model.update_course(0, course())
+        self.assertIsNone(self.root.data(Qt.ToolTipRole))
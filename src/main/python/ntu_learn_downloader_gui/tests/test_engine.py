@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from ntu_learn_downloader_gui.cli import select_modules
+from ntu_learn_downloader_gui.engine import SyncEngine
+from ntu_learn_downloader_gui.session import SessionManager
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_engine")
+PYTHON_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
+
+courses_fixture = [("19S2-CE3007-DIGITAL SIGNAL PROCESSING", "PLACEHOLDER")]
+with open(os.path.join(FIXTURES_PATH, "CE3007_predownload_subset_2.json")) as f:
+    get_download_dir_fixture_2 = json.load(f)
+with open(os.path.join(FIXTURES_PATH, "predownload_to_download_link.json")) as f:
+    predownload_to_download_mapping = json.load(f)
+
+
+def mock_get_file_download_link(BbRouter, predownload_link):
+    return predownload_to_download_mapping[predownload_link]
+
+
+def mock_download(BbRouter, dl_link, full_file_path, callback=None):
+    os.makedirs(os.path.dirname(full_file_path), exist_ok=True)
+    Path(full_file_path).touch()
+    return True
+
+
+def mock_get_download_dir(*args, **kwargs):
+    # every crawl returns fresh node data, like NTU Learn would
+    return json.loads(json.dumps(get_download_dir_fixture_2))
+
+
+@patch("ntu_learn_downloader_gui.crawler.get_download_dir", side_effect=mock_get_download_dir)
+@patch(
+    "ntu_learn_downloader_gui.scheduler.get_file_download_link",
+    side_effect=mock_get_file_download_link,
+)
+@patch("ntu_learn_downloader_gui.scheduler.get_recorded_lecture_download_link")
+@patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download)
+class TestSyncEngine(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        self.session = SessionManager("PLACEHOLDER")
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    def test_sync_downloads_new_items_once(self, m_download, m_lecture_link, *mocks):
+        m_lecture_link.return_value = "https://example.com/lecture.mp4"
+        engine = SyncEngine(self.session, DOWNLOAD_DIR)
+        summary = engine.sync(courses_fixture, 2)
+        engine.close()
+        self.assertEqual((summary.pending, summary.downloaded, summary.failed), (9, 9, 0))
+        with open(engine.metrics_path) as f:
+            phases = {
+                histogram["labels"].get("phase")
+                for histogram in json.load(f)["histograms"]
+                if histogram["name"] == "phase_seconds"
+            }
+        self.assertLessEqual({"crawl", "download"}, phases)
+        self.assertEqual(summary.failures, [])
+        self.assertEqual(json.loads(json.dumps(summary.to_dict()))["downloaded"], 9)
+
+        # resolved links were saved and every file is present now
+        engine = SyncEngine(self.session, DOWNLOAD_DIR)
+        self.assertTrue(all(node.get("filename") for _, node in engine.pending_items()))
+        summary = engine.sync(courses_fixture, 2)
+        engine.close()
+        self.assertEqual((summary.pending, summary.downloaded), (0, 0))
+        self.assertEqual(m_download.call_count, 9)
+
+    def test_links_are_saved_as_soon_as_they_resolve(self, m_download, m_lecture_link, *mocks):
+        m_lecture_link.return_value = "https://example.com/lecture.mp4"
+        engine = SyncEngine(self.session, DOWNLOAD_DIR, "sqlite")
+        saved_before_transfer = []
+
+        def download_after_save(BbRouter, dl_link, full_file_path, callback=None):
+            # a crash during this transfer must not lose its link
+            saved = json.dumps(engine.storage.download_dir)
+            saved_before_transfer.append(json.dumps(dl_link) in saved)
+            return mock_download(BbRouter, dl_link, full_file_path, callback)
+
+        m_download.side_effect = download_after_save
+        with patch.object(engine.storage, "update_nodes", wraps=engine.storage.update_nodes) as m:
+            summary = engine.sync(courses_fixture, 2)
+        engine.close()
+        self.assertEqual(summary.downloaded, 9)
+        self.assertEqual(saved_before_transfer, [True] * 9)
+        self.assertEqual(m.call_count, 9)
+        self.assertTrue(all(len(call[0][0]) == 1 for call in m.call_args_list))
+
+    def test_ignored_items_and_failures(self, m_download, m_lecture_link, *mocks):
+        m_lecture_link.side_effect = RuntimeError("lecture page changed")
+        engine = SyncEngine(self.session, DOWNLOAD_DIR)
+        courses = engine.crawl(courses_fixture)
+        path, node_data = engine.pending_items(courses)[0]
+        engine.ignores.ignore([(path, node_data["name"])])
+
+        summary = engine.sync(courses_fixture, 2, dry_run=True)
+        self.assertEqual((summary.pending, summary.downloaded), (8, 0))
+        self.assertEqual(m_download.call_count, 0)
+
+        summary = engine.sync(courses_fixture, 2)
+        engine.close()
+        self.assertEqual(summary.failed, len(summary.failures))
+        self.assertEqual(summary.downloaded + summary.failed, 8)
+        self.assertTrue(all("RuntimeError" in failure["trace"] for failure in summary.failures))
+
+
+class TestCli(unittest.TestCase):
+    def test_select_modules(self):
+        courses = [("CE3007", "1"), ("CE3005", "2")]
+        self.assertEqual(select_modules(courses, None), courses)
+        self.assertEqual(select_modules(courses, ["2"]), [("CE3005", "2")])
+        with self.assertRaises(ValueError):
+            select_modules(courses, ["3"])
+
+    def test_does_not_import_qt(self):
+        code = "import sys, ntu_learn_downloader_gui.cli; print('PyQt5' in sys.modules)"
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=PYTHON_DIR)
+        self.assertEqual(output.strip(), b"False")
+
+
+if __name__ == "__main__":
+    unittest.main()
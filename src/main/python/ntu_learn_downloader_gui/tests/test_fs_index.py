@@ -0,0 +1,50 @@
+import os
+import shutil
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from ntu_learn_downloader_gui.fs_index import DirectoryIndex
+
+INDEX_DIR = os.path.join(os.path.dirname(__file__), "temp_fs_index")
+
+
+class TestDirectoryIndex(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(INDEX_DIR, ignore_errors=True)
+        os.makedirs(INDEX_DIR)
+        Path(os.path.join(INDEX_DIR, "a.pdf")).touch()
+
+    def tearDown(self):
+        shutil.rmtree(INDEX_DIR, ignore_errors=True)
+
+    def test_directory_is_listed_once(self):
+        index = DirectoryIndex()
+        self.assertTrue(index.exists(INDEX_DIR, "a.pdf"))
+        self.assertTrue(index.exists(INDEX_DIR + os.sep, "a.pdf"))
+
+        # files created behind the index's back are not seen until it is cleared
+        Path(os.path.join(INDEX_DIR, "b.pdf")).touch()
+        self.assertFalse(index.exists(INDEX_DIR, "b.pdf"))
+        index.clear(INDEX_DIR)
+        self.assertTrue(index.exists(INDEX_DIR, "b.pdf"))
+
+    def test_add_to_missing_directory(self):
+        index = DirectoryIndex()
+        missing = os.path.join(INDEX_DIR, "missing")
+        self.assertFalse(index.exists(missing, "c.pdf"))
+        index.add(missing, "c.pdf")
+        self.assertTrue(index.exists(missing, "c.pdf"))
+
+    def test_case_insensitive_filesystem(self):
+        Path(os.path.join(INDEX_DIR, "Slides.PDF")).touch()
+        with patch("ntu_learn_downloader_gui.fs_index.CASE_INSENSITIVE", True):
+            index = DirectoryIndex()
+            self.assertTrue(index.exists(INDEX_DIR, "slides.pdf"))
+            self.assertTrue(index.exists(INDEX_DIR.upper(), "A.PDF"))
+            index.add(INDEX_DIR, "Notes.pdf")
+            self.assertTrue(index.exists(INDEX_DIR, "NOTES.pdf"))
+
+        with patch("ntu_learn_downloader_gui.fs_index.CASE_INSENSITIVE", False):
+            index = DirectoryIndex()
+            self.assertFalse(index.exists(INDEX_DIR, "slides.pdf"))
@@ -0,0 +1,65 @@
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from ntu_learn_downloader.storage import STORAGE_DIR
+
+from ntu_learn_downloader_gui.ignore_manifest import IgnoreManifest, find_dummy_files
+from ntu_learn_downloader_gui.storage import SQLiteStorage
+
+DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_ignore_manifest")
+COURSE_DIR = os.path.join(DOWNLOAD_DIR, "course")
+MANIFEST_DIR = os.path.join(DOWNLOAD_DIR, STORAGE_DIR)
+
+
+class TestIgnoreManifest(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        os.makedirs(COURSE_DIR)
+        os.makedirs(MANIFEST_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    def test_dummy_files_are_imported_once(self):
+        Path(os.path.join(COURSE_DIR, ".tut1.pdf")).touch()
+        Path(os.path.join(COURSE_DIR, ".DS_Store")).touch()
+        with open(os.path.join(COURSE_DIR, ".notes"), "w") as f:
+            f.write("not empty")
+        self.assertEqual(find_dummy_files(DOWNLOAD_DIR), [(COURSE_DIR, "tut1.pdf")])
+
+        ignores = IgnoreManifest(MANIFEST_DIR, DOWNLOAD_DIR)
+        self.assertTrue(ignores.is_ignored(COURSE_DIR, "tut1.pdf"))
+        # dummy files are left in place
+        self.assertTrue(os.path.exists(os.path.join(COURSE_DIR, ".tut1.pdf")))
+
+        ignores.unignore(["course/tut1.pdf"])
+        self.assertFalse(IgnoreManifest(MANIFEST_DIR, DOWNLOAD_DIR).is_ignored(COURSE_DIR, "tut1.pdf"))
+
+    def test_ignore_and_unignore_persist(self):
+        ignores = IgnoreManifest(MANIFEST_DIR, DOWNLOAD_DIR)
+        ignores.ignore([(COURSE_DIR, "tut1.pdf"), (COURSE_DIR, "tut2.pdf"), (DOWNLOAD_DIR, "a.txt")])
+        ignores.unignore(["course/tut2.pdf"])
+
+        reopened = IgnoreManifest(MANIFEST_DIR, DOWNLOAD_DIR)
+        self.assertEqual([key for key, _ in reopened.entries()], ["a.txt", "course/tut1.pdf"])
+        self.assertTrue(reopened.is_ignored(COURSE_DIR, "tut1.pdf"))
+        self.assertFalse(reopened.is_ignored(COURSE_DIR, "tut2.pdf"))
+
+    def test_sqlite_manifest_takes_over_json_manifest(self):
+        IgnoreManifest(MANIFEST_DIR, DOWNLOAD_DIR).ignore([(COURSE_DIR, "tut1.pdf")])
+
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        self.assertTrue(storage.ignores.is_ignored(COURSE_DIR, "tut1.pdf"))
+        storage.ignores.ignore([(COURSE_DIR, "tut2.pdf")])
+        storage.ignores.unignore(["course/tut1.pdf"])
+        storage.close()
+
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        self.assertEqual([key for key, _ in storage.ignores.entries()], ["course/tut2.pdf"])
+        storage.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
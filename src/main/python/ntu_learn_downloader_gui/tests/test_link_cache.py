@@ -0,0 +1,72 @@
+import os
+import shutil
+import unittest
+
+from ntu_learn_downloader_gui.link_cache import (
+    FILE_LINK_TTL,
+    RECORDED_LECTURE_LINK_TTL,
+    LinkCache,
+    get_link_ttl,
+)
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "temp_link_cache")
+CACHE_PATH = os.path.join(CACHE_DIR, "link_cache.jsonl")
+
+
+class TestLinkCache(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        os.makedirs(CACHE_DIR)
+        self.now = 1000.0
+
+    def tearDown(self):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+    def open_cache(self):
+        return LinkCache(CACHE_PATH, clock=lambda: self.now)
+
+    def test_entries_survive_without_close(self):
+        cache = self.open_cache()
+        cache.put("/pre/a", "https://x/a.pdf", "a.pdf", FILE_LINK_TTL)
+        # no close, as if the app was killed mid-batch
+        self.assertEqual(self.open_cache().get("/pre/a"), ("https://x/a.pdf", "a.pdf"))
+        cache.close()
+
+    def test_entries_expire(self):
+        cache = self.open_cache()
+        cache.put("/pre/lecture", "https://x/lecture.mp4", "lecture.mp4", get_link_ttl("recorded_lecture"))
+        self.now += RECORDED_LECTURE_LINK_TTL - 1
+        self.assertIsNotNone(cache.get("/pre/lecture"))
+        self.now += 1
+        self.assertIsNone(cache.get("/pre/lecture"))
+        cache.close()
+
+    def test_invalidate_and_truncated_line(self):
+        cache = self.open_cache()
+        cache.put("/pre/a", "https://x/a.pdf", "a.pdf", FILE_LINK_TTL)
+        cache.put("/pre/b", "https://x/b.pdf", "b.pdf", FILE_LINK_TTL)
+        cache.invalidate("/pre/a")
+        cache.close()
+        with open(CACHE_PATH, "a") as f:
+            f.write('{"predownload_link": "/pre/c", "downl')
+
+        cache = self.open_cache()
+        self.assertIsNone(cache.get("/pre/a"))
+        self.assertEqual(cache.get("/pre/b"), ("https://x/b.pdf", "b.pdf"))
+        cache.close()
+
+    def test_sizes_are_kept_with_their_link(self):
+        cache = self.open_cache()
+        cache.put("/pre/a", "https://x/a.pdf", "a.pdf", FILE_LINK_TTL)
+        cache.set_size("/pre/a", "https://x/a.pdf", 2048)
+        # the size of another link is not cached
+        cache.set_size("/pre/a", "https://x/old/a.pdf", 1)
+        cache.set_size("/pre/b", "https://x/b.pdf", 1)
+        cache.close()
+
+        cache = self.open_cache()
+        self.assertEqual(cache.get_size("/pre/a"), 2048)
+        self.assertIsNone(cache.get_size("/pre/b"))
+        cache.put("/pre/a", "https://x/new/a.pdf", "a.pdf", FILE_LINK_TTL)
+        self.assertIsNone(cache.get_size("/pre/a"))
+        cache.close()
@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+import unittest
+
+from ntu_learn_downloader_gui.metrics import Histogram, Metrics
+
+TEMP_DIR = os.path.join(os.path.dirname(__file__), "temp_metrics")
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets(self):
+        histogram = Histogram((1, 5))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.cumulative_counts(), [("1", 2), ("5", 3), ("+Inf", 4)])
+        self.assertEqual((histogram.count, histogram.sum), (4, 14.5))
+        self.assertEqual((histogram.min, histogram.max), (0.5, 10))
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+        self.metrics = Metrics(clock=lambda: 1600000000.0)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def test_counters_and_cache_hit_rates(self):
+        self.metrics.inc("downloads_total", mode="single")
+        self.metrics.inc("downloads_total", 2, mode="single")
+        for hit in (True, True, True, False):
+            self.metrics.count_cache("link", hit)
+        self.metrics.count_cache("page", False)
+
+        counters = {
+            (counter["name"], tuple(counter["labels"].items())): counter["value"]
+            for counter in self.metrics.to_dict()["counters"]
+        }
+        self.assertEqual(counters[("downloads_total", (("mode", "single"),))], 3)
+        self.assertEqual(self.metrics.cache_hit_rates(), {"link": 0.75, "page": 0.0})
+
+    def test_timer_records_when_raising(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.timer("phase_seconds", phase="crawl"):
+                raise ValueError
+        (histogram,) = self.metrics.to_dict()["histograms"]
+        self.assertEqual(histogram["labels"], {"phase": "crawl"})
+        self.assertEqual(histogram["count"], 1)
+
+    def test_prometheus_format(self):
+        self.metrics.inc("transfers_total", lane="videos", status="downloaded")
+        self.metrics.observe("request_seconds", 0.2, buckets=(0.1, 1), endpoint="file_link")
+        self.assertEqual(
+            self.metrics.to_prometheus().splitlines(),
+            [
+                "# TYPE ntu_learn_downloader_transfers_total counter",
+                'ntu_learn_downloader_transfers_total{lane="videos",status="downloaded"} 1',
+                "# TYPE ntu_learn_downloader_request_seconds histogram",
+                'ntu_learn_downloader_request_seconds_bucket{endpoint="file_link",le="0.1"} 0',
+                'ntu_learn_downloader_request_seconds_bucket{endpoint="file_link",le="1"} 1',
+                'ntu_learn_downloader_request_seconds_bucket{endpoint="file_link",le="+Inf"} 1',
+                'ntu_learn_downloader_request_seconds_sum{endpoint="file_link"} 0.2',
+                'ntu_learn_downloader_request_seconds_count{endpoint="file_link"} 1',
+            ],
+        )
+
+    def test_write(self):
+        self.metrics.inc("stale_links_total")
+        json_path = os.path.join(TEMP_DIR, "metrics", self.metrics.session_filename)
+        self.metrics.write(json_path)
+        with open(json_path) as f:
+            data = json.load(f)
+        self.assertEqual(data["counters"], [{"name": "stale_links_total", "labels": {}, "value": 1}])
+
+        prom_path = os.path.join(TEMP_DIR, "metrics.prom")
+        self.metrics.write(prom_path)
+        with open(prom_path) as f:
+            self.assertIn("ntu_learn_downloader_stale_links_total 1", f.read())
+        self.assertFalse(os.path.exists(prom_path + ".tmp"))
+
+        self.metrics.reset()
+        self.assertEqual(self.metrics.to_dict()["counters"], [])
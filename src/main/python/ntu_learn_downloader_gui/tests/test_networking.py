@@ -0,0 +1,165 @@
+import json
+import os
+import shutil
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from ntu_learn_downloader_gui import networking
+from ntu_learn_downloader_gui.networking import (
+    MAX_SPOOLED_EVENTS,
+    RETRY_INTERVAL,
+    VERSION_CACHE_TTL,
+    TelemetryClient,
+    coalesce,
+    get_latest_version,
+)
+
+TEMP_DIR = os.path.join(os.path.dirname(__file__), "temp_networking")
+SPOOL_PATH = os.path.join(TEMP_DIR, "telemetry_spool.jsonl")
+CACHE_PATH = os.path.join(TEMP_DIR, "latest_version.json")
+
+RELEASE = {
+    "version": "1.2.0",
+    "date": "2020-10-01",
+    "link": "https://example.com/release",
+    "title": "Release",
+    "content": "changes",
+}
+
+
+class FakeHttp:
+    def __init__(self):
+        self.online = True
+        self.posted = []
+
+    def post(self, url, data, timeout):
+        if not self.online:
+            raise requests.ConnectionError("offline")
+        self.posted.append((url, data))
+        return MagicMock(status_code=200)
+
+
+def read_spool():
+    with open(SPOOL_PATH) as f:
+        return [json.loads(line) for line in f]
+
+
+@patch("ntu_learn_downloader_gui.networking.BATCH_WINDOW", 0.01)
+class TestTelemetryClient(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+        self.now = 0.0
+        self.http = FakeHttp()
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def make_client(self):
+        return TelemetryClient(SPOOL_PATH, "http://server", self.http, clock=lambda: self.now)
+
+    def test_coalesce(self):
+        events = [
+            {"endpoint": "/download", "data": {"numFiles": 2, "version": "1.0"}},
+            {"endpoint": "/error", "data": {"trace": "t", "version": "1.0"}},
+            {"endpoint": "/download", "data": {"numFiles": 3, "version": "1.0"}},
+        ]
+        self.assertEqual(
+            coalesce(events),
+            [
+                {"endpoint": "/download", "data": {"numFiles": 5, "version": "1.0"}},
+                {"endpoint": "/error", "data": {"trace": "t", "version": "1.0"}},
+            ],
+        )
+        self.assertEqual(events[0]["data"]["numFiles"], 2)
+
+    def test_post_does_not_block(self):
+        release = threading.Event()
+        self.http.post = MagicMock(
+            side_effect=lambda *args, **kwargs: release.wait() and MagicMock(status_code=200)
+        )
+        client = self.make_client()
+        for _ in range(40):
+            client.post("/error", {"trace": "t", "version": "1.0"})
+        self.assertFalse(client.flush(0.05))
+        release.set()
+        self.assertTrue(client.flush(5))
+
+    def test_offline_events_are_spooled_and_sent_later(self):
+        self.http.online = False
+        client = self.make_client()
+        client.post("/error", {"trace": "a", "version": "1.0"})
+        self.assertTrue(client.flush(5))
+        self.assertEqual([event["data"]["trace"] for event in read_spool()], ["a"])
+
+        # no new attempt before the retry interval, even once the server is back
+        self.http.online = True
+        client.post("/error", {"trace": "b", "version": "1.0"})
+        self.assertTrue(client.flush(5))
+        self.assertEqual(self.http.posted, [])
+        self.assertEqual(len(read_spool()), 2)
+
+        self.now += RETRY_INTERVAL
+        client.post("/download", {"numFiles": 1, "version": "1.0"})
+        self.assertTrue(client.flush(5))
+        self.assertEqual(
+            [url for url, _ in self.http.posted],
+            ["http://server/error", "http://server/error", "http://server/download"],
+        )
+        self.assertEqual(read_spool(), [])
+
+    def test_spool_survives_restart_and_is_bounded(self):
+        self.http.online = False
+        client = self.make_client()
+        for idx in range(MAX_SPOOLED_EVENTS + 10):
+            client.post("/error", {"trace": str(idx), "version": "1.0"})
+        self.assertTrue(client.flush(5))
+        spooled = read_spool()
+        self.assertEqual(len(spooled), MAX_SPOOLED_EVENTS)
+        self.assertEqual(spooled[-1]["data"]["trace"], str(MAX_SPOOLED_EVENTS + 9))
+
+        self.http.online = True
+        client = self.make_client()
+        client.post("/download", {"numFiles": 1, "version": "1.0"})
+        self.assertTrue(client.flush(5))
+        self.assertEqual(len(self.http.posted), MAX_SPOOLED_EVENTS + 1)
+
+
+class TestGetLatestVersion(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+        self.now = 1000000.0
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def get_latest_version(self):
+        return get_latest_version("1.0.0", False, CACHE_PATH, clock=lambda: self.now)
+
+    @patch.object(networking.session, "get")
+    def test_cached_for_a_day(self, m_get):
+        m_get.return_value = MagicMock(status_code=200, content=json.dumps(RELEASE).encode())
+        self.assertEqual(self.get_latest_version().version, (1, 2, 0))
+        self.now += VERSION_CACHE_TTL - 1
+        self.assertEqual(self.get_latest_version().title, "Release")
+        self.assertEqual(m_get.call_count, 1)
+
+        self.now += 1
+        self.get_latest_version()
+        self.assertEqual(m_get.call_count, 2)
+
+    @patch("ntu_learn_downloader_gui.networking.post_error")
+    @patch.object(networking.session, "get")
+    def test_expired_cache_when_offline(self, m_get, m_post_error):
+        m_get.side_effect = requests.ConnectionError("offline")
+        self.assertIsNone(self.get_latest_version())
+
+        m_get.side_effect = None
+        m_get.return_value = MagicMock(status_code=200, content=json.dumps(RELEASE).encode())
+        self.get_latest_version()
+        self.now += 2 * VERSION_CACHE_TTL
+        m_get.return_value = MagicMock(status_code=502, content=b"bad gateway")
+        self.assertEqual(self.get_latest_version().version, (1, 2, 0))
+        m_post_error.assert_called_once()
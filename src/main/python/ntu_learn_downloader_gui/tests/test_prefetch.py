@@ -0,0 +1,109 @@
+import os
+import shutil
+import threading
+import unittest
+from unittest.mock import patch
+
+from ntu_learn_downloader_gui.crawler import CrawlCancelled
+from ntu_learn_downloader_gui.engine import SyncEngine
+from ntu_learn_downloader_gui.prefetch import Prefetcher, get_default_modules
+from ntu_learn_downloader_gui.session import SessionManager
+
+DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_prefetch")
+
+courses_fixture = [("B-MODULE", "_2_1"), ("A-MODULE", "_1_1"), ("C-MODULE", "_3_1")]
+
+
+def mock_get_download_dir(session, name, course_id, executor, page_cache, **kwargs):
+    return {"name": name, "type": "folder", "children": []}
+
+
+@patch("ntu_learn_downloader_gui.prefetch.get_courses", return_value=courses_fixture)
+class TestPrefetcher(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        os.makedirs(DOWNLOAD_DIR)
+        self.session = SessionManager("PLACEHOLDER")
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    def test_default_modules(self, _m_get_courses):
+        courses = sorted(courses_fixture)
+        self.assertEqual(get_default_modules(courses, None), courses)
+        self.assertEqual(
+            get_default_modules(courses, ["_3_1", "_1_1"]),
+            [("A-MODULE", "_1_1"), ("C-MODULE", "_3_1")],
+        )
+
+    @patch(
+        "ntu_learn_downloader_gui.crawler.get_download_dir", side_effect=mock_get_download_dir
+    )
+    def test_download_dialog_takes_over_the_crawl(self, m_get_download_dir, _m_get_courses):
+        prefetcher = Prefetcher(self.session, DOWNLOAD_DIR, ["_3_1", "_1_1"])
+        prefetcher.start()
+
+        self.assertEqual(prefetcher.courses.result(5), sorted(courses_fixture))
+        modules = [("A-MODULE", "_1_1"), ("C-MODULE", "_3_1")]
+        engine = prefetcher.take_engine()
+        self.assertIsInstance(engine, SyncEngine)
+        self.assertTrue(prefetcher.matches(DOWNLOAD_DIR, modules))
+        self.assertFalse(prefetcher.matches(DOWNLOAD_DIR, modules[:1]))
+        self.assertFalse(prefetcher.matches(DOWNLOAD_DIR + "2", modules))
+
+        # courses crawled before attaching are replayed
+        reported = []
+        result = prefetcher.attach(lambda idx, course: reported.append((idx, course["name"])))
+        self.assertEqual([course["name"] for course in result], ["A-MODULE", "C-MODULE"])
+        self.assertEqual(sorted(reported), [(0, "A-MODULE"), (1, "C-MODULE")])
+        self.assertEqual(m_get_download_dir.call_count, 2)
+
+        # the engine is owned by the dialog now
+        self.assertIsNone(prefetcher.take_engine())
+        with patch.object(SyncEngine, "close") as m_close:
+            prefetcher.cancel()
+        m_close.assert_not_called()
+        engine.close()
+
+    @patch("ntu_learn_downloader_gui.crawler.get_download_dir")
+    def test_cancel_stops_the_crawl_and_closes_the_engine(
+        self, m_get_download_dir, _m_get_courses
+    ):
+        started = threading.Event()
+        closed = threading.Event()
+
+        def wait_until_cancelled(*args, cancelled=None):
+            started.set()
+            cancelled.wait(5)
+            raise CrawlCancelled()
+
+        m_get_download_dir.side_effect = wait_until_cancelled
+        prefetcher = Prefetcher(self.session, DOWNLOAD_DIR, None)
+        with patch.object(
+            SyncEngine, "close", autospec=True, side_effect=lambda *args, **kwargs: closed.set()
+        ) as m_close:
+            prefetcher.start()
+            self.assertTrue(started.wait(5))
+            prefetcher.cancel()
+            with self.assertRaises(CrawlCancelled):
+                prefetcher.attach()
+            self.assertTrue(closed.wait(5))
+        self.assertEqual(m_close.call_args[1], {"save": False})
+        self.assertIsNone(prefetcher.take_engine())
+        self.assertFalse(prefetcher.matches(DOWNLOAD_DIR, sorted(courses_fixture)))
+
+    @patch("ntu_learn_downloader_gui.crawler.get_download_dir")
+    def test_nothing_is_crawled_without_a_default_dir(self, m_get_download_dir, _m_get_courses):
+        prefetcher = Prefetcher(self.session, None, ["_1_1"])
+        prefetcher.start()
+
+        self.assertEqual(prefetcher.courses.result(5), sorted(courses_fixture))
+        self.assertIsNone(prefetcher.take_engine())
+        self.assertIsNone(prefetcher.modules)
+        self.assertFalse(prefetcher.matches("", [("A-MODULE", "_1_1")]))
+        m_get_download_dir.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
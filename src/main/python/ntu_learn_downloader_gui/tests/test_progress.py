@@ -0,0 +1,122 @@
+import unittest
+
+from ntu_learn_downloader_gui.progress import (
+    ByteProgress,
+    ProgressAggregator,
+    TransferSnapshot,
+    format_duration,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressAggregator(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.snapshots = []
+        self.aggregator = ProgressAggregator(self.snapshots.append, 0.1, self.clock)
+
+    def test_updates_are_coalesced(self):
+        self.aggregator.update("a", "a.mp4", 0, 1024 * 1000)
+        for chunk in range(1, 1001):
+            self.aggregator.update("a", "a.mp4", chunk * 1024, 1024 * 1000)
+        self.assertEqual(self.snapshots, [])
+
+        self.clock.now = 0.5
+        self.aggregator.update("a", "a.mp4", 2000 * 1024, 2000 * 1024)
+        self.assertEqual(len(self.snapshots), 1)
+        (transfer,) = self.snapshots[0].transfers
+        self.assertEqual(transfer.bytes_done, 2000 * 1024)
+        self.assertAlmostEqual(transfer.rate, 2000 * 1024 / 0.5)
+        self.assertAlmostEqual(self.snapshots[0].rate, 2000 * 1024 / 0.5)
+
+    def test_events_are_delivered_once_and_in_order(self):
+        self.aggregator.update("a", "a.pdf", 0)
+        self.aggregator.update("a", "a.pdf", 10)
+        self.aggregator.event("a done", key="a")
+        self.aggregator.event("b skipped", key="b")
+        self.assertEqual(self.snapshots, [])
+
+        self.aggregator.flush()
+        self.assertEqual(len(self.snapshots), 1)
+        self.assertEqual(self.snapshots[0].events, ["a done", "b skipped"])
+        self.assertEqual(self.snapshots[0].transfers, [])
+        self.assertEqual(self.snapshots[0].total_bytes, 10)
+
+        # nothing new to report
+        self.aggregator.flush()
+        self.assertEqual(len(self.snapshots), 1)
+
+    def test_aggregate_throughput(self):
+        self.aggregator.update("a", "a.mp4", 0)
+        self.aggregator.update("b", "b.mp4", 0)
+        self.aggregator.update("a", "a.mp4", 200)
+        self.aggregator.update("b", "b.mp4", 100)
+        self.aggregator.update("a", "a.mp4", 300)
+        self.clock.now = 1.0
+        self.aggregator.flush()
+
+        snapshot = self.snapshots[-1]
+        self.assertEqual(snapshot.total_bytes, 400)
+        rates = {t.key: t.rate for t in snapshot.transfers}
+        self.assertEqual(rates, {"a": 300, "b": 100})
+        self.assertEqual(snapshot.rate, 400)
+
+        # a forced publish right after the last one keeps the previous throughput
+        self.clock.now = 1.01
+        self.aggregator.event("a done", key="a")
+        self.aggregator.flush()
+        self.assertEqual(self.snapshots[-1].rate, 400)
+        self.assertEqual([t.rate for t in self.snapshots[-1].transfers], [100])
+
+    def test_resumed_bytes_are_not_throughput(self):
+        # a transfer resumed at 900 bytes
+        self.aggregator.update("a", "a.mp4", 900, 1000)
+        self.clock.now = 0.1
+        self.aggregator.update("a", "a.mp4", 950, 1000)
+
+        (snapshot,) = self.snapshots
+        self.assertEqual(snapshot.total_bytes, 50)
+        self.assertAlmostEqual(snapshot.rate, 500)
+        (transfer,) = snapshot.transfers
+        self.assertEqual(transfer.bytes_done, 950)
+        self.assertAlmostEqual(transfer.rate, 500)
+
+
+class TestByteProgress(unittest.TestCase):
+    def test_progress_is_weighted_by_bytes(self):
+        progress = ByteProgress(range(4))
+        # nothing known yet, falls back to the number of transfers
+        self.assertIsNone(progress.total)
+        progress.finish(0, completed=False)
+        self.assertEqual(progress.fraction, 0.25)
+
+        progress.set_size(1, 100)
+        progress.set_size(2, 900)
+        # 3 is of unknown size and counts as the average
+        self.assertEqual(progress.total, 1500)
+        progress.update([TransferSnapshot(1, "a.pdf", 50, None, 0.0)])
+        progress.finish(2, completed=True)
+        self.assertEqual(progress.bytes_done, 950)
+        self.assertEqual(progress.total, 900 + 100 + 100)
+        self.assertAlmostEqual(progress.fraction, 950 / 1100)
+
+        # the size reported by the transfer replaces the probed size
+        progress.update([TransferSnapshot(3, "lecture.mp4", 100, 1100, 0.0)])
+        self.assertEqual(progress.total, 2100)
+        progress.finish(1, completed=False)
+        self.assertEqual(progress.total, 2000)
+        self.assertEqual(progress.eta(100.0), 10.0)
+        # smoothed towards the new estimate
+        self.assertAlmostEqual(progress.eta(1000.0), 0.3 * 1 + 0.7 * 10)
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(42), "42 s")
+        self.assertEqual(format_duration(12 * 60), "12 min")
+        self.assertEqual(format_duration(65 * 60), "1 h 5 min")
@@ -0,0 +1,47 @@
+import importlib.util
+import os
+import shutil
+import unittest
+
+from fbs_runtime.application_context.PyQt5 import ApplicationContext
+from PyQt5 import QtWidgets, uic
+
+from ntu_learn_downloader_gui.gui.resources import LAYOUTS_DIR, compile_layouts, get_icon
+
+COMPILED_DIR = os.path.join(os.path.dirname(__file__), "temp_compiled")
+
+appctxt = ApplicationContext()
+
+
+def widget_names(widget: QtWidgets.QWidget):
+    return sorted(child.objectName() for child in widget.findChildren(QtWidgets.QWidget))
+
+
+class TestResources(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree(COMPILED_DIR, ignore_errors=True)
+
+    def test_compiled_layouts_match_ui_files(self):
+        layouts = [name[: -len(".ui")] for name in os.listdir(LAYOUTS_DIR) if name.endswith(".ui")]
+        self.assertEqual(compile_layouts(output_dir=COMPILED_DIR), len(layouts))
+
+        for layout in layouts:
+            spec = importlib.util.spec_from_file_location(
+                layout, os.path.join(COMPILED_DIR, layout + "_ui.py")
+            )
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            ui_class = next(value for name, value in vars(module).items() if name.startswith("Ui_"))
+            widget_class = QtWidgets.QMainWindow if layout == "chooseDir" else QtWidgets.QDialog
+
+            compiled, runtime = widget_class(), widget_class()
+            ui_class().setupUi(compiled)
+            uic.loadUi(os.path.join(LAYOUTS_DIR, layout + ".ui"), runtime)
+            self.assertEqual(widget_names(compiled), widget_names(runtime), layout)
+
+    def test_icons_are_loaded_once(self):
+        self.assertIs(get_icon(appctxt, "images/folder.png"), get_icon(appctxt, "images/folder.png"))
+
+
+if __name__ == "__main__":
+    unittest.main()
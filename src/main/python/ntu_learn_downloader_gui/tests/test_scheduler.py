@@ -0,0 +1,439 @@
+import os
+import shutil
+import sqlite3
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from ntu_learn_downloader_gui.scheduler import (
+    DOCUMENTS,
+    DOWNLOADED,
+    FAILED,
+    ORDER_NEWEST,
+    ORDER_SMALLEST,
+    RETRY_MAX_DELAY,
+    RETRYING,
+    SIZED,
+    SKIPPED,
+    VIDEOS,
+    DownloadScheduler,
+    get_connection_count,
+    get_retry_delay,
+    is_retryable,
+    split_lanes,
+)
+from ntu_learn_downloader_gui.link_cache import FILE_LINK_TTL, LinkCache
+from ntu_learn_downloader_gui.session import SessionManager
+
+DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_scheduler")
+session = SessionManager("PLACEHOLDER")
+
+
+def file_node(name, download_link=None, filename=None):
+    return {
+        "type": "file",
+        "name": name,
+        "predownload_link": "predownload/" + name,
+        "download_link": download_link,
+        "filename": filename,
+    }
+
+
+def lecture_node(name):
+    return {
+        "type": "recorded_lecture",
+        "name": name,
+        "predownload_link": "predownload/" + name,
+        "download_link": "https://x/{}.mp4".format(name),
+        "filename": name + ".mp4",
+    }
+
+
+def mock_get_file_download_link(session, predownload_link):
+    if predownload_link.endswith("broken"):
+        raise ValueError("Failed to get download link")
+    return "https://ntulearn.ntu.edu.sg/dl/" + predownload_link.rsplit("/", 1)[1]
+
+
+class TestDownloadScheduler(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        os.makedirs(DOWNLOAD_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    @patch(
+        "ntu_learn_downloader_gui.scheduler.get_file_download_link",
+        side_effect=mock_get_file_download_link,
+    )
+    def test_counts_and_data_deltas(self, _m_get_file_download_link):
+        Path(os.path.join(DOWNLOAD_DIR, "existing.pdf")).touch()
+        items = [
+            (DOWNLOAD_DIR, file_node("a.pdf")),
+            (DOWNLOAD_DIR, file_node("broken")),
+            (DOWNLOAD_DIR, file_node("existing", "https://x/existing.pdf", "existing.pdf")),
+            (DOWNLOAD_DIR, file_node("b.pdf", "https://x/b.pdf", "b.pdf")),
+            (DOWNLOAD_DIR, file_node("b copy", "https://x/b.pdf", "b.pdf")),
+        ]
+        barrier = threading.Barrier(2, timeout=5)
+
+        def mock_download(session, url, destination, callback=None):
+            # a.pdf and b.pdf must be in flight at the same time
+            barrier.wait()
+            callback(1, 1)
+            Path(destination).touch()
+            return True
+
+        statuses = []
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download):
+            numDownloaded, numSkipped, numFailed, data_deltas = DownloadScheduler(
+                session, max_workers=2
+            ).run(items, lambda progress: statuses.append(progress[2]))
+
+        self.assertEqual((numDownloaded, numSkipped, numFailed), (2, 2, 1))
+        self.assertEqual(statuses.count(DOWNLOADED), 2)
+        self.assertEqual(statuses.count(SKIPPED), 2)
+        self.assertEqual(statuses.count(FAILED), 1)
+        self.assertEqual(
+            data_deltas,
+            [("https://ntulearn.ntu.edu.sg/dl/a.pdf", "a.pdf"), None, None, None, None],
+        )
+
+    def test_file_that_appeared_after_indexing_is_skipped(self):
+        items = [(DOWNLOAD_DIR, file_node("a.pdf", "https://x/a.pdf", "a.pdf"))]
+        statuses = []
+        scheduler = DownloadScheduler(session)
+        # indexed before a.pdf appears, then download finds the destination taken
+        scheduler.fs_index.exists(DOWNLOAD_DIR, "a.pdf")
+        Path(os.path.join(DOWNLOAD_DIR, "a.pdf")).touch()
+        with patch("ntu_learn_downloader_gui.scheduler.download", return_value=False):
+            result = scheduler.run(items, lambda progress: statuses.append(progress[2]))
+
+        self.assertEqual(result[:3], (0, 1, 0))
+        self.assertEqual(statuses, [SKIPPED])
+
+    @patch("ntu_learn_downloader_gui.scheduler.get_file_download_link")
+    def test_links_are_resolved_while_transfers_run(self, m_get_file_download_link):
+        last_link_resolved = threading.Event()
+
+        def get_file_download_link(session, predownload_link):
+            if predownload_link.endswith("c.pdf"):
+                last_link_resolved.set()
+            return mock_get_file_download_link(session, predownload_link)
+
+        transfer_overlapped = []
+
+        def mock_download(session, url, destination, callback=None):
+            if url.endswith("a.pdf"):
+                # with a single transfer thread, c.pdf can only be resolved meanwhile if
+                # resolution is its own stage
+                transfer_overlapped.append(last_link_resolved.wait(timeout=5))
+            Path(destination).touch()
+            return True
+
+        m_get_file_download_link.side_effect = get_file_download_link
+        items = [(DOWNLOAD_DIR, file_node(name)) for name in ["a.pdf", "b.pdf", "c.pdf"]]
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download):
+            result = DownloadScheduler(session, max_workers=1, resolve_workers=1).run(items)
+
+        self.assertEqual(transfer_overlapped, [True])
+        self.assertEqual(result[:3], (3, 0, 0))
+
+    @patch(
+        "ntu_learn_downloader_gui.scheduler.get_file_download_link",
+        side_effect=mock_get_file_download_link,
+    )
+    def test_stale_cached_link_is_resolved_again(self, m_get_file_download_link):
+        link_cache = LinkCache(os.path.join(DOWNLOAD_DIR, "link_cache.jsonl"))
+        link_cache.put("predownload/a.pdf", "https://x/expired/a.pdf", "a.pdf", FILE_LINK_TTL)
+        items = [(DOWNLOAD_DIR, file_node("a.pdf")), (DOWNLOAD_DIR, file_node("b.pdf"))]
+
+        def mock_download(session, url, destination, callback=None):
+            if "expired" in url:
+                raise requests.HTTPError(response=MagicMock(status_code=403))
+            Path(destination).touch()
+            return True
+
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download):
+            result = DownloadScheduler(session, max_workers=1, link_cache=link_cache).run(items)
+
+        self.assertEqual(result[:3], (2, 0, 0))
+        self.assertEqual(m_get_file_download_link.call_count, 2)
+        renewed = ("https://ntulearn.ntu.edu.sg/dl/a.pdf", "a.pdf")
+        self.assertEqual(result[3], [renewed, ("https://ntulearn.ntu.edu.sg/dl/b.pdf", "b.pdf")])
+        link_cache.close()
+        # both resolutions were written through to the cache
+        link_cache = LinkCache(os.path.join(DOWNLOAD_DIR, "link_cache.jsonl"))
+        self.assertEqual(link_cache.get("predownload/a.pdf"), renewed)
+        self.assertIsNotNone(link_cache.get("predownload/b.pdf"))
+        link_cache.close()
+
+    @patch(
+        "ntu_learn_downloader_gui.scheduler.get_file_download_link",
+        side_effect=mock_get_file_download_link,
+    )
+    def test_failing_link_callback_does_not_block_the_lane(self, _m_get_file_download_link):
+        link_cache = LinkCache(os.path.join(DOWNLOAD_DIR, "link_cache.jsonl"))
+        link_cache.put("predownload/a.pdf", "https://x/expired/a.pdf", "a.pdf", FILE_LINK_TTL)
+        # a.pdf is renewed by its transfer, b.pdf is resolved by a resolver
+        items = [(DOWNLOAD_DIR, file_node("a.pdf")), (DOWNLOAD_DIR, file_node("b.pdf"))]
+        saved = []
+
+        def link_callback(idx, delta):
+            saved.append(idx)
+            raise sqlite3.OperationalError("database is locked")
+
+        def mock_download(session, url, destination, callback=None):
+            if "expired" in url:
+                raise requests.HTTPError(response=MagicMock(status_code=403))
+            Path(destination).touch()
+            return True
+
+        results = []
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download):
+            scheduler = DownloadScheduler(session, max_workers=1, link_cache=link_cache)
+            thread = threading.Thread(
+                target=lambda: results.append(scheduler.run(items, link_callback=link_callback)),
+                daemon=True,
+            )
+            thread.start()
+            thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        (result,) = results
+        self.assertEqual(result[:3], (2, 0, 0))
+        # a.pdf both with its cached link and the renewed one
+        self.assertEqual(sorted(saved), [0, 0, 1])
+        # the links are still returned to be saved with the results
+        self.assertEqual(
+            result[3],
+            [
+                ("https://ntulearn.ntu.edu.sg/dl/a.pdf", "a.pdf"),
+                ("https://ntulearn.ntu.edu.sg/dl/b.pdf", "b.pdf"),
+            ],
+        )
+        link_cache.close()
+
+    def test_documents_are_not_held_up_by_videos(self):
+        items = [(DOWNLOAD_DIR, lecture_node("lecture {}".format(i))) for i in range(2)] + [
+            (DOWNLOAD_DIR, file_node(name, "https://x/" + name, name))
+            for name in ["a.pdf", "b.pdf", "c.pdf"]
+        ]
+        documents_done = threading.Event()
+        finished = []
+
+        def mock_download(session, url, destination, callback=None):
+            if url.endswith(".mp4"):
+                # both videos are in flight until every document has been downloaded
+                self.assertTrue(documents_done.wait(timeout=5))
+            Path(destination).touch()
+            finished.append(os.path.basename(destination))
+            if {"a.pdf", "b.pdf", "c.pdf"} <= set(finished):
+                documents_done.set()
+            return True
+
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download):
+            result = DownloadScheduler(session, max_workers=1, video_workers=1).run(items)
+
+        self.assertEqual(result[:3], (5, 0, 0))
+        self.assertEqual(finished[:3], ["a.pdf", "b.pdf", "c.pdf"])
+
+    def test_split_lanes(self):
+        items = [
+            (DOWNLOAD_DIR, file_node("a.pdf")),
+            (DOWNLOAD_DIR, lecture_node("lecture 1")),
+            (DOWNLOAD_DIR, file_node("demo", "https://x/demo.MP4", "demo.MP4")),
+            (DOWNLOAD_DIR, file_node("b.pdf")),
+            (DOWNLOAD_DIR, lecture_node("lecture 2")),
+        ]
+        self.assertEqual(split_lanes(items), {DOCUMENTS: [0, 3], VIDEOS: [1, 2, 4]})
+        self.assertEqual(
+            split_lanes(items, ORDER_NEWEST), {DOCUMENTS: [3, 0], VIDEOS: [4, 2, 1]}
+        )
+        sizes = {"a.pdf": 300, "b.pdf": 100, "lecture 2": 10 ** 9}
+        self.assertEqual(
+            split_lanes(items, ORDER_SMALLEST, lambda node_data: sizes.get(node_data["name"])),
+            {DOCUMENTS: [3, 0], VIDEOS: [4, 1, 2]},
+        )
+        with self.assertRaises(ValueError):
+            DownloadScheduler(session, order="largest")
+
+    def test_smallest_first_by_cached_sizes(self):
+        link_cache = LinkCache(os.path.join(DOWNLOAD_DIR, "link_cache.jsonl"))
+        names = ["a.pdf", "b.pdf", "c.pdf", "d.pdf"]
+        for name, size in zip(names, [300, None, 100, 200]):
+            link_cache.put("predownload/" + name, "https://x/" + name, name, FILE_LINK_TTL)
+            if size is not None:
+                link_cache.set_size("predownload/" + name, "https://x/" + name, size)
+        items = [(DOWNLOAD_DIR, file_node(name)) for name in names]
+        started = []
+
+        def mock_download(session, url, destination, callback=None):
+            started.append(os.path.basename(destination))
+            return True
+
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download):
+            DownloadScheduler(
+                session,
+                max_workers=1,
+                resolve_workers=1,
+                link_cache=link_cache,
+                order=ORDER_SMALLEST,
+            ).run(items)
+
+        # b.pdf was never sized
+        self.assertEqual(started, ["c.pdf", "d.pdf", "a.pdf", "b.pdf"])
+        link_cache.close()
+
+    @patch("ntu_learn_downloader_gui.scheduler.DEFAULT_SEGMENTS", 4)
+    def test_connection_count_includes_segments_of_both_lanes(self):
+        # 4 connections per transfer, 4 resolvers and 2 + 1 size probes
+        self.assertEqual(get_connection_count(2, 1, 4), (2 + 1) * 4 + 4 + 2 + 1)
+
+    @patch(
+        "ntu_learn_downloader_gui.scheduler.get_file_download_link",
+        side_effect=mock_get_file_download_link,
+    )
+    @patch("ntu_learn_downloader_gui.scheduler.get_content_length", return_value=4096)
+    def test_sizes_are_probed_once_per_link(self, m_get_content_length, m_get_file_download_link):
+        link_cache = LinkCache(os.path.join(DOWNLOAD_DIR, "link_cache.jsonl"))
+        items = [(DOWNLOAD_DIR, file_node(name)) for name in ["a.pdf", "b.pdf", "c.pdf"]]
+
+        def run():
+            sizes = {}
+
+            def callback(progress):
+                idx, _filename, status, _bytes, total, _trace = progress
+                if status == SIZED:
+                    sizes[idx] = total
+
+            with patch(
+                "ntu_learn_downloader_gui.scheduler.download",
+                return_value=True,
+            ):
+                scheduler = DownloadScheduler(
+                    session, max_workers=1, link_cache=link_cache, probe_sizes=True
+                )
+                scheduler.run(items, callback)
+            return sizes
+
+        self.assertEqual(run(), {0: 4096, 1: 4096, 2: 4096})
+        # probes and transfers share the resolution of a link
+        self.assertEqual(m_get_file_download_link.call_count, 3)
+        self.assertEqual(m_get_content_length.call_count, 3)
+
+        self.assertEqual(run(), {0: 4096, 1: 4096, 2: 4096})
+        self.assertEqual(m_get_file_download_link.call_count, 3)
+        self.assertEqual(m_get_content_length.call_count, 3)
+        link_cache.close()
+
+
+@patch("ntu_learn_downloader_gui.scheduler.RETRY_BASE_DELAY", 0.001)
+class TestRetries(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        os.makedirs(DOWNLOAD_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(requests.ConnectionError("reset")))
+        self.assertTrue(is_retryable(requests.ReadTimeout()))
+        self.assertTrue(is_retryable(requests.HTTPError(response=MagicMock(status_code=503))))
+        self.assertFalse(is_retryable(requests.HTTPError(response=MagicMock(status_code=404))))
+        self.assertFalse(is_retryable(ValueError("Failed to get download link")))
+
+    def test_retry_delay(self):
+        self.assertEqual(get_retry_delay(0, rand=lambda: 0), 0.0005)
+        self.assertEqual(get_retry_delay(3, rand=lambda: 1), 0.008)
+        with patch("ntu_learn_downloader_gui.scheduler.RETRY_BASE_DELAY", 1.0):
+            self.assertEqual(get_retry_delay(20, rand=lambda: 1), RETRY_MAX_DELAY)
+
+    @patch("ntu_learn_downloader_gui.scheduler.get_file_download_link")
+    def test_transient_failures_are_retried(self, m_get_file_download_link):
+        # the link of b.pdf times out once, a.pdf is cut off twice by a server error
+        timeouts = {"predownload/b.pdf": 1}
+
+        def mock_get_file_download_link(session, predownload_link):
+            if timeouts.get(predownload_link):
+                timeouts[predownload_link] -= 1
+                raise requests.ConnectTimeout()
+            return "https://x/" + predownload_link.rsplit("/", 1)[1]
+
+        m_get_file_download_link.side_effect = mock_get_file_download_link
+        items = [(DOWNLOAD_DIR, file_node("a.pdf")), (DOWNLOAD_DIR, file_node("b.pdf"))]
+        failures = {"https://x/a.pdf": 2}
+
+        def mock_download(session, url, destination, callback=None):
+            if failures.get(url):
+                failures[url] -= 1
+                raise requests.HTTPError(response=MagicMock(status_code=502))
+            Path(destination).touch()
+            return True
+
+        progress = []
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download):
+            result = DownloadScheduler(session, max_workers=1).run(items, progress.append)
+
+        self.assertEqual(result[:3], (2, 0, 0))
+        self.assertEqual([(idx, status) for idx, _, status, *_ in progress].count((0, RETRYING)), 2)
+        self.assertEqual([(idx, status) for idx, _, status, *_ in progress].count((1, RETRYING)), 1)
+        self.assertTrue(all(trace for _, _, status, _, _, trace in progress if status == RETRYING))
+        self.assertEqual(result[3], [("https://x/a.pdf", "a.pdf"), ("https://x/b.pdf", "b.pdf")])
+        # transfer retries reuse the resolved link
+        self.assertEqual(m_get_file_download_link.call_count, 3)
+
+    @patch("ntu_learn_downloader_gui.scheduler.get_content_length", return_value=1024)
+    @patch("ntu_learn_downloader_gui.scheduler.get_file_download_link")
+    def test_failed_lookups_are_shared_with_probes(self, m_get_file_download_link, _m):
+        # a.pdf times out once, b.pdf has no download link at all
+        timeouts = {"predownload/a.pdf": 1}
+
+        def mock_get_file_download_link(session, predownload_link):
+            if predownload_link == "predownload/b.pdf":
+                raise ValueError("Failed to get download link")
+            if timeouts.get(predownload_link):
+                timeouts[predownload_link] -= 1
+                raise requests.ConnectTimeout()
+            return "https://x/a.pdf"
+
+        m_get_file_download_link.side_effect = mock_get_file_download_link
+        items = [(DOWNLOAD_DIR, file_node("a.pdf")), (DOWNLOAD_DIR, file_node("b.pdf"))]
+        with patch(
+            "ntu_learn_downloader_gui.scheduler.download",
+            return_value=True,
+        ):
+            result = DownloadScheduler(session, probe_sizes=True).run(items)
+
+        self.assertEqual(result[:3], (1, 0, 1))
+        links = [call[0][1] for call in m_get_file_download_link.call_args_list]
+        # only the retry of a.pdf looks its link up again
+        self.assertEqual(links.count("predownload/a.pdf"), 2)
+        self.assertEqual(links.count("predownload/b.pdf"), 1)
+
+    def test_retries_run_out(self):
+        items = [
+            (DOWNLOAD_DIR, file_node(name, "https://x/" + name, name))
+            for name in ["a.pdf", "b.pdf", "c.pdf"]
+        ]
+        attempts = []
+
+        def mock_download(session, url, destination, callback=None):
+            attempts.append(url)
+            raise requests.ConnectionError("connection reset")
+
+        statuses = []
+        with patch("ntu_learn_downloader_gui.scheduler.download", side_effect=mock_download):
+            scheduler = DownloadScheduler(session, max_workers=2, max_retries=2, retry_budget=5)
+            result = scheduler.run(items, lambda data: statuses.append(data[2]))
+
+        self.assertEqual(result[:3], (0, 0, 3))
+        # 2 retries for two of the items, the budget leaves 1 for the third
+        self.assertEqual(len(attempts), 3 + 5)
+        self.assertEqual(statuses.count(RETRYING), 5)
+        self.assertEqual(statuses.count(FAILED), 3)
@@ -0,0 +1,42 @@
+import unittest
+from unittest.mock import patch
+
+from ntu_learn_downloader_gui.session import REQUEST_TIMEOUT, SessionManager
+
+ACUSTUDIO_URL = "https://acustudio.ntu.edu.sg/content/user/module/media/1.mp4"
+NTULEARN_FILE_URL = "https://ntulearn.ntu.edu.sg/bbcswebdav/pid-1-dt-content-rid-1_1/xid-1_1"
+
+
+class TestSessionManager(unittest.TestCase):
+    def test_separate_pools_for_ntulearn_and_media_hosts(self):
+        session = SessionManager("PLACEHOLDER", pool_size=6)
+        ntulearn_adapter = session.session.get_adapter(NTULEARN_FILE_URL)
+        media_adapter = session.session.get_adapter(ACUSTUDIO_URL)
+
+        self.assertIsNot(ntulearn_adapter, media_adapter)
+        self.assertEqual(ntulearn_adapter._pool_maxsize, 6)
+        self.assertEqual(media_adapter._pool_maxsize, 6)
+
+    def test_set_pool_size(self):
+        session = SessionManager("PLACEHOLDER", pool_size=2)
+        adapter = session.session.get_adapter(NTULEARN_FILE_URL)
+
+        session.set_pool_size(2)
+        self.assertIs(session.session.get_adapter(NTULEARN_FILE_URL), adapter)
+
+        session.set_pool_size(10)
+        self.assertEqual(session.session.get_adapter(NTULEARN_FILE_URL)._pool_maxsize, 10)
+        self.assertEqual(session.session.get_adapter(ACUSTUDIO_URL)._pool_maxsize, 10)
+
+    def test_requests_time_out_by_default(self):
+        session = SessionManager("PLACEHOLDER")
+        with patch.object(session.session, "get") as m_get, patch.object(
+            session.session, "head"
+        ) as m_head:
+            session.get(NTULEARN_FILE_URL, stream=True)
+            session.head(NTULEARN_FILE_URL)
+            session.get(NTULEARN_FILE_URL, timeout=1)
+
+        self.assertEqual(m_get.call_args_list[0][1]["timeout"], REQUEST_TIMEOUT)
+        self.assertEqual(m_head.call_args[1]["timeout"], REQUEST_TIMEOUT)
+        self.assertEqual(m_get.call_args_list[1][1]["timeout"], 1)
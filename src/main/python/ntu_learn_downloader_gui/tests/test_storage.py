@@ -0,0 +1,141 @@
+import copy
+import json
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from ntu_learn_downloader_gui.storage import (
+    PATH_SEPARATOR,
+    SEGMENT_SEPARATOR,
+    JSONStorage,
+    SQLiteStorage,
+)
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_storage")
+STORAGE_DIR = os.path.join(DOWNLOAD_DIR, ".ntu_learn_downloader")
+
+saved_download_dir = json.load(open(os.path.join(FIXTURES_PATH, "CE3007_saved_subset.json")))
+get_download_dir_fixture_2 = json.load(
+    open(os.path.join(FIXTURES_PATH, "CE3007_predownload_subset_2.json"))
+)
+
+
+def without_mappings(node):
+    node = {k: v for k, v in node.items() if k != "mapping"}
+    if node["type"] == "folder":
+        node["children"] = [without_mappings(c) for c in node["children"]]
+    return node
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        Path(STORAGE_DIR).mkdir(parents=True)
+        shutil.copyfile(
+            os.path.join(FIXTURES_PATH, "CE3007_saved_subset.json"),
+            os.path.join(STORAGE_DIR, "download_dir.json"),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+
+    def test_json_store_is_migrated(self):
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        self.assertEqual(storage.download_dir, [without_mappings(n) for n in saved_download_dir])
+        storage.close()
+
+    def test_merge_matches_json_storage(self):
+        expected = [copy.deepcopy(get_download_dir_fixture_2)]
+        JSONStorage(DOWNLOAD_DIR).merge_download_dir(expected)
+
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        merged = [copy.deepcopy(get_download_dir_fixture_2)]
+        storage.merge_download_dir(merged)
+        self.assertEqual(merged, expected)
+        storage.close()
+
+    def test_updates_are_persisted_per_node(self):
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        course = copy.deepcopy(get_download_dir_fixture_2)
+        storage.merge_download_dir([course])
+        lab = course["children"][0]["children"][0]["children"][0]["children"][0]
+        lab["download_link"], lab["filename"] = "https://x/testIp_16bit.wav", "testIp_16bit.wav"
+        storage.update_nodes([lab])
+        storage.close()
+
+        # no save_download_dir, e.g. the app was killed
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        reloaded = copy.deepcopy(get_download_dir_fixture_2)
+        storage.merge_download_dir([reloaded])
+        reloaded_lab = reloaded["children"][0]["children"][0]["children"][0]["children"][0]
+        self.assertEqual(reloaded_lab, lab)
+
+        storage.save_download_dir([])
+        self.assertEqual(storage.download_dir, [])
+        storage.close()
+
+    def test_siblings_with_the_same_name_keep_their_rows(self):
+        def node(node_type, name):
+            if node_type == "folder":
+                return {"type": "folder", "name": name, "children": [node("file", "a.pdf")]}
+            return {
+                "type": node_type,
+                "name": name,
+                "predownload_link": "/{}/{}".format(node_type, name),
+                "download_link": None,
+                "filename": None,
+            }
+
+        course = {
+            "type": "folder",
+            "name": "CE3007",
+            "children": [
+                node("file", "Notes"),
+                node("file", "Notes"),
+                node("folder", "Notes"),
+                node("recorded_lecture", "Notes"),
+            ],
+        }
+        course["children"][1]["predownload_link"] += "/2"
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        storage.save_download_dir([course])
+        second = course["children"][1]
+        second["download_link"], second["filename"] = "https://x/notes2.pdf", "notes2.pdf"
+        storage.update_nodes([second])
+        storage.close()
+
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        self.assertEqual(storage.download_dir, [course])
+        storage.close()
+
+    def test_old_paths_are_migrated(self):
+        def old(path):
+            """path written before the node type and occurrence were part of it"""
+            if not path:
+                return path
+            return PATH_SEPARATOR.join(
+                segment.split(SEGMENT_SEPARATOR)[1] for segment in path.split(PATH_SEPARATOR)
+            )
+
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        course = copy.deepcopy(saved_download_dir[0])
+        with storage.transaction() as conn:
+            rows = conn.execute("SELECT course, path, parent FROM nodes").fetchall()
+            for course_name, path, parent in rows:
+                conn.execute(
+                    "UPDATE nodes SET path = ?, parent = ? WHERE course = ? AND path = ?",
+                    (old(path), old(parent), course_name, path),
+                )
+            conn.execute("DELETE FROM meta WHERE key = 'path_format'")
+        storage.close()
+
+        storage = SQLiteStorage(DOWNLOAD_DIR)
+        self.assertEqual(storage.download_dir, [without_mappings(course)])
+        merged = [copy.deepcopy(get_download_dir_fixture_2)]
+        storage.merge_download_dir(merged)
+        expected = [copy.deepcopy(get_download_dir_fixture_2)]
+        JSONStorage(DOWNLOAD_DIR).merge_download_dir(expected)
+        self.assertEqual(merged, expected)
+        storage.close()
@@ -0,0 +1,125 @@
+"""
+Background file writer for downloads. Network reads fill reusable buffers which are handed to a
+writer thread, so reading from the socket and writing to disk overlap instead of alternating.
+"""
+import os
+import queue
+import threading
+from typing import BinaryIO, Optional
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+# number of buffers in flight between the reading and the writing thread
+QUEUE_SIZE = 8
+# how often the committed offset of a preallocated file is persisted
+COMMIT_INTERVAL = 8 * 1024 * 1024
+
+
+def read_committed_offset(committed_path: str) -> Optional[int]:
+    """returns the offset stored in a committed file, None if there is no (valid) committed file"""
+    try:
+        with open(committed_path, "r") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def write_committed_offset(committed_path: str, offset: int):
+    tmp_path = committed_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(offset))
+    os.replace(tmp_path, committed_path)
+
+
+def preallocate(f: BinaryIO, size: int):
+    """reserve disk space for the whole file so that it is not fragmented while it grows. The file
+    size becomes size, callers need to keep track of how much of it has been written
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError:
+            # not supported by every file system, e.g. some network shares
+            pass
+    f.truncate(size)
+
+
+class FileWriter:
+    def __init__(self, f: BinaryIO, committed_path: Optional[str] = None):
+        """Writes buffers to f on a background thread. Buffers are recycled, get_buffer blocks once
+        QUEUE_SIZE buffers are waiting to be written which limits memory use to
+        QUEUE_SIZE * MAX_CHUNK_SIZE
+
+        Args:
+            f (BinaryIO): file opened for writing, positioned where the data should go
+            committed_path (Optional[str], optional): if given, the number of bytes written so far is
+                persisted to this file every COMMIT_INTERVAL bytes, needed when the file has been
+                preallocated and its size no longer says how much has been downloaded
+        """
+        self.f = f
+        self.committed_path = committed_path
+        self.start = f.tell()
+        self.written = 0
+        self.error: Optional[BaseException] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=QUEUE_SIZE)
+        self._free: "queue.Queue" = queue.Queue()
+        for _ in range(QUEUE_SIZE + 1):
+            self._free.put(bytearray(MAX_CHUNK_SIZE))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get_buffer(self) -> bytearray:
+        return self._free.get()
+
+    def release(self, buf: bytearray):
+        """return a buffer that has not been used"""
+        self._free.put(buf)
+
+    def write(self, buf: bytearray, length: int):
+        """queue the first length bytes of buf, buf must not be touched until it is handed out by
+        get_buffer again
+
+        Raises:
+            OSError: a previous write failed
+        """
+        if self.error is not None:
+            self._free.put(buf)
+            raise self.error
+        self._queue.put((buf, length))
+
+    def close(self):
+        """wait for all queued buffers to be written
+
+        Raises:
+            OSError: a write failed
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self.f.flush()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        last_commit = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            buf, length = item
+            if self.error is None:
+                try:
+                    self.f.write(memoryview(buf)[:length])
+                    self.written += length
+                    if (
+                        self.committed_path
+                        and self.written - last_commit >= COMMIT_INTERVAL
+                    ):
+                        self.f.flush()
+                        write_committed_offset(
+                            self.committed_path, self.start + self.written
+                        )
+                        last_commit = self.written
+                except OSError as e:
+                    self.error = e
+            self._free.put(buf)